@@ -0,0 +1,273 @@
+"""
+Per-artist columnar analytics.
+
+Compacts the `streams` table into daily plays and earnings per track,
+stored per artist as memory-mapped NumPy arrays:
+
+    <root>/<artist_id>/tracks.npy     int64   [n_tracks]          column -> track id
+    <root>/<artist_id>/plays.npy      int32   [days, n_tracks]
+    <root>/<artist_id>/earnings.npy   float64 [days, n_tracks]
+    <root>/<artist_id>/meta.json      {"start_day", "days", "batch"}
+
+Row i is UTC day `start_day + i` (days since 1970-01-01). A range query
+such as "last 90 days by track" is a slice of rows, with no SQL scan.
+Earnings are plays times the track's per-stream `price`.
+
+The compactor tails `streams` with `stream_partitions.StreamCursor`, so
+streams committed out of id order on Postgres are still counted once.
+Batches are numbered in `<root>/state.json`; each artist records the last
+batch it folded in.
+
+Run the compactor as a worker:  python analytics.py
+"""
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+from dotenv import load_dotenv
+from numpy.lib.format import open_memmap
+
+from charts import parse_timestamp
+from stream_partitions import StreamCursor
+
+logger = logging.getLogger(__name__)
+
+DAY_SECONDS = 86400
+# Arrays grow in whole blocks to avoid a copy per new day or track
+DAY_BLOCK = 64
+TRACK_BLOCK = 16
+MAX_QUERY_DAYS = 3660
+
+
+def _write_json(path, data):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+
+def _round_up(value, block):
+    return -(-value // block) * block
+
+
+class ArtistSeries:
+    """Daily per-track columns for one artist."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.meta_path = os.path.join(directory, 'meta.json')
+
+    def exists(self):
+        return os.path.exists(self.meta_path)
+
+    def _path(self, name):
+        return os.path.join(self.directory, f'{name}.npy')
+
+    def load(self, mode='r'):
+        """Return (meta, track_ids, plays, earnings); the 2-D arrays are memory maps."""
+        with open(self.meta_path) as f:
+            meta = json.load(f)
+        return (meta,) + self._open(mode)
+
+    def _open(self, mode):
+        track_ids = np.load(self._path('tracks'))
+        plays = np.load(self._path('plays'), mmap_mode=mode)
+        earnings = np.load(self._path('earnings'), mmap_mode=mode)
+        return track_ids, plays, earnings
+
+    def _save_tracks(self, track_ids):
+        tmp_path = self._path('tracks.tmp')
+        np.save(tmp_path, np.asarray(track_ids, dtype=np.int64))
+        os.replace(tmp_path, self._path('tracks'))
+
+    def _reshape(self, start_day, days, track_ids, old=None):
+        """Rewrite the arrays to cover `days` rows from `start_day`, copying `old` data across."""
+        capacity = _round_up(days, DAY_BLOCK)
+        columns = _round_up(max(len(track_ids), 1), TRACK_BLOCK)
+        os.makedirs(self.directory, exist_ok=True)
+        for index, (name, dtype) in enumerate((('plays', np.int32), ('earnings', np.float64))):
+            tmp_path = self._path(f'{name}.tmp')
+            array = open_memmap(tmp_path, mode='w+', dtype=dtype, shape=(capacity, columns))
+            if old is not None:
+                old_meta, old_tracks, old_plays, old_earnings = old
+                source = (old_plays, old_earnings)[index]
+                offset = old_meta['start_day'] - start_day
+                rows, cols = old_meta['days'], len(old_tracks)
+                array[offset:offset + rows, :cols] = source[:rows, :cols]
+            array.flush()
+            del array
+            os.replace(tmp_path, self._path(name))
+        self._save_tracks(track_ids)
+
+    def add(self, days, track_ids, plays, earnings, batch):
+        """
+        Add aggregated plays/earnings for (day, track_id) cells from
+        compaction batch `batch`. A batch the artist already has is skipped,
+        so a restart after a crash doesn't count it twice.
+        """
+        if self.exists():
+            meta, known, plays_map, earnings_map = self.load('r+')
+            if meta.get('batch', 0) >= batch:
+                return
+            start_day, end_day = meta['start_day'], meta['start_day'] + meta['days']
+        else:
+            meta, known, plays_map, earnings_map = None, np.array([], dtype=np.int64), None, None
+            start_day = end_day = int(days.min())
+
+        start_day, end_day = min(start_day, int(days.min())), max(end_day, int(days.max()) + 1)
+        missing = np.setdiff1d(np.unique(track_ids), known)
+        all_tracks = np.concatenate([known, missing])
+
+        if (meta is None or start_day < meta['start_day']
+                or end_day - start_day > plays_map.shape[0] or len(all_tracks) > plays_map.shape[1]):
+            old = (meta, known, plays_map, earnings_map) if meta is not None else None
+            self._reshape(start_day, end_day - start_day, all_tracks, old)
+            del old, plays_map, earnings_map
+            known, plays_map, earnings_map = self._open('r+')
+        elif missing.size:
+            # Spare columns are already allocated; only the column map changes
+            self._save_tracks(all_tracks)
+            known = all_tracks
+
+        order = np.argsort(known)
+        columns = order[np.searchsorted(known, track_ids, sorter=order)]
+        rows = days - start_day
+        np.add.at(plays_map, (rows, columns), plays)
+        np.add.at(earnings_map, (rows, columns), earnings)
+        plays_map.flush()
+        earnings_map.flush()
+        _write_json(self.meta_path, {
+            'start_day': start_day,
+            'days': end_day - start_day,
+            'batch': batch
+        })
+
+    def query(self, first_day, last_day):
+        """Rows for days [first_day, last_day]. Returns (track_ids, plays, earnings)."""
+        meta, track_ids, plays_map, earnings_map = self.load('r')
+        # The column map can be ahead of the arrays while the compactor is writing
+        track_ids = track_ids[:plays_map.shape[1]]
+        n_days = last_day - first_day + 1
+        plays = np.zeros((n_days, len(track_ids)), dtype=np.int64)
+        earnings = np.zeros((n_days, len(track_ids)), dtype=np.float64)
+        lo = max(first_day, meta['start_day'])
+        hi = min(last_day + 1, meta['start_day'] + meta['days'])
+        if lo < hi:
+            src = slice(lo - meta['start_day'], hi - meta['start_day'])
+            dst = slice(lo - first_day, hi - first_day)
+            plays[dst] = plays_map[src, :len(track_ids)]
+            earnings[dst] = earnings_map[src, :len(track_ids)]
+        return track_ids, plays, earnings
+
+
+class AnalyticsStore:
+    def __init__(self, root):
+        self.root = root
+        self.state_path = os.path.join(root, 'state.json')
+        os.makedirs(root, exist_ok=True)
+
+    def artist(self, artist_id):
+        return ArtistSeries(os.path.join(self.root, str(int(artist_id))))
+
+    def _state(self):
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path) as f:
+            return json.load(f)
+
+    def compact(self, db, batch_size=50000):
+        """Fold new streams into the per-artist arrays. Returns rows compacted."""
+        state = self._state()
+        stream = StreamCursor.from_state(state, db.stream_id_lag)
+        batch = state.get('batches', 0)
+        total = 0
+        while True:
+            rows = db.get_stream_facts_after(stream.start, batch_size)
+            new = stream.advance(rows)
+            if not new:
+                break
+            batch += 1
+            _, track_ids, artist_ids, prices, streamed_at = zip(*new)
+            track_ids = np.asarray(track_ids, dtype=np.int64)
+            artist_ids = np.asarray([a if a is not None else -1 for a in artist_ids], dtype=np.int64)
+            prices = np.asarray([p or 0.0 for p in prices], dtype=np.float64)
+            days = np.asarray([int(parse_timestamp(t) // DAY_SECONDS) for t in streamed_at], dtype=np.int64)
+
+            # One (artist, day, track) group per output cell
+            keys = np.stack([artist_ids, days, track_ids], axis=1)
+            groups, inverse = np.unique(keys, axis=0, return_inverse=True)
+            inverse = inverse.reshape(-1)
+            plays = np.bincount(inverse, minlength=len(groups))
+            earnings = np.bincount(inverse, weights=prices, minlength=len(groups))
+
+            for artist_id in np.unique(groups[:, 0]):
+                if artist_id < 0:
+                    continue
+                mask = groups[:, 0] == artist_id
+                self.artist(artist_id).add(
+                    groups[mask, 1], groups[mask, 2], plays[mask], earnings[mask], batch
+                )
+
+            _write_json(self.state_path, {**stream.state(), 'batches': batch})
+            total += len(new)
+            if len(rows) < batch_size:
+                break
+        return total
+
+    def daily(self, artist_id, days=90, end=None):
+        """
+        Daily plays and earnings per track for the `days` days ending at
+        `end` (a date, default today UTC). Returns None for unknown artists.
+        """
+        series = self.artist(artist_id)
+        if not series.exists():
+            return None
+        days = max(1, min(days, MAX_QUERY_DAYS))
+        end = end or datetime.now(timezone.utc).date()
+        last_day = (end - date(1970, 1, 1)).days
+        first_day = last_day - days + 1
+        track_ids, plays, earnings = series.query(first_day, last_day)
+        return {
+            'days': [(date(1970, 1, 1) + timedelta(days=d)).isoformat() for d in range(first_day, last_day + 1)],
+            'track_ids': track_ids,
+            'plays': plays,
+            'earnings': earnings
+        }
+
+    def run(self, db, poll_interval=60):
+        while True:
+            try:
+                rows = self.compact(db)
+                if rows:
+                    logger.info(f"Compacted {rows} streams into daily aggregates")
+            except Exception as e:
+                logger.error(f"Analytics compaction error: {str(e)}", exc_info=True)
+            time.sleep(poll_interval)
+
+
+def main():
+    load_dotenv()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    from models import Database
+
+    store = AnalyticsStore(os.getenv('ANALYTICS_DIR', 'analytics'))
+    store.run(
+        Database(os.getenv('DATABASE_URL', 'sqlite:///artist_platform.db')),
+        poll_interval=float(os.getenv('ANALYTICS_POLL_INTERVAL', '60'))
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -2,9 +2,20 @@ from flask import Flask, request, jsonify, render_template, redirect, url_for, f
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
 from flask_cors import CORS
 from models import Database
+from chain_indexer import ChainIndexStore
+from blockmusic_common.idempotency import IdempotencyStore, idempotent
+from subscription_state import SubscriptionState, SubscriptionLookupError
+from search import TrackSearch
+from charts import ChartsEngine, WINDOWS
+from analytics import AnalyticsStore
+from similar_tracks import SimilarTracks
+from blockmusic_common import request_metrics, sql_instrumentation
+from fingerprint import AudioDecodeError, FingerprintIndex, fingerprint_file
 from datetime import datetime, timedelta
 import jwt
 import os
+import re
+import tempfile
 from dotenv import load_dotenv
 from werkzeug.utils import secure_filename
 
@@ -17,6 +28,37 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
 CORS(app)
 db = Database(os.getenv('DATABASE_URL', 'sqlite:///artist_platform.db'))
+db.replicas.init_app(app)
+sql_instrumentation.instrument_flask(app)
+request_metrics.instrument_flask(app)
+track_search = TrackSearch(db)
+analytics = AnalyticsStore(os.getenv('ANALYTICS_DIR', 'analytics'))
+similar_tracks = SimilarTracks(os.getenv('SIMILAR_TRACKS_PATH', 'similar_tracks.npy'))
+fingerprints = FingerprintIndex(os.getenv('FINGERPRINT_DB', 'fingerprints.db'))
+chain_index = ChainIndexStore(os.getenv('CHAIN_INDEX_DB', 'chain_index.db'))
+idempotency_store = IdempotencyStore(
+    db.get_db_connection,
+    placeholder='%s' if db.db_url else '?',
+    ttl=int(os.getenv('IDEMPOTENCY_TTL', 24 * 3600))
+)
+idempotency_store.create_tables()
+
+# Trending charts, kept in memory and fed from the streams table (charts.py)
+charts = ChartsEngine(db, snapshot_path=os.getenv('CHARTS_SNAPSHOT_PATH', 'charts.snapshot.json.gz'))
+charts.start(poll_interval=float(os.getenv('CHARTS_POLL_INTERVAL', '10')))
+
+# Subscription end times cached from SubscriptionV2 events (subscription_state.py)
+subscriptions = None
+if os.getenv('SUBSCRIPTION_CONTRACT'):
+    from web3 import Web3
+
+    subscriptions = SubscriptionState(
+        Web3(Web3.HTTPProvider(os.getenv('WEB3_PROVIDER_URL', 'https://sepolia.base.org'))),
+        os.environ['SUBSCRIPTION_CONTRACT'],
+        start_block=int(os.getenv('SUBSCRIPTION_START_BLOCK', '0')),
+        miss_ttl=float(os.getenv('SUBSCRIPTION_MISS_TTL', '30'))
+    )
+    subscriptions.start(poll_interval=float(os.getenv('SUBSCRIPTION_POLL_INTERVAL', '5')))
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
@@ -39,6 +81,10 @@ def register():
     email = data.get('email')
     password = data.get('password')
     is_artist = data.get('is_artist', False)
+    # Optional; keys the user's on-chain recommendation profile (profile_builder.py)
+    wallet_address = data.get('wallet_address')
+    if wallet_address is not None and not re.match(r'^0x[0-9a-fA-F]{40}$', wallet_address):
+        return jsonify({'error': 'Invalid wallet address'}), 400
     
     if db.get_user_by_username(username):
         return jsonify({'error': 'Username already exists'}), 400
@@ -46,7 +92,7 @@ def register():
     if db.get_user_by_email(email):
         return jsonify({'error': 'Email already exists'}), 400
     
-    db.create_user(username, email, password, is_artist)
+    db.create_user(username, email, password, is_artist, wallet_address)
     
     return jsonify({'message': 'Registration successful'}), 201
 
@@ -74,6 +120,19 @@ def login():
     
     return jsonify({'error': 'Invalid credentials'}), 401
 
+def _unique_upload_path(filename):
+    """Claim a path in UPLOAD_FOLDER for `filename`, adding a counter if another upload has it."""
+    base, ext = os.path.splitext(filename)
+    candidate, n = filename, 1
+    while True:
+        path = os.path.join(app.config['UPLOAD_FOLDER'], candidate)
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return path
+        except FileExistsError:
+            n += 1
+            candidate = f'{base}-{n}{ext}'
+
 @app.route('/api/upload/track', methods=['POST'])
 @login_required
 def upload_track():
@@ -89,8 +148,30 @@ def upload_track():
     
     if file:
         filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        # Screen under a temporary name: a rejected re-upload must not touch the original's file
+        fd, tmp_path = tempfile.mkstemp(dir=app.config['UPLOAD_FOLDER'], prefix='.upload-',
+                                        suffix=os.path.splitext(filename)[1])
+        os.close(fd)
+        try:
+            file.save(tmp_path)
+            
+            # Acoustic pre-screen: reject re-uploads of a catalog recording outright;
+            # near matches are returned to the uploader
+            try:
+                hashes, offsets = fingerprint_file(tmp_path)
+                matches = fingerprints.match(hashes, offsets)
+            except (AudioDecodeError, OSError) as e:
+                app.logger.warning(f"Fingerprinting failed for {filename}: {e}")
+                hashes, matches = None, []
+            exact = [m for m in matches if m['exact']]
+            if exact:
+                return jsonify({'error': 'Audio matches an existing track', 'matches': exact}), 409
+            
+            filepath = _unique_upload_path(filename)
+            os.replace(tmp_path, filepath)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
         
         track_id = db.create_track(
             title=request.form.get('title'),
@@ -101,10 +182,16 @@ def upload_track():
             file_path=filepath,
             artist_id=request.json.get('user_id')
         )
+        if hashes is not None:
+            fingerprints.add(track_id, hashes, offsets)
         
         return jsonify({
             'message': 'Track uploaded successfully',
-            'track_id': track_id
+            'track_id': track_id,
+            'fingerprint_matches': [
+                {'track_id': str(m['track_id']), 'confidence': m['confidence'], 'exact': m['exact']}
+                for m in matches
+            ]
         }), 201
     
     return jsonify({'error': 'File upload failed'}), 400
@@ -115,14 +202,128 @@ def get_tracks():
     return jsonify([{
         'id': track[0],
         'title': track[1],
-        'artist': track[13],  # artist_name from JOIN
-        'genre': track[4],
-        'duration': track[5],
-        'price': track[6],
-        'plays': track[10],
-        'cover_art': track[8]
+        'artist': track[2],  # artist_name from JOIN
+        'genre': track[3],
+        'duration': track[4],
+        'price': track[5],
+        'plays': track[6],
+        'cover_art': track[7]
     } for track in tracks])
 
+@app.route('/api/search', methods=['GET'])
+def search_tracks():
+    # Prefix match on the last word, so this also serves autocomplete
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Query parameter q is required'}), 400
+    try:
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    
+    result = track_search.search(query, limit=limit)
+    return jsonify({'query': query, **result})
+
+@app.route('/api/tracks/<int:track_id>/similar', methods=['GET'])
+def get_similar_tracks(track_id):
+    # "Listeners also played": top-K neighbours precomputed by similar_tracks.py
+    try:
+        limit = min(int(request.args.get('limit', 20)), 50)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    
+    neighbors = similar_tracks.neighbors(track_id, limit)
+    tracks = db.get_track_summaries(n for n, _ in neighbors)
+    return jsonify({
+        'track_id': track_id,
+        'tracks': [{
+            'id': n,
+            'title': tracks[n][0],
+            'genre': tracks[n][1],
+            'artist': tracks[n][2],
+            'cover_art': tracks[n][3],
+            'score': score
+        } for n, score in neighbors if n in tracks]
+    })
+
+@app.route('/api/charts', methods=['GET'])
+def get_charts():
+    window = request.args.get('window', 'week')
+    if window not in WINDOWS:
+        return jsonify({'error': f"window must be one of {', '.join(WINDOWS)}"}), 400
+    try:
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    
+    chart = charts.top(window, limit)
+    tracks = db.get_track_summaries(track_id for track_id, _ in chart)
+    return jsonify({
+        'window': window,
+        'tracks': [{
+            'rank': rank,
+            'id': track_id,
+            'title': tracks[track_id][0],
+            'genre': tracks[track_id][1],
+            'artist': tracks[track_id][2],
+            'cover_art': tracks[track_id][3],
+            'plays': plays
+        } for rank, (track_id, plays) in enumerate(
+            [entry for entry in chart if entry[0] in tracks], 1
+        )]
+    })
+
+@app.route('/api/artists/<int:artist_id>/analytics', methods=['GET'])
+def get_artist_analytics(artist_id):
+    # Daily columns compacted by analytics.py; a range query is an array slice
+    try:
+        days = int(request.args.get('days', 90))
+        limit = min(int(request.args.get('limit', 50)), 500)
+    except ValueError:
+        return jsonify({'error': 'Invalid days or limit'}), 400
+    
+    daily = analytics.daily(artist_id, days=days)
+    if daily is None:
+        return jsonify({'artist_id': artist_id, 'days': [], 'tracks': []})
+    
+    plays, earnings = daily['plays'], daily['earnings']
+    # Top tracks by plays in the range
+    top = plays.sum(axis=0).argsort()[::-1][:limit]
+    track_ids = daily['track_ids'][top].tolist()
+    titles = db.get_track_summaries(track_ids)
+    return jsonify({
+        'artist_id': artist_id,
+        'days': daily['days'],
+        'totals': {
+            'plays': plays.sum(axis=1).tolist(),
+            'earnings': earnings.sum(axis=1).round(6).tolist()
+        },
+        'tracks': [{
+            'id': track_id,
+            'title': titles.get(track_id, (None,))[0],
+            'total_plays': int(plays[:, i].sum()),
+            'total_earnings': round(float(earnings[:, i].sum()), 6),
+            'plays': plays[:, i].tolist(),
+            'earnings': earnings[:, i].round(6).tolist()
+        } for i, track_id in zip(top.tolist(), track_ids)]
+    })
+
+@app.route('/api/artists/<address>/earnings', methods=['GET'])
+def get_artist_earnings(address):
+    # Served from the chain event index (chain_indexer.py), no RPC per token
+    if not re.match(r'^0x[0-9a-fA-F]{40}$', address):
+        return jsonify({'error': 'Invalid artist address'}), 400
+    return jsonify(chain_index.get_artist_stats(address))
+
+@app.route('/api/tokens/<int:token_id>/plays', methods=['GET'])
+def get_token_plays(token_id):
+    plays = chain_index.get_track_plays(token_id)
+    return jsonify({
+        'token_id': token_id,
+        'plays': sum(v for k, v in plays.items() if k != 'subscriber'),
+        'by_source': plays
+    })
+
 @app.route('/api/subscribe/<int:artist_id>', methods=['POST'])
 def subscribe(artist_id):
     if request.json.get('user_id') == artist_id:
@@ -146,19 +347,29 @@ def subscription_status():
     user_address = data.get('user_address')
     plan = data.get('plan')
     
-    # For now, simulate blockchain check
-    # In production, integrate with Web3 or blockchain API
-    is_subscribed = True  # Placeholder
+    if subscriptions is None:
+        return jsonify({'error': 'Subscription contract not configured'}), 503
+    if not user_address or not re.match(r'^0x[0-9a-fA-F]{40}$', user_address):
+        return jsonify({'error': 'Invalid user address'}), 400
+    
+    try:
+        end_time = subscriptions.get_end_time(user_address)
+    except SubscriptionLookupError as e:
+        return jsonify({'error': f'Subscription lookup failed: {str(e)}'}), 503
+    
+    now = datetime.now().timestamp()
     subscription_info = {
-        'is_active': is_subscribed,
+        'is_active': end_time > now,
         'plan': plan,
-        'end_time': (datetime.utcnow() + timedelta(days=30)).isoformat()
+        'end_time': datetime.utcfromtimestamp(end_time).isoformat() if end_time else None,
+        'remaining_time': max(0, int(end_time - now))
     }
     
     return jsonify(subscription_info)
 
 @app.route('/api/subscription/create', methods=['POST'])
 @login_required
+@idempotent(idempotency_store, 'subscription_create', lambda: current_user.id)
 def create_subscription():
     data = request.get_json()
     user_address = data.get('user_address')
@@ -0,0 +1,291 @@
+"""
+Bulk catalog import for label onboarding.
+
+Reads a manifest (CSV with a header row, or JSONL) of tracks plus a
+directory of audio files. Files are copied into the upload folder and hashed
+in parallel, and track rows are inserted with `executemany`, one transaction
+per chunk. Progress is checkpointed after every chunk, so an interrupted
+import resumes where it stopped. Rows are deduplicated on the audio content
+hash, so re-importing the same file is a no-op.
+
+Manifest fields: file (relative to --audio-dir, and must resolve inside it),
+title, description, genre, duration, price, artist_id, album_id. Only file
+and title are required; artist_id falls back to --artist-id.
+
+Usage:
+    python catalog_import.py manifest.csv --audio-dir ./label_audio --artist-id 42 --moderate
+"""
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+from werkzeug.utils import secure_filename
+
+logger = logging.getLogger(__name__)
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def read_manifest(path):
+    """Yield manifest rows as dicts."""
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+
+def copy_and_hash(src, upload_dir):
+    """
+    Copy `src` into `upload_dir` under a content-addressed name.
+
+    Returns (dest_path, sha256_hex, bytes_copied). The file is read once;
+    an existing copy with the same hash is kept.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=upload_dir, suffix='.part')
+    try:
+        with open(src, 'rb') as fin, os.fdopen(fd, 'wb') as fout:
+            while True:
+                block = fin.read(COPY_BUFFER_SIZE)
+                if not block:
+                    break
+                digest.update(block)
+                fout.write(block)
+                size += len(block)
+        content_hash = digest.hexdigest()
+        dest = os.path.join(upload_dir, f"{content_hash[:16]}_{secure_filename(os.path.basename(src))}")
+        if os.path.exists(dest):
+            os.unlink(tmp_path)
+        else:
+            os.replace(tmp_path, dest)
+        return dest, content_hash, size
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def load_checkpoint(path, manifest):
+    if not os.path.exists(path):
+        return {'manifest': manifest, 'rows_done': 0, 'inserted': 0, 'failed': 0}
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get('manifest') != manifest:
+        raise SystemExit(f"Checkpoint {path} belongs to {checkpoint.get('manifest')}, not {manifest}")
+    return checkpoint
+
+
+def save_checkpoint(path, checkpoint):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(checkpoint, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+
+def _to_float(value, default=0.0):
+    return float(value) if value not in (None, '') else default
+
+
+def _to_int(value, default=None):
+    return int(value) if value not in (None, '') else default
+
+
+class CatalogImporter:
+    def __init__(self, db, audio_dir, upload_dir, artist_id=None, workers=8,
+                 chunk_size=500, enqueue_moderation=False):
+        self.db = db
+        self.audio_dir = audio_dir
+        self.upload_dir = upload_dir
+        self.artist_id = artist_id
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.enqueue_moderation = enqueue_moderation
+        self.copy_seconds = 0.0
+        self.insert_seconds = 0.0
+        self.bytes_copied = 0
+
+    def _prepare(self, row):
+        """Validate a manifest row and copy its file. Returns a track row tuple or raises ValueError."""
+        if not row.get('file') or not row.get('title'):
+            raise ValueError('file and title are required')
+        artist_id = _to_int(row.get('artist_id'), self.artist_id)
+        if artist_id is None:
+            raise ValueError('no artist_id')
+        audio_root = os.path.realpath(self.audio_dir)
+        src = os.path.realpath(os.path.join(audio_root, row['file']))
+        if os.path.commonpath([audio_root, src]) != audio_root:
+            raise ValueError(f"{row['file']} is outside --audio-dir")
+        if not os.path.isfile(src):
+            raise ValueError(f"missing audio file {row['file']}")
+
+        dest, content_hash, size = copy_and_hash(src, self.upload_dir)
+        return (
+            row['title'],
+            row.get('description'),
+            row.get('genre'),
+            _to_float(row.get('duration')),
+            _to_float(row.get('price')),
+            dest,
+            artist_id,
+            _to_int(row.get('album_id')),
+            content_hash
+        ), size
+
+    def import_chunk(self, pool, rows, first_row):
+        """Copy and insert one chunk. Returns (inserted, failed)."""
+        started = time.perf_counter()
+        futures = [pool.submit(self._prepare, row) for row in rows]
+        track_rows, failed = [], 0
+        for i, future in enumerate(futures):
+            try:
+                track_row, size = future.result()
+            except (ValueError, OSError) as e:
+                failed += 1
+                logger.warning(f"Manifest row {first_row + i + 1} skipped: {e}")
+                continue
+            track_rows.append(track_row)
+            self.bytes_copied += size
+        copied = time.perf_counter()
+
+        inserted = self.db.bulk_create_tracks(track_rows, enqueue_moderation=self.enqueue_moderation)
+        self.copy_seconds += copied - started
+        self.insert_seconds += time.perf_counter() - copied
+        return inserted, failed
+
+    def run(self, manifest, checkpoint_path):
+        checkpoint = load_checkpoint(checkpoint_path, os.path.abspath(manifest))
+        if checkpoint['rows_done']:
+            logger.info(f"Resuming after {checkpoint['rows_done']} manifest rows")
+        rows = itertools.islice(read_manifest(manifest), checkpoint['rows_done'], None)
+
+        started = time.perf_counter()
+        processed = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while True:
+                chunk = list(itertools.islice(rows, self.chunk_size))
+                if not chunk:
+                    break
+                inserted, failed = self.import_chunk(pool, chunk, checkpoint['rows_done'])
+                checkpoint['rows_done'] += len(chunk)
+                checkpoint['inserted'] += inserted
+                checkpoint['failed'] += failed
+                save_checkpoint(checkpoint_path, checkpoint)
+                processed += len(chunk)
+
+                elapsed = time.perf_counter() - started
+                logger.info(
+                    f"{checkpoint['rows_done']} rows done ({checkpoint['inserted']} inserted, "
+                    f"{checkpoint['failed']} failed), {processed / elapsed:.1f} rows/s"
+                )
+
+        elapsed = time.perf_counter() - started
+        return {
+            'rows': processed,
+            'rows_total': checkpoint['rows_done'],
+            'inserted': checkpoint['inserted'],
+            'failed': checkpoint['failed'],
+            'seconds': round(elapsed, 3),
+            'rows_per_second': round(processed / elapsed, 1) if elapsed else None,
+            'mb_per_second': round(self.bytes_copied / 1e6 / elapsed, 1) if elapsed else None,
+            'copy_seconds': round(self.copy_seconds, 3),
+            'insert_seconds': round(self.insert_seconds, 3)
+        }
+
+
+def submit_moderation(db, api_url, batch_size=100, workers=8):
+    """Post queued tracks to the GenLayer moderation API. Returns the number submitted."""
+    import requests
+
+    def submit(track):
+        track_id, title, description, genre, artist_name = track
+        response = requests.post(f"{api_url.rstrip('/')}/moderate", json={
+            'track_id': str(track_id),
+            'track_title': title,
+            'artist_name': artist_name or '',
+            'album_name': '',
+            'genre': genre or '',
+            'description': description or '',
+            'is_explicit': False
+        }, timeout=30)
+        response.raise_for_status()
+        return track_id
+
+    submitted = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            pending = db.get_pending_moderation(batch_size)
+            if not pending:
+                break
+            done, failed = [], []
+            for track, future in zip(pending, [pool.submit(submit, t) for t in pending]):
+                try:
+                    done.append(future.result())
+                except Exception as e:
+                    logger.warning(f"Moderation submit failed for track {track[0]}: {e}")
+                    failed.append(track[0])
+            db.set_moderation_status(done, 'submitted')
+            db.set_moderation_status(failed, 'failed')
+            submitted += len(done)
+    return submitted
+
+
+def main():
+    load_dotenv()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description="Bulk import tracks from a manifest")
+    parser.add_argument("manifest", help="CSV (with header) or .jsonl manifest")
+    parser.add_argument("--audio-dir", required=True, help="Directory the manifest's file paths are relative to")
+    parser.add_argument("--upload-dir", default='uploads', help="Where audio files are copied")
+    parser.add_argument("--artist-id", type=int, help="Artist for rows without artist_id")
+    parser.add_argument("--workers", type=int, default=8, help="Parallel file copies")
+    parser.add_argument("--chunk-size", type=int, default=500, help="Rows per insert transaction")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <manifest>.checkpoint.json)")
+    parser.add_argument("--moderate", action='store_true', help="Queue imported tracks for moderation")
+    args = parser.parse_args()
+
+    from models import Database
+
+    os.makedirs(args.upload_dir, exist_ok=True)
+    db = Database(os.getenv('DATABASE_URL', 'sqlite:///artist_platform.db'))
+    importer = CatalogImporter(
+        db,
+        audio_dir=args.audio_dir,
+        upload_dir=args.upload_dir,
+        artist_id=args.artist_id,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        enqueue_moderation=args.moderate
+    )
+    report = importer.run(args.manifest, args.checkpoint or f"{args.manifest}.checkpoint.json")
+    print(json.dumps(report, indent=2))
+
+    api_url = os.getenv('GENLAYER_API_URL')
+    if args.moderate and api_url:
+        logger.info(f"Submitted {submit_moderation(db, api_url)} tracks for moderation")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,554 @@
+"""
+Chain event indexer for MusicNFT and RevenueDistributor.
+
+Follows MusicMinted, MusicPlayed, PlayCountIncremented, TrackRegistered,
+PlayRecorded, RevenueDistributed and ArtistPaid logs with block-range
+`eth_getLogs` calls and writes them into indexed SQLite tables, with
+per-track play and per-artist payout rollups maintained in the same
+transaction. Dashboards can then answer "plays and earnings for artist X"
+with one indexed query instead of an RPC per token.
+
+Reorgs are detected by comparing stored block hashes with the chain; on a
+mismatch the index rolls back to the last common block and re-indexes. A
+hash is stored for every block in the reorg window, plus one older anchor
+block, so the fork point is always a stored block. Rollups only count event
+rows that were actually inserted, so replaying a range never double-counts.
+
+Run as a worker:  python chain_indexer.py
+"""
+import logging
+import os
+import sqlite3
+import time
+from collections import defaultdict
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+MUSIC_NFT_EVENTS_ABI = [
+    {
+        "type": "event", "name": "MusicMinted", "anonymous": False,
+        "inputs": [
+            {"name": "tokenId", "type": "uint256", "indexed": True},
+            {"name": "artist", "type": "address", "indexed": True},
+            {"name": "trackTitle", "type": "string", "indexed": False},
+            {"name": "artistName", "type": "string", "indexed": False},
+            {"name": "releaseType", "type": "string", "indexed": False},
+            {"name": "mintFee", "type": "uint256", "indexed": False}
+        ]
+    },
+    {
+        "type": "event", "name": "MusicPlayed", "anonymous": False,
+        "inputs": [
+            {"name": "tokenId", "type": "uint256", "indexed": True},
+            {"name": "listener", "type": "address", "indexed": True}
+        ]
+    },
+    {
+        "type": "event", "name": "PlayCountIncremented", "anonymous": False,
+        "inputs": [
+            {"name": "tokenId", "type": "uint256", "indexed": True},
+            {"name": "plays", "type": "uint256", "indexed": False}
+        ]
+    }
+]
+
+REVENUE_DISTRIBUTOR_EVENTS_ABI = [
+    {
+        "type": "event", "name": "TrackRegistered", "anonymous": False,
+        "inputs": [
+            {"name": "tokenId", "type": "uint256", "indexed": True},
+            {"name": "artist", "type": "address", "indexed": True}
+        ]
+    },
+    {
+        "type": "event", "name": "PlayRecorded", "anonymous": False,
+        "inputs": [
+            {"name": "tokenId", "type": "uint256", "indexed": True},
+            {"name": "listener", "type": "address", "indexed": True},
+            {"name": "timestamp", "type": "uint256", "indexed": False}
+        ]
+    },
+    {
+        "type": "event", "name": "RevenueDistributed", "anonymous": False,
+        "inputs": [
+            {"name": "totalRevenue", "type": "uint256", "indexed": False},
+            {"name": "totalPlays", "type": "uint256", "indexed": False},
+            {"name": "platformFee", "type": "uint256", "indexed": False},
+            {"name": "artistRevenue", "type": "uint256", "indexed": False}
+        ]
+    },
+    {
+        "type": "event", "name": "ArtistPaid", "anonymous": False,
+        "inputs": [
+            {"name": "artist", "type": "address", "indexed": True},
+            {"name": "amount", "type": "uint256", "indexed": False}
+        ]
+    }
+]
+
+# Play sources stored in plays.source
+PAID = 'paid'              # MusicNFT.playTrack
+AGGREGATED = 'aggregated'  # MusicNFT.incrementPlayCount / batchIncrementPlayCount
+SUBSCRIBER = 'subscriber'  # RevenueDistributor.recordSubscriberPlay
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS indexed_blocks (
+        number INTEGER PRIMARY KEY,
+        hash TEXT NOT NULL
+    )''',
+    '''CREATE TABLE IF NOT EXISTS tracks (
+        token_id INTEGER PRIMARY KEY,
+        artist TEXT NOT NULL,
+        track_title TEXT,
+        artist_name TEXT,
+        release_type TEXT,
+        mint_fee TEXT,
+        block_number INTEGER NOT NULL
+    )''',
+    'CREATE INDEX IF NOT EXISTS idx_tracks_artist ON tracks (artist)',
+    # Every artist assignment (MusicMinted, TrackRegistered), so a rollback can
+    # restore the artist a reassignment replaced
+    '''CREATE TABLE IF NOT EXISTS track_artists (
+        block_number INTEGER NOT NULL,
+        log_index INTEGER NOT NULL,
+        token_id INTEGER NOT NULL,
+        artist TEXT NOT NULL,
+        PRIMARY KEY (block_number, log_index)
+    )''',
+    'CREATE INDEX IF NOT EXISTS idx_track_artists_token ON track_artists (token_id, block_number, log_index)',
+    '''CREATE TABLE IF NOT EXISTS plays (
+        block_number INTEGER NOT NULL,
+        log_index INTEGER NOT NULL,
+        tx_hash TEXT NOT NULL,
+        token_id INTEGER NOT NULL,
+        listener TEXT,
+        plays INTEGER NOT NULL,
+        source TEXT NOT NULL,
+        PRIMARY KEY (block_number, log_index)
+    )''',
+    'CREATE INDEX IF NOT EXISTS idx_plays_token ON plays (token_id, block_number)',
+    '''CREATE TABLE IF NOT EXISTS distributions (
+        block_number INTEGER NOT NULL,
+        log_index INTEGER NOT NULL,
+        tx_hash TEXT NOT NULL,
+        total_revenue TEXT NOT NULL,
+        total_plays INTEGER NOT NULL,
+        platform_fee TEXT NOT NULL,
+        artist_revenue TEXT NOT NULL,
+        PRIMARY KEY (block_number, log_index)
+    )''',
+    '''CREATE TABLE IF NOT EXISTS artist_payments (
+        block_number INTEGER NOT NULL,
+        log_index INTEGER NOT NULL,
+        tx_hash TEXT NOT NULL,
+        artist TEXT NOT NULL,
+        amount TEXT NOT NULL,
+        PRIMARY KEY (block_number, log_index)
+    )''',
+    'CREATE INDEX IF NOT EXISTS idx_artist_payments_artist ON artist_payments (artist, block_number)',
+    # Rollups, kept in step with the event tables
+    '''CREATE TABLE IF NOT EXISTS track_plays (
+        token_id INTEGER NOT NULL,
+        source TEXT NOT NULL,
+        plays INTEGER NOT NULL,
+        PRIMARY KEY (token_id, source)
+    )''',
+    '''CREATE TABLE IF NOT EXISTS artist_totals (
+        artist TEXT PRIMARY KEY,
+        total_paid TEXT NOT NULL,
+        payments INTEGER NOT NULL
+    )''',
+]
+
+
+class ChainIndexStore:
+    """SQLite-backed event index. Safe to open read-only from the web apps."""
+
+    def __init__(self, path):
+        self.path = path
+        conn = self.connect()
+        try:
+            for statement in SCHEMA:
+                conn.execute(statement)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def get_checkpoint(self):
+        """Return (block_number, block_hash) of the last indexed block, or None."""
+        conn = self.connect()
+        try:
+            return conn.execute(
+                'SELECT number, hash FROM indexed_blocks ORDER BY number DESC LIMIT 1'
+            ).fetchone()
+        finally:
+            conn.close()
+
+    def get_block_hashes(self, limit):
+        conn = self.connect()
+        try:
+            return conn.execute(
+                'SELECT number, hash FROM indexed_blocks ORDER BY number DESC LIMIT ?', (limit,)
+            ).fetchall()
+        finally:
+            conn.close()
+
+    def apply(self, events, blocks, keep_blocks=256):
+        """
+        Write one block range of decoded events and advance the checkpoint atomically.
+
+        `blocks` are the (number, hash) pairs to remember for reorg checks,
+        ending with the last block of the range.
+        """
+        play_deltas = defaultdict(int)
+        paid_deltas = defaultdict(int)
+        payment_counts = defaultdict(int)
+        conn = self.connect()
+        try:
+            for ev in events:
+                key = (ev['block_number'], ev['log_index'])
+                name = ev['event']
+                args = ev['args']
+                if name in ('MusicMinted', 'TrackRegistered'):
+                    artist = args['artist'].lower()
+                    inserted = conn.execute('''
+                        INSERT OR IGNORE INTO track_artists (block_number, log_index, token_id, artist)
+                        VALUES (?, ?, ?, ?)
+                    ''', key + (args['tokenId'], artist)).rowcount
+                    # MusicMinted carries metadata; TrackRegistered sets the artist
+                    # RevenueDistributor pays, including updateTrackArtist reassignments
+                    if name == 'MusicMinted':
+                        conn.execute('''
+                            INSERT OR REPLACE INTO tracks
+                            (token_id, artist, track_title, artist_name, release_type, mint_fee, block_number)
+                            VALUES (?, ?, ?, ?, ?, ?, ?)
+                        ''', (args['tokenId'], artist, args['trackTitle'], args['artistName'],
+                              args['releaseType'], str(args['mintFee']), ev['block_number']))
+                    elif inserted:
+                        conn.execute('''
+                            INSERT INTO tracks (token_id, artist, block_number) VALUES (?, ?, ?)
+                            ON CONFLICT (token_id) DO UPDATE SET artist = excluded.artist
+                        ''', (args['tokenId'], artist, ev['block_number']))
+                elif name in ('MusicPlayed', 'PlayCountIncremented', 'PlayRecorded'):
+                    source = {'MusicPlayed': PAID, 'PlayCountIncremented': AGGREGATED, 'PlayRecorded': SUBSCRIBER}[name]
+                    plays = args.get('plays', 1)
+                    inserted = conn.execute('''
+                        INSERT OR IGNORE INTO plays
+                        (block_number, log_index, tx_hash, token_id, listener, plays, source)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''', key + (ev['tx_hash'], args['tokenId'], (args.get('listener') or '').lower() or None,
+                                plays, source)).rowcount
+                    if inserted:
+                        play_deltas[(args['tokenId'], source)] += plays
+                elif name == 'RevenueDistributed':
+                    conn.execute('''
+                        INSERT OR IGNORE INTO distributions
+                        (block_number, log_index, tx_hash, total_revenue, total_plays, platform_fee, artist_revenue)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''', key + (ev['tx_hash'], str(args['totalRevenue']), args['totalPlays'],
+                                str(args['platformFee']), str(args['artistRevenue'])))
+                elif name == 'ArtistPaid':
+                    artist = args['artist'].lower()
+                    inserted = conn.execute('''
+                        INSERT OR IGNORE INTO artist_payments (block_number, log_index, tx_hash, artist, amount)
+                        VALUES (?, ?, ?, ?, ?)
+                    ''', key + (ev['tx_hash'], artist, str(args['amount']))).rowcount
+                    if inserted:
+                        paid_deltas[artist] += args['amount']
+                        payment_counts[artist] += 1
+
+            for (token_id, source), plays in play_deltas.items():
+                conn.execute('''
+                    INSERT INTO track_plays (token_id, source, plays) VALUES (?, ?, ?)
+                    ON CONFLICT (token_id, source) DO UPDATE SET plays = plays + excluded.plays
+                ''', (token_id, source, plays))
+            for artist, amount in paid_deltas.items():
+                # Wei totals can exceed SQLite's 64-bit INTEGER, so they are summed exactly in Python
+                row = conn.execute('SELECT total_paid FROM artist_totals WHERE artist = ?', (artist,)).fetchone()
+                total = (int(row[0]) if row else 0) + amount
+                conn.execute('''
+                    INSERT INTO artist_totals (artist, total_paid, payments) VALUES (?, ?, ?)
+                    ON CONFLICT (artist) DO UPDATE
+                    SET total_paid = excluded.total_paid, payments = payments + excluded.payments
+                ''', (artist, str(total), payment_counts[artist]))
+
+            conn.executemany('INSERT OR REPLACE INTO indexed_blocks (number, hash) VALUES (?, ?)', blocks)
+            # Keep the window plus the newest block below it, as the anchor for deep reorgs
+            conn.execute('''
+                DELETE FROM indexed_blocks WHERE number < (
+                    SELECT MAX(number) FROM indexed_blocks WHERE number <= ?
+                )
+            ''', (blocks[-1][0] - keep_blocks,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def rollback_to(self, block_number):
+        """Drop everything indexed after `block_number` and rebuild the affected rollups."""
+        conn = self.connect()
+        try:
+            tokens = [r[0] for r in conn.execute(
+                'SELECT DISTINCT token_id FROM plays WHERE block_number > ?', (block_number,))]
+            artists = [r[0] for r in conn.execute(
+                'SELECT DISTINCT artist FROM artist_payments WHERE block_number > ?', (block_number,))]
+            reassigned = [r[0] for r in conn.execute(
+                'SELECT DISTINCT token_id FROM track_artists WHERE block_number > ?', (block_number,))]
+            for table in ('tracks', 'track_artists', 'plays', 'distributions', 'artist_payments',
+                          'indexed_blocks'):
+                column = 'number' if table == 'indexed_blocks' else 'block_number'
+                conn.execute(f'DELETE FROM {table} WHERE {column} > ?', (block_number,))
+
+            for token_id in reassigned:
+                # Tracks added after the fork are gone; the rest get their last surviving artist back
+                conn.execute('''
+                    UPDATE tracks SET artist = (
+                        SELECT artist FROM track_artists WHERE token_id = :token
+                        ORDER BY block_number DESC, log_index DESC LIMIT 1
+                    )
+                    WHERE token_id = :token AND EXISTS (SELECT 1 FROM track_artists WHERE token_id = :token)
+                ''', {'token': token_id})
+
+            for token_id in tokens:
+                conn.execute('DELETE FROM track_plays WHERE token_id = ?', (token_id,))
+                conn.execute('''
+                    INSERT INTO track_plays (token_id, source, plays)
+                    SELECT token_id, source, SUM(plays) FROM plays WHERE token_id = ? GROUP BY token_id, source
+                ''', (token_id,))
+            for artist in artists:
+                amounts = [int(r[0]) for r in conn.execute(
+                    'SELECT amount FROM artist_payments WHERE artist = ?', (artist,))]
+                if amounts:
+                    conn.execute('''
+                        UPDATE artist_totals SET total_paid = ?, payments = ? WHERE artist = ?
+                    ''', (str(sum(amounts)), len(amounts), artist))
+                else:
+                    conn.execute('DELETE FROM artist_totals WHERE artist = ?', (artist,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def get_artist_stats(self, artist):
+        """Plays and payouts for one artist address, in a single query."""
+        artist = artist.lower()
+        conn = self.connect()
+        try:
+            row = conn.execute('''
+                SELECT
+                    (SELECT COUNT(*) FROM tracks WHERE artist = :artist),
+                    (SELECT COALESCE(SUM(tp.plays), 0) FROM tracks t
+                        JOIN track_plays tp ON tp.token_id = t.token_id
+                        WHERE t.artist = :artist AND tp.source != :subscriber),
+                    (SELECT COALESCE(SUM(tp.plays), 0) FROM tracks t
+                        JOIN track_plays tp ON tp.token_id = t.token_id
+                        WHERE t.artist = :artist AND tp.source = :subscriber),
+                    (SELECT total_paid FROM artist_totals WHERE artist = :artist),
+                    (SELECT payments FROM artist_totals WHERE artist = :artist)
+            ''', {'artist': artist, 'subscriber': SUBSCRIBER}).fetchone()
+            return {
+                'artist': artist,
+                'tracks': row[0],
+                'total_plays': row[1],
+                'subscriber_plays': row[2],
+                'total_paid_wei': row[3] or '0',
+                'payments': row[4] or 0
+            }
+        finally:
+            conn.close()
+
+    def get_period_plays(self):
+        """
+        (token_id, artist, plays) for RevenueDistributor's open period: the
+        PlayRecorded plays since the last RevenueDistributed, with the artist
+        the contract pays for each token (None if it was never registered).
+        """
+        conn = self.connect()
+        try:
+            last = conn.execute('''
+                SELECT block_number, log_index FROM distributions
+                ORDER BY block_number DESC, log_index DESC LIMIT 1
+            ''').fetchone() or (-1, -1)
+            return conn.execute('''
+                SELECT p.token_id, t.artist, SUM(p.plays)
+                FROM plays p LEFT JOIN tracks t ON t.token_id = p.token_id
+                WHERE p.source = ? AND (p.block_number > ? OR (p.block_number = ? AND p.log_index > ?))
+                GROUP BY p.token_id, t.artist
+                ORDER BY p.token_id
+            ''', (SUBSCRIBER, last[0], last[0], last[1])).fetchall()
+        finally:
+            conn.close()
+
+    def get_track_plays(self, token_id):
+        conn = self.connect()
+        try:
+            rows = conn.execute(
+                'SELECT source, plays FROM track_plays WHERE token_id = ?', (token_id,)
+            ).fetchall()
+            return dict(rows)
+        finally:
+            conn.close()
+
+
+class ChainIndexer:
+    """
+    Polls `eth_getLogs` in block ranges up to `head - confirmations`.
+
+    The range shrinks when the provider rejects a query (result limits) and
+    grows back after successful calls.
+    """
+
+    def __init__(self, w3, store, nft_address, distributor_address=None, start_block=0,
+                 batch_size=2000, confirmations=6, reorg_depth=64):
+        self.w3 = w3
+        self.store = store
+        self.start_block = start_block
+        self.max_batch_size = batch_size
+        self.batch_size = batch_size
+        self.confirmations = confirmations
+        self.reorg_depth = reorg_depth
+
+        self.addresses = []
+        self._events = {}
+        for address, abi in ((nft_address, MUSIC_NFT_EVENTS_ABI),
+                             (distributor_address, REVENUE_DISTRIBUTOR_EVENTS_ABI)):
+            if not address:
+                continue
+            contract = w3.eth.contract(address=w3.to_checksum_address(address), abi=abi)
+            self.addresses.append(contract.address)
+            for item in abi:
+                signature = f"{item['name']}({','.join(i['type'] for i in item['inputs'])})"
+                topic = w3.keccak(text=signature).hex()
+                self._events[(contract.address.lower(), topic)] = contract.events[item['name']]()
+
+    def _decode(self, log):
+        topic = log['topics'][0].hex() if log['topics'] else None
+        event = self._events.get((log['address'].lower(), topic))
+        if event is None:
+            return None
+        decoded = event.process_log(log)
+        return {
+            'event': decoded['event'],
+            'args': dict(decoded['args']),
+            'block_number': log['blockNumber'],
+            'log_index': log['logIndex'],
+            'tx_hash': log['transactionHash'].hex()
+        }
+
+    def _find_fork_point(self):
+        """Return the last indexed block still on the canonical chain, or None if no reorg."""
+        stored = self.store.get_block_hashes(self.reorg_depth + 1)
+        for i, (number, block_hash) in enumerate(stored):
+            if self.w3.eth.get_block(number)['hash'].hex() == block_hash:
+                return None if i == 0 else number
+        # Rolling back further would need blocks we no longer have hashes for
+        raise RuntimeError(
+            f"Reorg deeper than the {len(stored)} stored blocks (down to {stored[-1][0]}); "
+            f"re-index from an earlier block"
+        )
+
+    def _window(self, from_block, to_block, checkpoint, logs):
+        """
+        (number, hash) for the blocks of a range inside the reorg window, or
+        None if the chain changed while the range was read: hashes don't link
+        up, the first block doesn't follow the checkpoint, or a log came from
+        a block that is no longer canonical.
+        """
+        start = max(from_block, to_block - self.reorg_depth + 1)
+        blocks = [self.w3.eth.get_block(number) for number in range(start, to_block + 1)]
+        for parent, block in zip(blocks, blocks[1:]):
+            if block['parentHash'] != parent['hash']:
+                return None
+        if checkpoint and start == checkpoint[0] + 1 and blocks[0]['parentHash'].hex() != checkpoint[1]:
+            return None
+        hashes = {block['number']: block['hash'].hex() for block in blocks}
+        for log in logs:
+            expected = hashes.get(log['blockNumber'])
+            if expected is not None and log['blockHash'].hex() != expected:
+                return None
+        return [(block['number'], hashes[block['number']]) for block in blocks]
+
+    def step(self):
+        """Index the next block range. Returns the number of blocks processed."""
+        checkpoint = self.store.get_checkpoint()
+        if checkpoint:
+            fork = self._find_fork_point()
+            if fork is not None:
+                logger.warning(f"Reorg detected, rolling back to block {fork}")
+                self.store.rollback_to(fork)
+                checkpoint = self.store.get_checkpoint()
+        from_block = checkpoint[0] + 1 if checkpoint else self.start_block
+
+        safe_head = self.w3.eth.block_number - self.confirmations
+        if from_block > safe_head:
+            return 0
+        to_block = min(safe_head, from_block + self.batch_size - 1)
+
+        try:
+            logs = self.w3.eth.get_logs({
+                'fromBlock': from_block,
+                'toBlock': to_block,
+                'address': self.addresses
+            })
+        except Exception as e:
+            if self.batch_size == 1:
+                raise
+            self.batch_size = max(1, self.batch_size // 2)
+            logger.warning(f"get_logs failed for {from_block}-{to_block} ({e}), batch size now {self.batch_size}")
+            return 0
+
+        blocks = self._window(from_block, to_block, checkpoint, logs)
+        if blocks is None:
+            logger.warning(f"Chain changed while reading blocks {from_block}-{to_block}, retrying")
+            return 0
+        events = [ev for ev in (self._decode(log) for log in logs) if ev is not None]
+        self.store.apply(events, blocks, keep_blocks=self.reorg_depth)
+        self.batch_size = min(self.max_batch_size, self.batch_size * 2)
+        if events:
+            logger.info(f"Indexed {len(events)} events from blocks {from_block}-{to_block}")
+        return to_block - from_block + 1
+
+    def run(self, poll_interval=5):
+        while True:
+            try:
+                if self.step() == 0:
+                    time.sleep(poll_interval)
+            except Exception as e:
+                logger.error(f"Indexer error: {str(e)}", exc_info=True)
+                time.sleep(poll_interval)
+
+
+def main():
+    load_dotenv()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    from web3 import Web3
+
+    w3 = Web3(Web3.HTTPProvider(os.getenv('WEB3_PROVIDER_URL', 'https://sepolia.base.org')))
+    indexer = ChainIndexer(
+        w3,
+        ChainIndexStore(os.getenv('CHAIN_INDEX_DB', 'chain_index.db')),
+        nft_address=os.environ['MUSIC_NFT_CONTRACT'],
+        distributor_address=os.getenv('REVENUE_DISTRIBUTOR_CONTRACT'),
+        start_block=int(os.getenv('INDEXER_START_BLOCK', '0')),
+        batch_size=int(os.getenv('INDEXER_BATCH_BLOCKS', '2000')),
+        confirmations=int(os.getenv('INDEXER_CONFIRMATIONS', '6'))
+    )
+    indexer.run(poll_interval=float(os.getenv('INDEXER_POLL_INTERVAL', '5')))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+"""
+Trending charts: play counts over the last day, week and month.
+
+Each window counts plays per track in fixed time buckets (hours for the day
+chart, six hours for the week, days for the month). A play is a single add
+to its bucket and to the track's window total; when a bucket slides out of
+the window its counts are subtracted, so totals are exact to the bucket
+size without rescanning history.
+
+The engine tails the `streams` table (with `stream_partitions.StreamCursor`,
+so late commits on Postgres count once), recomputes the top-k of each window
+in the background, and requests are answered from the precomputed lists.
+State is snapshotted to a gzip JSON file, so a restart resumes from the last
+ingested stream instead of replaying history.
+
+Under gunicorn every worker imports the app. Only the worker holding the
+lock file `<snapshot_path>.lock` ingests; it publishes the charts to
+`<snapshot_path>.top.json`, which the other workers reload.
+"""
+import fcntl
+import gzip
+import heapq
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+from stream_partitions import StreamCursor
+
+logger = logging.getLogger(__name__)
+
+# window -> (length, bucket size) in seconds
+WINDOWS = {
+    'day': (86400, 3600),
+    'week': (7 * 86400, 6 * 3600),
+    'month': (30 * 86400, 86400),
+}
+MAX_CHART_SIZE = 200
+SNAPSHOT_FORMAT = 'buckets-v1'
+
+
+class WindowCounter:
+    def __init__(self, length, bucket):
+        self.length = length
+        self.bucket = bucket
+        self.buckets = {}   # bucket start -> {track_id: plays}
+        self.totals = {}    # track_id -> plays in the window
+
+    def add(self, track_id, timestamp, plays=1):
+        start = int(timestamp // self.bucket) * self.bucket
+        counts = self.buckets.setdefault(start, {})
+        counts[track_id] = counts.get(track_id, 0) + plays
+        self.totals[track_id] = self.totals.get(track_id, 0) + plays
+
+    def expire(self, now):
+        """Subtract the buckets that ended before `now - length`."""
+        horizon = now - self.length
+        for start in [s for s in self.buckets if s + self.bucket <= horizon]:
+            for track_id, plays in self.buckets.pop(start).items():
+                remaining = self.totals[track_id] - plays
+                if remaining:
+                    self.totals[track_id] = remaining
+                else:
+                    del self.totals[track_id]
+
+    def top(self, k, now):
+        self.expire(now)
+        return heapq.nlargest(k, self.totals.items(), key=lambda item: (item[1], -item[0]))
+
+    def state(self):
+        return {'buckets': {str(start): counts for start, counts in self.buckets.items()}}
+
+    @classmethod
+    def from_state(cls, length, bucket, data):
+        counter = cls(length, bucket)
+        for start, counts in data['buckets'].items():
+            for track_id, plays in counts.items():
+                counter.add(int(track_id), int(start), plays)
+        return counter
+
+
+def parse_timestamp(value):
+    """SQLite CURRENT_TIMESTAMP text (UTC) or datetime -> unix seconds."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _write_atomic(path, write):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as raw:
+            write(raw)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+
+class ChartsEngine:
+    def __init__(self, db, snapshot_path=None, refresh=30, snapshot_interval=300, ingest_batch=10000):
+        self.db = db
+        self.snapshot_path = snapshot_path
+        self.refresh = refresh
+        self.snapshot_interval = snapshot_interval
+        self.ingest_batch = ingest_batch
+        self.stream = StreamCursor(lag=db.stream_id_lag)
+        self.counters = {name: WindowCounter(*spec) for name, spec in WINDOWS.items()}
+        self._charts = {}   # window -> [(track_id, plays)], best first
+        self._computed_at = None
+        self._published_mtime = None
+        self._lock = threading.Lock()
+        self._lock_file = None
+        self._last_snapshot = time.monotonic()
+        self._thread = None
+
+    @property
+    def top_path(self):
+        return f'{self.snapshot_path}.top.json' if self.snapshot_path else None
+
+    def ingest(self, now=None):
+        """Fold new stream rows into the window counts. Returns rows read."""
+        total = 0
+        while True:
+            rows = self.db.get_stream_events_after(self.stream.start, self.ingest_batch)
+            with self._lock:
+                new = self.stream.advance(rows)
+                for _, track_id, streamed_at in new:
+                    timestamp = parse_timestamp(streamed_at)
+                    for counter in self.counters.values():
+                        counter.add(track_id, timestamp)
+                # Replaying history: drop what is already out of every window as we go
+                for counter in self.counters.values():
+                    counter.expire(now or time.time())
+            total += len(new)
+            if not new or len(rows) < self.ingest_batch:
+                break
+        return total
+
+    def refresh_charts(self, now=None):
+        """Recompute the top of every window."""
+        now = now or time.time()
+        with self._lock:
+            charts = {name: counter.top(MAX_CHART_SIZE, now) for name, counter in self.counters.items()}
+        self._charts = charts
+        self._computed_at = now
+        return charts
+
+    def top(self, window, limit=50):
+        """Top `limit` (track_id, plays) for a window, from the last computed chart."""
+        limit = max(1, min(limit, MAX_CHART_SIZE))
+        return self._charts.get(window, [])[:limit]
+
+    def publish_charts(self):
+        """Write the computed charts for the other workers."""
+        if not self.top_path:
+            return False
+        body = json.dumps({'computed_at': self._computed_at, 'windows': self._charts}).encode()
+        _write_atomic(self.top_path, lambda f: f.write(body))
+        return True
+
+    def load_charts(self):
+        """Reload the charts published by the ingesting worker, if they changed."""
+        try:
+            mtime = os.stat(self.top_path).st_mtime_ns
+        except (OSError, TypeError):
+            return False
+        if mtime == self._published_mtime:
+            return False
+        with open(self.top_path) as f:
+            data = json.load(f)
+        self._charts = {name: [tuple(entry) for entry in chart] for name, chart in data['windows'].items()}
+        self._computed_at = data['computed_at']
+        self._published_mtime = mtime
+        return True
+
+    def load_snapshot(self):
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return False
+        with gzip.open(self.snapshot_path, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('format') != SNAPSHOT_FORMAT:
+            logger.warning(f"Ignoring charts snapshot {self.snapshot_path} in an older format")
+            return False
+        with self._lock:
+            self.stream = StreamCursor.from_state(data, self.stream.lag)
+            for name, saved in data['windows'].items():
+                if name in WINDOWS and saved.get('bucket') == WINDOWS[name][1]:
+                    self.counters[name] = WindowCounter.from_state(*WINDOWS[name], saved)
+        logger.info(f"Loaded charts snapshot at stream {self.stream.last_id}")
+        return True
+
+    def save_snapshot(self, force=False):
+        if not self.snapshot_path:
+            return False
+        if not force and time.monotonic() - self._last_snapshot < self.snapshot_interval:
+            return False
+        with self._lock:
+            data = json.dumps({
+                'format': SNAPSHOT_FORMAT,
+                **self.stream.state(),
+                'windows': {
+                    name: {'bucket': counter.bucket, **counter.state()}
+                    for name, counter in self.counters.items()
+                }
+            })
+
+        def write(raw):
+            with gzip.open(raw, 'wt', encoding='utf-8') as f:
+                f.write(data)
+
+        _write_atomic(self.snapshot_path, write)
+        self._last_snapshot = time.monotonic()
+        return True
+
+    def acquire_ingest_lock(self):
+        """True if this process should ingest: it holds `<snapshot_path>.lock` (or there is no snapshot)."""
+        if self._lock_file is not None or not self.snapshot_path:
+            return True
+        lock_file = open(f'{self.snapshot_path}.lock', 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file   # held until the process exits
+        # Pick up where the previous holder (or this worker's last run) left off
+        self.load_snapshot()
+        return True
+
+    def run_once(self):
+        """One loop step: ingest and publish if this process holds the lock, else reload the published charts."""
+        if not self.acquire_ingest_lock():
+            self.load_charts()
+            return False
+        now = time.time()
+        if self.ingest(now) or self._computed_at is None or now - self._computed_at >= self.refresh:
+            self.refresh_charts(now)
+            self.publish_charts()
+        self.save_snapshot()
+        return True
+
+    def start(self, poll_interval=10):
+        """Ingest (or follow the ingesting worker) in a daemon thread."""
+        def loop():
+            while True:
+                try:
+                    self.run_once()
+                except Exception as e:
+                    logger.error(f"Charts ingest error: {str(e)}", exc_info=True)
+                time.sleep(poll_interval)
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=loop, name='charts-ingest', daemon=True)
+            self._thread.start()
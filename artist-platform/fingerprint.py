@@ -0,0 +1,288 @@
+"""
+Acoustic fingerprinting for copyright pre-screening.
+
+Audio is decoded to mono 11025 Hz, turned into a log-magnitude spectrogram
+with NumPy FFTs, and reduced to a constellation of spectral peaks. Pairs of
+nearby peaks are hashed as (f1, f2, dt) into 32-bit values, so a hash
+survives re-encoding, volume changes and trimming. Hashes are stored in an
+inverted index: hash -> (track_id, time offset).
+
+A query track matches an indexed one when many of its hashes line up at the
+same time offset. Matching reads only the index rows for the query's
+hashes, so it takes milliseconds regardless of catalog size.
+
+WAV files are decoded with the standard library; other formats need
+`ffmpeg` on the PATH.
+
+Backfill the index for existing uploads:  python fingerprint.py
+"""
+import logging
+import os
+import shutil
+import sqlite3
+import subprocess
+import wave
+from collections import Counter, defaultdict
+
+import numpy as np
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 11025
+FRAME_SIZE = 2048
+HOP_SIZE = 512
+# Peaks: local maxima over this many frames / bins, above the frame median
+PEAK_TIME_NEIGHBORHOOD = 9
+PEAK_FREQ_NEIGHBORHOOD = 15
+PEAK_MIN_DB = 10.0
+PEAKS_PER_SECOND = 30
+# Target zone for peak pairs
+FAN_OUT = 5
+MAX_PAIR_DT = 63
+# Only the first few minutes are fingerprinted
+MAX_SECONDS = 300
+
+# Match thresholds: aligned hashes, and aligned / query hashes
+MIN_ALIGNED_HASHES = 20
+EXACT_MATCH_CONFIDENCE = 0.25
+
+
+class AudioDecodeError(Exception):
+    pass
+
+
+def load_audio(path):
+    """Decode `path` to a mono float32 array at SAMPLE_RATE."""
+    if path.lower().endswith('.wav'):
+        try:
+            return _load_wav(path)
+        except (wave.Error, EOFError):
+            pass  # Compressed WAV; let ffmpeg try
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        raise AudioDecodeError(f"Cannot decode {os.path.basename(path)} without ffmpeg")
+    result = subprocess.run(
+        [ffmpeg, '-v', 'error', '-i', path, '-t', str(MAX_SECONDS),
+         '-f', 's16le', '-ac', '1', '-ar', str(SAMPLE_RATE), '-'],
+        capture_output=True, timeout=120
+    )
+    if result.returncode != 0:
+        raise AudioDecodeError(result.stderr.decode(errors='replace').strip() or 'ffmpeg failed')
+    return np.frombuffer(result.stdout, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+def _load_wav(path):
+    with wave.open(path, 'rb') as wav:
+        channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+        frames = wav.readframes(min(wav.getnframes(), rate * MAX_SECONDS))
+    if width not in (1, 2, 4):
+        raise AudioDecodeError(f"Unsupported sample width {width}")
+    dtype = {1: np.uint8, 2: np.int16, 4: np.int32}[width]
+    samples = np.frombuffer(frames, dtype=dtype).astype(np.float32)
+    if width == 1:
+        samples -= 128.0
+    samples /= float(2 ** (8 * width - 1))
+    samples = samples.reshape(-1, channels).mean(axis=1)
+    if rate != SAMPLE_RATE:
+        # Linear resampling is enough for peak positions
+        duration = len(samples) / rate
+        target = np.linspace(0.0, duration, int(duration * SAMPLE_RATE), endpoint=False)
+        samples = np.interp(target, np.arange(len(samples)) / rate, samples).astype(np.float32)
+    return samples
+
+
+def spectrogram(samples):
+    """Log-magnitude STFT, shape (frames, FRAME_SIZE // 2 + 1)."""
+    if len(samples) < FRAME_SIZE:
+        return np.zeros((0, FRAME_SIZE // 2 + 1), dtype=np.float32)
+    frames = np.lib.stride_tricks.sliding_window_view(samples, FRAME_SIZE)[::HOP_SIZE]
+    spectrum = np.abs(np.fft.rfft(frames * np.hanning(FRAME_SIZE).astype(np.float32), axis=1))
+    return 20.0 * np.log10(spectrum + 1e-6)
+
+
+def _sliding_max(values, size, axis):
+    pad = [(0, 0)] * values.ndim
+    pad[axis] = (size // 2, size // 2)
+    padded = np.pad(values, pad, mode='constant', constant_values=-np.inf)
+    return np.lib.stride_tricks.sliding_window_view(padded, size, axis=axis).max(axis=-1)
+
+
+def find_peaks(spec):
+    """Return (frame, bin) arrays of the spectrogram's local maxima, strongest first per second."""
+    if spec.size == 0:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    local_max = _sliding_max(_sliding_max(spec, PEAK_FREQ_NEIGHBORHOOD, 1), PEAK_TIME_NEIGHBORHOOD, 0)
+    floor = np.median(spec, axis=1, keepdims=True) + PEAK_MIN_DB
+    frames, bins = np.nonzero((spec == local_max) & (spec > floor))
+
+    # Keep the strongest peaks so density doesn't depend on loudness
+    budget = int(PEAKS_PER_SECOND * len(spec) * HOP_SIZE / SAMPLE_RATE) + 1
+    if len(frames) > budget:
+        keep = np.argsort(spec[frames, bins])[::-1][:budget]
+        keep.sort()
+        frames, bins = frames[keep], bins[keep]
+    order = np.lexsort((bins, frames))
+    return frames[order], bins[order]
+
+
+def fingerprint(samples):
+    """Return (hashes uint32, offsets int32) for an audio signal."""
+    frames, bins = find_peaks(spectrogram(samples))
+    hashes, offsets = [], []
+    for i in range(len(frames)):
+        paired = 0
+        for j in range(i + 1, len(frames)):
+            dt = frames[j] - frames[i]
+            if dt == 0:
+                continue
+            if dt > MAX_PAIR_DT or paired >= FAN_OUT:
+                break
+            # 10 bits f1 | 10 bits f2 | 6 bits dt
+            hashes.append(((int(bins[i]) & 0x3FF) << 16) | ((int(bins[j]) & 0x3FF) << 6) | int(dt))
+            offsets.append(int(frames[i]))
+            paired += 1
+    return np.asarray(hashes, dtype=np.uint32), np.asarray(offsets, dtype=np.int32)
+
+
+def fingerprint_file(path):
+    return fingerprint(load_audio(path))
+
+
+class FingerprintIndex:
+    """Inverted hash -> (track_id, offset) index in SQLite."""
+
+    def __init__(self, path):
+        self.path = path
+        conn = self.connect()
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS fingerprints (
+                    hash INTEGER NOT NULL,
+                    track_id INTEGER NOT NULL,
+                    offset INTEGER NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_fingerprints_hash ON fingerprints (hash)')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS fingerprinted_tracks (
+                    track_id INTEGER PRIMARY KEY,
+                    hashes INTEGER NOT NULL
+                )
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def add(self, track_id, hashes, offsets):
+        conn = self.connect()
+        try:
+            conn.execute('DELETE FROM fingerprints WHERE track_id = ?', (track_id,))
+            conn.executemany(
+                'INSERT INTO fingerprints (hash, track_id, offset) VALUES (?, ?, ?)',
+                zip(hashes.tolist(), [track_id] * len(hashes), offsets.tolist())
+            )
+            conn.execute(
+                'INSERT OR REPLACE INTO fingerprinted_tracks (track_id, hashes) VALUES (?, ?)',
+                (track_id, len(hashes))
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def remove(self, track_id):
+        conn = self.connect()
+        try:
+            conn.execute('DELETE FROM fingerprints WHERE track_id = ?', (track_id,))
+            conn.execute('DELETE FROM fingerprinted_tracks WHERE track_id = ?', (track_id,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def indexed_track_ids(self):
+        conn = self.connect()
+        try:
+            return {row[0] for row in conn.execute('SELECT track_id FROM fingerprinted_tracks')}
+        finally:
+            conn.close()
+
+    def match(self, hashes, offsets, limit=5, exclude_track_id=None):
+        """
+        Return up to `limit` matches, best first, as dicts with track_id,
+        aligned (hashes at the best common offset), confidence
+        (aligned / query hashes), offset_seconds and exact.
+        """
+        if len(hashes) == 0:
+            return []
+        query_offsets = defaultdict(list)
+        for h, t in zip(hashes.tolist(), offsets.tolist()):
+            query_offsets[h].append(t)
+
+        # One histogram of (db_offset - query_offset) per candidate track
+        deltas = defaultdict(Counter)
+        unique_hashes = list(query_offsets)
+        conn = self.connect()
+        try:
+            for i in range(0, len(unique_hashes), 500):
+                chunk = unique_hashes[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+                for h, track_id, offset in conn.execute(
+                    f'SELECT hash, track_id, offset FROM fingerprints WHERE hash IN ({placeholders})', chunk
+                ):
+                    if track_id == exclude_track_id:
+                        continue
+                    for query_offset in query_offsets[h]:
+                        deltas[track_id][offset - query_offset] += 1
+        finally:
+            conn.close()
+
+        matches = []
+        for track_id, histogram in deltas.items():
+            delta, aligned = histogram.most_common(1)[0]
+            if aligned < MIN_ALIGNED_HASHES:
+                continue
+            confidence = min(1.0, aligned / len(hashes))
+            matches.append({
+                'track_id': track_id,
+                'aligned': aligned,
+                'confidence': round(confidence, 3),
+                'offset_seconds': round(delta * HOP_SIZE / SAMPLE_RATE, 2),
+                'exact': confidence >= EXACT_MATCH_CONFIDENCE
+            })
+        matches.sort(key=lambda m: m['aligned'], reverse=True)
+        return matches[:limit]
+
+
+def main():
+    load_dotenv()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    from models import Database
+
+    db = Database(os.getenv('DATABASE_URL', 'sqlite:///artist_platform.db'))
+    index = FingerprintIndex(os.getenv('FINGERPRINT_DB', 'fingerprints.db'))
+    done = index.indexed_track_ids()
+    indexed = failed = 0
+    for track_id, file_path in db.get_track_files():
+        if track_id in done:
+            continue
+        try:
+            hashes, offsets = fingerprint_file(file_path)
+        except (AudioDecodeError, OSError, subprocess.TimeoutExpired) as e:
+            logger.warning(f"Track {track_id}: {e}")
+            failed += 1
+            continue
+        index.add(track_id, hashes, offsets)
+        indexed += 1
+    logger.info(f"Fingerprinted {indexed} tracks ({failed} failed)")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,18 +4,54 @@ from datetime import datetime
 import bcrypt
 import os
 
+from blockmusic_common import replicas, sql_instrumentation
+
+import search
+import stream_partitions
+
+
+def _connect(url):
+    """Instrumented connection for a `sqlite:///<path>` or Postgres URL."""
+    if url.startswith('sqlite:///'):
+        return sql_instrumentation.wrap(sqlite3.connect(url[len('sqlite:///'):]))
+    return sql_instrumentation.wrap(psycopg2.connect(url))
+
 class Database:
-    def __init__(self, db_url=None):
+    def __init__(self, db_url=None, replica_urls=None):
+        # sqlite:///<path> selects the local SQLite backend
+        if db_url and db_url.startswith('sqlite:///'):
+            self.db_path = db_url[len('sqlite:///'):]
+            db_url = None
+        else:
+            self.db_path = 'artist_platform.db'
         self.db_url = db_url
+        # Ids re-read below a tailing watermark for late commits (stream_partitions.StreamCursor)
+        self.stream_id_lag = stream_partitions.tail_lag(postgres=bool(db_url))
+        # Comma-separated replica URLs, same backend as the primary (replicas.py)
+        self.replicas = replicas.from_env(
+            self.get_db_connection,
+            _connect,
+            replica_urls if replica_urls is not None else os.getenv('DATABASE_REPLICA_URLS'),
+            pin_seconds=float(os.getenv('DB_PIN_SECONDS', '5')),
+            check_interval=float(os.getenv('DB_REPLICA_CHECK_INTERVAL', '10')),
+            lag_query=replicas.POSTGRES_LAG_QUERY if db_url else None,
+            max_lag=float(os.getenv('DB_REPLICA_MAX_LAG', '5'))
+        )
         self.initialize_db()
 
     def get_db_connection(self):
+        # Statements are timed when SQL instrumentation is on (sql_instrumentation.py)
         if self.db_url:
-            return psycopg2.connect(self.db_url)
-        return sqlite3.connect('artist_platform.db')
+            return sql_instrumentation.wrap(psycopg2.connect(self.db_url))
+        return sql_instrumentation.wrap(sqlite3.connect(self.db_path))
+
+    def get_read_connection(self):
+        """Connection for user-facing reads: a replica, unless this client just wrote."""
+        return self.replicas.read_connection()
 
     def initialize_db(self):
-        with sqlite3.connect(self.db_path) as conn:
+        conn = sqlite3.connect(self.db_path)
+        try:
             cursor = conn.cursor()
             
             # Users table
@@ -52,6 +88,17 @@ class Database:
                 )
             ''')
             
+            # Wallet the user's MusicRecommender profile is keyed by
+            cursor.execute('PRAGMA table_info(users)')
+            if 'wallet_address' not in [column[1] for column in cursor.fetchall()]:
+                cursor.execute('ALTER TABLE users ADD COLUMN wallet_address TEXT')
+            
+            # Content hash of the audio file, used to deduplicate bulk imports
+            cursor.execute('PRAGMA table_info(tracks)')
+            if 'content_hash' not in [column[1] for column in cursor.fetchall()]:
+                cursor.execute('ALTER TABLE tracks ADD COLUMN content_hash TEXT')
+            cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_tracks_content_hash ON tracks (content_hash)')
+            
             # Albums table
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS albums (
@@ -81,23 +128,91 @@ class Database:
                 )
             ''')
             
-            # Streams table
+            # Streams, partitioned by month (stream_partitions.py)
+            stream_partitions.create_schema(cursor)
+            
+            # Hash of the last listening profile pushed to MusicRecommender per user
             cursor.execute('''
-                CREATE TABLE IF NOT EXISTS streams (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    track_id INTEGER NOT NULL,
-                    date_streamed DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (id),
+                CREATE TABLE IF NOT EXISTS pushed_profiles (
+                    user_id INTEGER PRIMARY KEY,
+                    profile_hash TEXT NOT NULL,
+                    pushed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Track -> MusicNFT token id and payout address (set once a track is minted)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS track_tokens (
+                    track_id INTEGER PRIMARY KEY,
+                    token_id INTEGER UNIQUE NOT NULL,
+                    artist_address TEXT,
                     FOREIGN KEY (track_id) REFERENCES tracks (id)
                 )
             ''')
+            
+            # Tracks waiting to be submitted to GenLayer moderation
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS moderation_queue (
+                    track_id INTEGER PRIMARY KEY,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    date_queued DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (track_id) REFERENCES tracks (id)
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_moderation_queue_status ON moderation_queue (status)')
+            
+            # Full-text search index (search.py)
+            search.create_schema(cursor)
+            search.rebuild(cursor)
             conn.commit()
         finally:
             conn.close()
+        
+        if self.db_url:
+            conn = psycopg2.connect(self.db_url)
+            try:
+                cursor = conn.cursor()
+                self._create_postgres_schema(cursor)
+                stream_partitions.create_schema(cursor, postgres=True)
+                conn.commit()
+            finally:
+                conn.close()
+
+    def _create_postgres_schema(self, cursor):
+        """
+        Columns and tables the Postgres branches below rely on.
+
+        `users` and `tracks` are expected to exist already; this only adds
+        what the bulk importer, profile push and settlement introduced.
+        """
+        cursor.execute('ALTER TABLE users ADD COLUMN IF NOT EXISTS wallet_address TEXT')
+        cursor.execute('ALTER TABLE tracks ADD COLUMN IF NOT EXISTS content_hash TEXT')
+        cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_tracks_content_hash ON tracks (content_hash)')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS pushed_profiles (
+                user_id INTEGER PRIMARY KEY,
+                profile_hash TEXT NOT NULL,
+                pushed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS track_tokens (
+                track_id INTEGER PRIMARY KEY REFERENCES tracks (id),
+                token_id BIGINT UNIQUE NOT NULL,
+                artist_address TEXT
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS moderation_queue (
+                track_id INTEGER PRIMARY KEY REFERENCES tracks (id),
+                status TEXT NOT NULL DEFAULT 'pending',
+                date_queued TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_moderation_queue_status ON moderation_queue (status)')
 
     def get_user_by_id(self, user_id):
-        conn = self.get_db_connection()
+        conn = self.get_read_connection()
         try:
             cursor = conn.cursor()
             if self.db_url:
@@ -119,7 +234,7 @@ class Database:
         finally:
             conn.close()
     def get_user_by_username(self, username):
-        conn = self.get_db_connection()
+        conn = self.get_read_connection()
         try:
             cursor = conn.cursor()
             if self.db_url:
@@ -141,24 +256,28 @@ class Database:
         finally:
             conn.close()
 
-    def create_user(self, username, email, password, is_artist=False):
+    def create_user(self, username, email, password, is_artist=False, wallet_address=None):
         conn = self.get_db_connection()
         try:
             cursor = conn.cursor()
             password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
             if self.db_url:
                 cursor.execute('''
-                    INSERT INTO users (username, email, password_hash, is_artist)
-                    VALUES (%s, %s, %s, %s)
+                    INSERT INTO users (username, email, password_hash, is_artist, wallet_address)
+                    VALUES (%s, %s, %s, %s, %s)
                     RETURNING id
-                ''', (username, email, password_hash, is_artist))
-                return cursor.fetchone()[0]
+                ''', (username, email, password_hash, is_artist, wallet_address))
+                user_id = cursor.fetchone()[0]
+                conn.commit()
+                self.replicas.mark_write()
+                return user_id
             else:
                 cursor.execute('''
-                    INSERT INTO users (username, email, password_hash, is_artist)
-                    VALUES (?, ?, ?, ?)
-                ''', (username, email, password_hash, is_artist))
+                    INSERT INTO users (username, email, password_hash, is_artist, wallet_address)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (username, email, password_hash, is_artist, wallet_address))
                 conn.commit()
+                self.replicas.mark_write()
                 return cursor.lastrowid
         finally:
             conn.close()
@@ -170,41 +289,401 @@ class Database:
         return False
 
     def create_track(self, title, description, genre, duration, price, file_path, artist_id, album_id=None):
-        with sqlite3.connect(self.db_path) as conn:
+        with sql_instrumentation.wrap(sqlite3.connect(self.db_path)) as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO tracks (title, description, genre, duration, price, file_path, artist_id, album_id)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             ''', (title, description, genre, duration, price, file_path, artist_id, album_id))
+            track_id = cursor.lastrowid
+            search.index_tracks(cursor, [track_id])
             conn.commit()
-            return cursor.lastrowid
+            self.replicas.mark_write()
+            return track_id
 
     def get_tracks(self):
-        with sqlite3.connect(self.db_path) as conn:
+        """Return (id, title, artist_name, genre, duration, price, plays, cover_art) for every track."""
+        conn = self.get_read_connection()
+        try:
             cursor = conn.cursor()
+            # Explicit columns: migrations append to `tracks`, so positions in t.* are not stable
             cursor.execute('''
-                SELECT t.*, u.username as artist_name 
+                SELECT t.id, t.title, u.username, t.genre, t.duration, t.price, t.plays, t.cover_art
                 FROM tracks t
                 JOIN users u ON t.artist_id = u.id
             ''')
             return cursor.fetchall()
+        finally:
+            conn.close()
 
     def create_subscription(self, user_id, artist_id, amount):
-        with sqlite3.connect(self.db_path) as conn:
+        with sql_instrumentation.wrap(sqlite3.connect(self.db_path)) as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO subscriptions (user_id, artist_id, amount)
                 VALUES (?, ?, ?)
             ''', (user_id, artist_id, amount))
             conn.commit()
+            self.replicas.mark_write()
             return cursor.lastrowid
 
     def create_stream(self, user_id, track_id):
-        with sqlite3.connect(self.db_path) as conn:
+        conn = self.get_db_connection()
+        try:
+            stream_id = stream_partitions.insert_stream(conn.cursor(), user_id, track_id, postgres=bool(self.db_url))
+            conn.commit()
+            self.replicas.mark_write()
+            return stream_id
+        finally:
+            conn.close()
+
+    def get_streams_after(self, last_stream_id, limit=10000):
+        """
+        Return (id, track_id) for streams newer than last_stream_id, oldest
+        first. Ids can commit out of order on Postgres; tail with a
+        `stream_partitions.StreamCursor`, as do the other `*_after` readers.
+        """
+        conn = self.get_db_connection()
+        try:
             cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO streams (user_id, track_id)
-                VALUES (?, ?)
-            ''', (user_id, track_id))
+            if self.db_url:
+                cursor.execute('''
+                    SELECT id, track_id FROM streams WHERE id > %s ORDER BY id LIMIT %s
+                ''', (last_stream_id, limit))
+            else:
+                cursor.execute('''
+                    SELECT id, track_id FROM streams WHERE id > ? ORDER BY id LIMIT ?
+                ''', (last_stream_id, limit))
+            return cursor.fetchall()
+        finally:
+            conn.close()
+
+    def get_stream_events_after(self, last_stream_id, limit=10000):
+        """Return (id, track_id, date_streamed) for streams newer than last_stream_id, oldest first."""
+        conn = self.get_db_connection()
+        try:
+            cursor = conn.cursor()
+            query = '''
+                SELECT id, track_id, date_streamed FROM streams WHERE id > {p} ORDER BY id LIMIT {p}
+            '''
+            if self.db_url:
+                cursor.execute(query.format(p='%s'), (last_stream_id, limit))
+            else:
+                cursor.execute(query.format(p='?'), (last_stream_id, limit))
+            return cursor.fetchall()
+        finally:
+            conn.close()
+
+    def get_stream_facts_after(self, last_stream_id, limit=50000):
+        """Return (id, track_id, artist_id, price, date_streamed) for streams newer than last_stream_id."""
+        conn = self.get_db_connection()
+        try:
+            cursor = conn.cursor()
+            query = '''
+                SELECT s.id, s.track_id, t.artist_id, t.price, s.date_streamed
+                FROM streams s
+                JOIN tracks t ON t.id = s.track_id
+                WHERE s.id > {p}
+                ORDER BY s.id
+                LIMIT {p}
+            '''
+            if self.db_url:
+                cursor.execute(query.format(p='%s'), (last_stream_id, limit))
+            else:
+                cursor.execute(query.format(p='?'), (last_stream_id, limit))
+            return cursor.fetchall()
+        finally:
+            conn.close()
+
+    def get_listens_after(self, last_stream_id, limit=100000):
+        """Return (id, user_id, track_id) for streams newer than last_stream_id, oldest first."""
+        conn = self.get_db_connection()
+        try:
+            cursor = conn.cursor()
+            query = '''
+                SELECT id, user_id, track_id FROM streams WHERE id > {p} ORDER BY id LIMIT {p}
+            '''
+            if self.db_url:
+                cursor.execute(query.format(p='%s'), (last_stream_id, limit))
+            else:
+                cursor.execute(query.format(p='?'), (last_stream_id, limit))
+            return cursor.fetchall()
+        finally:
+            conn.close()
+
+    def get_listening_profiles(self, user_ids, recent_limit=20):
+        """
+        Listening history for users with a wallet address, from `streams`.
+
+        Returns {user_id: {'wallet_address', 'genres': {genre: plays},
+        'artists': {artist_name: plays}, 'recent': [track_id, ...]}} with
+        recent tracks distinct and most recent first.
+        """
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        conn = self.get_db_connection()
+        try:
+            cursor = conn.cursor()
+            if self.db_url:
+                p, condition, params = '%s', '= ANY(%s)', (user_ids,)
+            else:
+                p, condition, params = '?', f"IN ({','.join('?' * len(user_ids))})", user_ids
+
+            cursor.execute(f'''
+                SELECT id, wallet_address FROM users
+                WHERE id {condition} AND wallet_address IS NOT NULL AND wallet_address != ''
+            ''', params)
+            profiles = {
+                user_id: {'wallet_address': wallet, 'genres': {}, 'artists': {}, 'recent': []}
+                for user_id, wallet in cursor.fetchall()
+            }
+            if not profiles:
+                return {}
+            if self.db_url:
+                params = (list(profiles),)
+            else:
+                params = list(profiles)
+                condition = f"IN ({','.join('?' * len(params))})"
+
+            cursor.execute(f'''
+                SELECT s.user_id, t.genre, u.username, COUNT(*)
+                FROM streams s
+                JOIN tracks t ON t.id = s.track_id
+                LEFT JOIN users u ON u.id = t.artist_id
+                WHERE s.user_id {condition}
+                GROUP BY s.user_id, t.genre, u.username
+            ''', params)
+            for user_id, genre, artist, plays in cursor.fetchall():
+                profile = profiles[user_id]
+                if genre:
+                    profile['genres'][genre] = profile['genres'].get(genre, 0) + plays
+                if artist:
+                    profile['artists'][artist] = profile['artists'].get(artist, 0) + plays
+
+            cursor.execute(f'''
+                SELECT user_id, track_id, MAX(id) AS last_id
+                FROM streams
+                WHERE user_id {condition}
+                GROUP BY user_id, track_id
+                ORDER BY user_id, last_id DESC
+            ''', params)
+            for user_id, track_id, _ in cursor.fetchall():
+                recent = profiles[user_id]['recent']
+                if len(recent) < recent_limit:
+                    recent.append(track_id)
+            return profiles
+        finally:
+            conn.close()
+
+    def get_pushed_profile_hashes(self, user_ids):
+        """Map user ids to the hash of the profile last pushed on chain."""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        conn = self.get_db_connection()
+        try:
+            cursor = conn.cursor()
+            if self.db_url:
+                cursor.execute(
+                    'SELECT user_id, profile_hash FROM pushed_profiles WHERE user_id = ANY(%s)', (user_ids,)
+                )
+            else:
+                placeholders = ','.join('?' * len(user_ids))
+                cursor.execute(
+                    f'SELECT user_id, profile_hash FROM pushed_profiles WHERE user_id IN ({placeholders})',
+                    user_ids
+                )
+            return dict(cursor.fetchall())
+        finally:
+            conn.close()
+
+    def set_pushed_profile_hashes(self, hashes):
+        """Record {user_id: profile_hash} as pushed."""
+        conn = self.get_db_connection()
+        try:
+            cursor = conn.cursor()
+            if self.db_url:
+                cursor.executemany('''
+                    INSERT INTO pushed_profiles (user_id, profile_hash, pushed_at) VALUES (%s, %s, CURRENT_TIMESTAMP)
+                    ON CONFLICT (user_id) DO UPDATE
+                    SET profile_hash = EXCLUDED.profile_hash, pushed_at = EXCLUDED.pushed_at
+                ''', list(hashes.items()))
+            else:
+                cursor.executemany('''
+                    INSERT OR REPLACE INTO pushed_profiles (user_id, profile_hash, pushed_at)
+                    VALUES (?, ?, CURRENT_TIMESTAMP)
+                ''', list(hashes.items()))
             conn.commit()
-            return cursor.lastrowid
+        finally:
+            conn.close()
+
+    def get_track_files(self):
+        """Return (id, file_path) for every track."""
+        conn = self.get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT id, file_path FROM tracks ORDER BY id')
+            return cursor.fetchall()
+        finally:
+            conn.close()
+
+    def get_track_summaries(self, track_ids):
+        """Map track ids to (title, genre, artist_name, cover_art)."""
+        track_ids = list(track_ids)
+        if not track_ids:
+            return {}
+        conn = self.get_db_connection()
+        try:
+            cursor = conn.cursor()
+            query = '''
+                SELECT t.id, t.title, t.genre, u.username, t.cover_art
+                FROM tracks t
+                LEFT JOIN users u ON u.id = t.artist_id
+                WHERE t.id {condition}
+            '''
+            if self.db_url:
+                cursor.execute(query.format(condition='= ANY(%s)'), (track_ids,))
+            else:
+                placeholders = ','.join('?' * len(track_ids))
+                cursor.execute(query.format(condition=f'IN ({placeholders})'), track_ids)
+            return {row[0]: row[1:] for row in cursor.fetchall()}
+        finally:
+            conn.close()
+
+    def set_track_token_id(self, track_id, token_id, artist_address=None):
+        conn = self.get_db_connection()
+        try:
+            cursor = conn.cursor()
+            if self.db_url:
+                cursor.execute('''
+                    INSERT INTO track_tokens (track_id, token_id, artist_address) VALUES (%s, %s, %s)
+                    ON CONFLICT (track_id) DO UPDATE
+                    SET token_id = EXCLUDED.token_id, artist_address = EXCLUDED.artist_address
+                ''', (track_id, token_id, artist_address))
+            else:
+                cursor.execute('''
+                    INSERT OR REPLACE INTO track_tokens (track_id, token_id, artist_address) VALUES (?, ?, ?)
+                ''', (track_id, token_id, artist_address))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get_track_token_ids(self, track_ids):
+        """Map track ids to MusicNFT token ids. Unminted tracks are omitted."""
+        track_ids = list(track_ids)
+        if not track_ids:
+            return {}
+        conn = self.get_db_connection()
+        try:
+            cursor = conn.cursor()
+            if self.db_url:
+                cursor.execute(
+                    'SELECT track_id, token_id FROM track_tokens WHERE track_id = ANY(%s)',
+                    (track_ids,)
+                )
+            else:
+                placeholders = ','.join('?' * len(track_ids))
+                cursor.execute(
+                    f'SELECT track_id, token_id FROM track_tokens WHERE track_id IN ({placeholders})',
+                    track_ids
+                )
+            return dict(cursor.fetchall())
+        finally:
+            conn.close()
+
+    def bulk_create_tracks(self, rows, enqueue_moderation=False):
+        """
+        Insert many tracks in one transaction.
+
+        `rows` are (title, description, genre, duration, price, file_path,
+        artist_id, album_id, content_hash). Rows whose content_hash already
+        exists are skipped. Returns the number of tracks inserted.
+        """
+        if not rows:
+            return 0
+        conn = self.get_db_connection()
+        try:
+            cursor = conn.cursor()
+            hashes = [row[8] for row in rows]
+            if self.db_url:
+                cursor.executemany('''
+                    INSERT INTO tracks (title, description, genre, duration, price, file_path,
+                                        artist_id, album_id, content_hash)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (content_hash) DO NOTHING
+                ''', rows)
+                inserted = cursor.rowcount
+                if enqueue_moderation:
+                    cursor.execute('''
+                        INSERT INTO moderation_queue (track_id)
+                        SELECT id FROM tracks WHERE content_hash = ANY(%s)
+                        ON CONFLICT (track_id) DO NOTHING
+                    ''', (hashes,))
+            else:
+                before = conn.total_changes
+                cursor.executemany('''
+                    INSERT OR IGNORE INTO tracks (title, description, genre, duration, price, file_path,
+                                                  artist_id, album_id, content_hash)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', rows)
+                inserted = conn.total_changes - before
+                placeholders = ','.join('?' * len(hashes))
+                if enqueue_moderation:
+                    cursor.execute(f'''
+                        INSERT OR IGNORE INTO moderation_queue (track_id)
+                        SELECT id FROM tracks WHERE content_hash IN ({placeholders})
+                    ''', hashes)
+                if inserted:
+                    cursor.execute(
+                        f'SELECT id FROM tracks WHERE content_hash IN ({placeholders})', hashes
+                    )
+                    search.index_tracks(cursor, [row[0] for row in cursor.fetchall()])
+            conn.commit()
+            return inserted
+        finally:
+            conn.close()
+
+    def get_pending_moderation(self, limit=100):
+        """Return (track_id, title, description, genre, artist_name) for queued tracks, oldest first."""
+        conn = self.get_db_connection()
+        try:
+            cursor = conn.cursor()
+            query = '''
+                SELECT t.id, t.title, t.description, t.genre, u.username
+                FROM moderation_queue q
+                JOIN tracks t ON t.id = q.track_id
+                LEFT JOIN users u ON u.id = t.artist_id
+                WHERE q.status = 'pending'
+                ORDER BY q.track_id
+                LIMIT {p}
+            '''
+            if self.db_url:
+                cursor.execute(query.format(p='%s'), (limit,))
+            else:
+                cursor.execute(query.format(p='?'), (limit,))
+            return cursor.fetchall()
+        finally:
+            conn.close()
+
+    def set_moderation_status(self, track_ids, status):
+        track_ids = list(track_ids)
+        if not track_ids:
+            return
+        conn = self.get_db_connection()
+        try:
+            cursor = conn.cursor()
+            if self.db_url:
+                cursor.execute(
+                    'UPDATE moderation_queue SET status = %s WHERE track_id = ANY(%s)',
+                    (status, track_ids)
+                )
+            else:
+                placeholders = ','.join('?' * len(track_ids))
+                cursor.execute(
+                    f'UPDATE moderation_queue SET status = ? WHERE track_id IN ({placeholders})',
+                    [status] + track_ids
+                )
+            conn.commit()
+        finally:
+            conn.close()
@@ -0,0 +1,316 @@
+"""
+Off-chain play aggregator for MusicNFT play counts.
+
+Tails the `streams` table, accumulates per-track play deltas in memory and
+periodically flushes them on chain, so gas and RPC cost scale with the number
+of tracks played in a period rather than the number of plays.
+
+State (the stream watermark, unflushed deltas and transactions that were
+signed but not yet confirmed) is checkpointed to a JSON file after every
+step, so a restart neither loses nor double-counts plays. Streams are tailed
+with `stream_partitions.StreamCursor`, so rows committed out of id order on
+Postgres are still counted once.
+
+A track whose update fails is retried in a transaction of its own, so one
+bad token can't keep reverting a whole batch. After `max_failures` failed
+transactions in a row its plays stay pending but are no longer sent; remove
+the track from `failures` in the checkpoint to retry it.
+
+Run as a worker:  python play_aggregator.py
+"""
+import json
+import logging
+import os
+import tempfile
+import time
+from collections import Counter
+
+from dotenv import load_dotenv
+
+from models import Database
+from stream_partitions import StreamCursor
+
+logger = logging.getLogger(__name__)
+
+MUSIC_NFT_ABI = [
+    {
+        "name": "incrementPlayCount",
+        "type": "function",
+        "stateMutability": "nonpayable",
+        "inputs": [
+            {"name": "tokenId", "type": "uint256"},
+            {"name": "plays", "type": "uint256"}
+        ],
+        "outputs": []
+    },
+    {
+        "name": "batchIncrementPlayCount",
+        "type": "function",
+        "stateMutability": "nonpayable",
+        "inputs": [
+            {"name": "tokenIds", "type": "uint256[]"},
+            {"name": "plays", "type": "uint256[]"}
+        ],
+        "outputs": []
+    }
+]
+
+
+class PlayCheckpoint:
+    """Durable aggregator state stored as a JSON file (replaced atomically)."""
+
+    def __init__(self, path, lag=0):
+        self.path = path
+        self.stream = StreamCursor(lag=lag)
+        self.pending = Counter()   # track_id -> unflushed plays
+        self.inflight = []         # [{"tx_hash", "deltas": {track_id: plays}}]
+        self.failures = Counter()  # track_id -> failed transactions in a row
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            data = json.load(f)
+        self.stream = StreamCursor.from_state(data, self.stream.lag)
+        self.pending = Counter({int(k): v for k, v in data.get('pending', {}).items()})
+        self.inflight = [
+            {'tx_hash': tx['tx_hash'], 'deltas': {int(k): v for k, v in tx['deltas'].items()}}
+            for tx in data.get('inflight', [])
+        ]
+        self.failures = Counter({int(k): v for k, v in data.get('failures', {}).items()})
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({
+                    **self.stream.state(),
+                    'pending': self.pending,
+                    'inflight': self.inflight,
+                    'failures': self.failures
+                }, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+
+class MusicNFTPlaySink:
+    """
+    Sends play-count updates to MusicNFT from the owner wallet.
+
+    In "batch" mode each transaction carries up to `chunk_size` tokens via
+    `batchIncrementPlayCount`; in "single" mode (contracts deployed before
+    that function existed) one `incrementPlayCount` is sent per token.
+    """
+
+    def __init__(self, provider_url, contract_address, private_key, mode='batch', chunk_size=200):
+        from web3 import Web3
+
+        self.w3 = Web3(Web3.HTTPProvider(provider_url))
+        self.account = self.w3.eth.account.from_key(private_key)
+        self.contract = self.w3.eth.contract(
+            address=Web3.to_checksum_address(contract_address),
+            abi=MUSIC_NFT_ABI
+        )
+        self.mode = mode
+        self.chunk_size = chunk_size if mode == 'batch' else 1
+        self._nonce = None
+
+    def sign(self, token_deltas):
+        """Sign one transaction for a chunk of {token_id: plays}. Returns (tx_hash, raw_tx)."""
+        token_ids = list(token_deltas)
+        if self.mode == 'batch':
+            call = self.contract.functions.batchIncrementPlayCount(
+                token_ids, [token_deltas[t] for t in token_ids]
+            )
+        else:
+            call = self.contract.functions.incrementPlayCount(token_ids[0], token_deltas[token_ids[0]])
+
+        if self._nonce is None:
+            self._nonce = self.w3.eth.get_transaction_count(self.account.address, 'pending')
+        tx = call.build_transaction({
+            'from': self.account.address,
+            'nonce': self._nonce,
+            'chainId': self.w3.eth.chain_id
+        })
+        signed = self.account.sign_transaction(tx)
+        self._nonce += 1
+        return signed.hash.hex(), signed.rawTransaction
+
+    def send(self, raw_tx):
+        try:
+            self.w3.eth.send_raw_transaction(raw_tx)
+        except Exception:
+            # Nonce may now be out of sync with the node; refetch on next sign
+            self._nonce = None
+            raise
+
+    def status(self, tx_hash):
+        """
+        Return True (mined OK), False (reverted, or dropped by the node) or
+        None (still pending). Polls once; never waits for the receipt.
+        """
+        from web3.exceptions import TransactionNotFound
+
+        try:
+            receipt = self.w3.eth.get_transaction_receipt(tx_hash)
+        except TransactionNotFound:
+            try:
+                self.w3.eth.get_transaction(tx_hash)
+                return None
+            except TransactionNotFound:
+                # Dropped: its nonce is free again, and nothing after it can be
+                # mined until it's reused, so refetch the nonce on next sign
+                self._nonce = None
+                return False
+        return receipt['status'] == 1
+
+
+class PlayAggregator:
+    def __init__(self, db, sink, checkpoint, ingest_batch=10000, max_failures=3):
+        self.db = db
+        self.sink = sink
+        self.checkpoint = checkpoint
+        self.ingest_batch = ingest_batch
+        self.max_failures = max_failures
+
+    def ingest(self):
+        """Fold all new stream rows into the pending deltas. Returns rows read."""
+        total = 0
+        stream = self.checkpoint.stream
+        while True:
+            rows = self.db.get_streams_after(stream.start, self.ingest_batch)
+            new = stream.advance(rows)
+            if new:
+                self.checkpoint.pending.update(track_id for _, track_id in new)
+                self.checkpoint.save()
+                total += len(new)
+            if not new or len(rows) < self.ingest_batch:
+                break
+        return total
+
+    def _settle_inflight(self):
+        """
+        Resolve transactions from a previous flush; failed ones are requeued.
+        Returns the number of failed transactions.
+        """
+        failures = self.checkpoint.failures
+        still_pending = []
+        failed = 0
+        for tx in self.checkpoint.inflight:
+            status = self.sink.status(tx['tx_hash'])
+            if status is None:
+                still_pending.append(tx)
+            elif status:
+                for t in tx['deltas']:
+                    failures.pop(t, None)
+            else:
+                logger.warning(f"Play update {tx['tx_hash']} failed, requeueing {len(tx['deltas'])} tracks")
+                failed += 1
+                self.checkpoint.pending.update(tx['deltas'])
+                for t in tx['deltas']:
+                    failures[t] += 1
+                    if failures[t] == self.max_failures:
+                        logger.error(f"Play updates for track {t} failed {failures[t]} times; holding its "
+                                     f"plays until it is removed from failures in {self.checkpoint.path}")
+        self.checkpoint.inflight = still_pending
+        self.checkpoint.save()
+        return failed
+
+    def flush(self):
+        """Push pending deltas on chain. Returns the number of transactions sent."""
+        self._settle_inflight()
+        failures = self.checkpoint.failures
+        # Transactions still pending may be queued behind a dropped nonce, so
+        # requeued tracks are re-signed (at that nonce) without waiting for them
+        retry = any(0 < failures[t] < self.max_failures for t in self.checkpoint.pending)
+        if self.checkpoint.inflight and not retry:
+            logger.info("Previous play updates still pending, skipping flush")
+            return 0
+
+        track_ids = [t for t, plays in self.checkpoint.pending.items() if plays > 0]
+        token_ids = {}
+        for i in range(0, len(track_ids), 500):
+            token_ids.update(self.db.get_track_token_ids(track_ids[i:i + 500]))
+
+        # Tracks that have not been minted yet stay pending until they are
+        ready = [t for t in track_ids if t in token_ids and failures[t] < self.max_failures]
+        # Tracks from a failed transaction go alone, so they can't revert anyone else's update
+        healthy = [t for t in ready if not failures[t]]
+        chunks = [healthy[i:i + self.sink.chunk_size] for i in range(0, len(healthy), self.sink.chunk_size)]
+        chunks += [[t] for t in ready if failures[t]]
+        sent = 0
+        for chunk in chunks:
+            deltas = {t: self.checkpoint.pending[t] for t in chunk}
+            tx_hash, raw_tx = self.sink.sign({token_ids[t]: plays for t, plays in deltas.items()})
+
+            # Record the signed tx before broadcasting so a crash can't double-count
+            for t in chunk:
+                del self.checkpoint.pending[t]
+            self.checkpoint.inflight.append({'tx_hash': tx_hash, 'deltas': deltas})
+            self.checkpoint.save()
+
+            try:
+                self.sink.send(raw_tx)
+            except Exception:
+                self.checkpoint.inflight.pop()
+                self.checkpoint.pending.update(deltas)
+                self.checkpoint.save()
+                raise
+            sent += 1
+
+        if sent:
+            logger.info(f"Sent {sent} play update transaction(s) for {len(ready)} tracks")
+        self._settle_inflight()
+        return sent
+
+    def run(self, poll_interval=30, flush_interval=3600):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                rows = self.ingest()
+                if rows:
+                    logger.info(f"Ingested {rows} plays, {len(self.checkpoint.pending)} tracks pending")
+                if time.monotonic() - last_flush >= flush_interval:
+                    self.flush()
+                    last_flush = time.monotonic()
+                elif self.checkpoint.inflight and self._settle_inflight():
+                    self.flush()
+            except Exception as e:
+                logger.error(f"Play aggregation error: {str(e)}", exc_info=True)
+            time.sleep(poll_interval)
+
+
+def main():
+    load_dotenv()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    db = Database(os.getenv('DATABASE_URL', 'sqlite:///artist_platform.db'))
+    checkpoint = PlayCheckpoint(os.getenv('PLAY_CHECKPOINT_PATH', 'play_aggregator.checkpoint.json'),
+                                lag=db.stream_id_lag)
+    checkpoint.load()
+    sink = MusicNFTPlaySink(
+        provider_url=os.getenv('WEB3_PROVIDER_URL', 'https://sepolia.base.org'),
+        contract_address=os.environ['MUSIC_NFT_CONTRACT'],
+        private_key=os.environ['PRIVATE_KEY'],
+        mode=os.getenv('PLAY_FLUSH_MODE', 'batch'),
+        chunk_size=int(os.getenv('PLAY_FLUSH_CHUNK', '200'))
+    )
+    aggregator = PlayAggregator(db, sink, checkpoint,
+                                max_failures=int(os.getenv('PLAY_MAX_FAILURES', '3')))
+    aggregator.run(
+        poll_interval=float(os.getenv('PLAY_POLL_INTERVAL', '30')),
+        flush_interval=float(os.getenv('PLAY_FLUSH_INTERVAL', '3600'))
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""
+Listening-profile pushes to MusicRecommender.
+
+Tails `streams` for users who listened since the last run, rebuilds their
+profile from history (top genres and artists by plays, latest distinct
+tracks) and compares it with the hash of the profile last pushed. Only
+users whose profile actually changed are sent, many per request, to the
+GenLayer API's `/profiles:batch`. For now that updates the API's
+recommendation store only; the on-chain `update_user_profiles` write waits
+for the GenLayer SDK.
+
+The stream watermark advances only after every changed profile has been
+pushed, so a failed run is retried from the same point; the hash diff
+makes the retry skip whatever already went through. Each run also re-reads
+the `Database.stream_id_lag` ids below the watermark, which picks up
+streams committed out of id order on Postgres; users seen twice just hash
+to an unchanged profile.
+
+Run as a worker:  python profile_builder.py
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+TOP_GENRES = 5
+TOP_ARTISTS = 5
+RECENT_TRACKS = 20
+# Users per profile query / per update_user_profiles transaction
+QUERY_BATCH = 500
+PUSH_BATCH = 100
+
+
+def _top(counts, n):
+    """Names by descending plays, ties alphabetical so the result is stable."""
+    return [name for name, _ in sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:n]]
+
+
+def build_profile(history):
+    """Contract profile fields from a `Database.get_listening_profiles` entry."""
+    return {
+        'user_address': history['wallet_address'].lower(),
+        'genres_listened': ', '.join(_top(history['genres'], TOP_GENRES)),
+        'favorite_artists': ', '.join(_top(history['artists'], TOP_ARTISTS)),
+        'recent_tracks': ','.join(str(t) for t in history['recent'][:RECENT_TRACKS]),
+        'listening_mood': ''
+    }
+
+
+def profile_hash(profile):
+    return hashlib.sha256(json.dumps(profile, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ProfileBuilder:
+    def __init__(self, db, api_url, state_path, push_batch=PUSH_BATCH):
+        self.db = db
+        self.api_url = api_url.rstrip('/')
+        self.state_path = state_path
+        self.push_batch = push_batch
+
+    @property
+    def last_stream_id(self):
+        if not os.path.exists(self.state_path):
+            return 0
+        with open(self.state_path) as f:
+            return json.load(f)['last_stream_id']
+
+    def _save_state(self, last_stream_id):
+        directory = os.path.dirname(os.path.abspath(self.state_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'last_stream_id': last_stream_id}, f)
+            os.replace(tmp_path, self.state_path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    def changed_users(self, batch_size=100000):
+        """(users who streamed since the watermark, newest stream id)."""
+        last_id = self.last_stream_id
+        after = max(0, last_id - self.db.stream_id_lag)
+        users = set()
+        while True:
+            rows = self.db.get_listens_after(after, batch_size)
+            if not rows:
+                break
+            users.update(user_id for _, user_id, _ in rows)
+            after = rows[-1][0]
+        return users, max(last_id, after)
+
+    def push(self, profiles):
+        import requests
+
+        response = requests.post(f'{self.api_url}/profiles:batch', json={'profiles': profiles}, timeout=60)
+        response.raise_for_status()
+
+    def run_once(self):
+        """Push changed profiles. Returns (users checked, profiles pushed)."""
+        users, last_id = self.changed_users()
+        if not users:
+            return 0, 0
+        users = sorted(users)
+        pushed = 0
+        for i in range(0, len(users), QUERY_BATCH):
+            histories = self.db.get_listening_profiles(users[i:i + QUERY_BATCH], recent_limit=RECENT_TRACKS)
+            previous = self.db.get_pushed_profile_hashes(histories)
+            changed = {}
+            for user_id, history in histories.items():
+                profile = build_profile(history)
+                digest = profile_hash(profile)
+                if previous.get(user_id) != digest:
+                    changed[user_id] = (profile, digest)
+
+            pending = list(changed.items())
+            for j in range(0, len(pending), self.push_batch):
+                chunk = pending[j:j + self.push_batch]
+                self.push([profile for _, (profile, _) in chunk])
+                self.db.set_pushed_profile_hashes({user_id: digest for user_id, (_, digest) in chunk})
+                pushed += len(chunk)
+
+        self._save_state(last_id)
+        return len(users), pushed
+
+    def run(self, poll_interval=300):
+        while True:
+            try:
+                checked, pushed = self.run_once()
+                if checked:
+                    logger.info(f"Checked {checked} listeners, pushed {pushed} changed profiles")
+            except Exception as e:
+                logger.error(f"Profile push error: {str(e)}", exc_info=True)
+            time.sleep(poll_interval)
+
+
+def main():
+    load_dotenv()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    from models import Database
+
+    api_url = os.getenv('GENLAYER_API_URL')
+    if not api_url:
+        raise SystemExit('GENLAYER_API_URL is not set')
+    builder = ProfileBuilder(
+        Database(os.getenv('DATABASE_URL', 'sqlite:///artist_platform.db')),
+        api_url,
+        os.getenv('PROFILE_STATE_PATH', 'profile_builder.state.json'),
+        push_batch=int(os.getenv('PROFILE_PUSH_BATCH', PUSH_BATCH))
+    )
+    builder.run(poll_interval=float(os.getenv('PROFILE_PUSH_INTERVAL', '300')))
+
+
+if __name__ == '__main__':
+    main()
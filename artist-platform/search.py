@@ -0,0 +1,203 @@
+"""
+Full-text track search on SQLite FTS5.
+
+`tracks_fts` indexes title, description, genre and artist name, keyed by
+track id; the last query term is matched as a prefix so the endpoint works
+for autocomplete. Every distinct indexed term is also kept in
+`search_vocab` with a trigram FTS5 index over it: a query term that matches
+nothing is replaced by the closest vocabulary term within a small edit
+distance ("beatels" -> "beatles").
+
+All lookups go through the FTS indexes and return the bounded top-k by
+BM25, so latency does not grow with a full scan of the catalog.
+"""
+import re
+import unicodedata
+
+# bm25 column weights: title, description, genre, artist_name
+BM25_WEIGHTS = (10.0, 1.0, 2.0, 5.0)
+MAX_RESULTS = 50
+TYPO_CANDIDATES = 50
+
+
+def create_schema(cursor):
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS tracks_fts USING fts5(
+            title, description, genre, artist_name,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    ''')
+    cursor.execute('CREATE TABLE IF NOT EXISTS search_vocab (term TEXT PRIMARY KEY) WITHOUT ROWID')
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS search_vocab_trigram USING fts5(term, tokenize = 'trigram')
+    ''')
+
+
+def tokenize(text):
+    """Lowercase, strip diacritics and split into word tokens (close to FTS5 unicode61)."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    return re.findall(r'\w+', text)
+
+
+def index_tracks(cursor, track_ids):
+    """(Re)index the given tracks. Call inside the transaction that wrote them."""
+    track_ids = list(track_ids)
+    if not track_ids:
+        return
+    placeholders = ','.join('?' * len(track_ids))
+    cursor.execute(f'DELETE FROM tracks_fts WHERE rowid IN ({placeholders})', track_ids)
+    cursor.execute(f'''
+        SELECT t.id, t.title, t.description, t.genre, u.username
+        FROM tracks t
+        LEFT JOIN users u ON u.id = t.artist_id
+        WHERE t.id IN ({placeholders})
+    ''', track_ids)
+    rows = cursor.fetchall()
+    cursor.executemany('''
+        INSERT INTO tracks_fts (rowid, title, description, genre, artist_name) VALUES (?, ?, ?, ?, ?)
+    ''', rows)
+
+    terms = {term for row in rows for text in row[1:] for term in tokenize(text)}
+    for term in terms:
+        cursor.execute('INSERT OR IGNORE INTO search_vocab (term) VALUES (?)', (term,))
+        if cursor.rowcount == 1:
+            cursor.execute('INSERT INTO search_vocab_trigram (term) VALUES (?)', (term,))
+
+
+def rebuild(cursor):
+    """Backfill the index for tracks created before it existed."""
+    cursor.execute('SELECT id FROM tracks WHERE id NOT IN (SELECT rowid FROM tracks_fts)')
+    missing = [row[0] for row in cursor.fetchall()]
+    for i in range(0, len(missing), 500):
+        index_tracks(cursor, missing[i:i + 500])
+    return len(missing)
+
+
+def edit_distance(a, b, limit):
+    """
+    Optimal string alignment distance (edits plus adjacent transpositions),
+    or limit + 1 once it is known to exceed `limit`.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before, previous = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                cost = min(cost, before[j - 2] + 1)
+            current.append(cost)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return previous[-1]
+
+
+def _quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+class TrackSearch:
+    def __init__(self, db):
+        self.db = db
+
+    def _has_term(self, cursor, term, prefix):
+        if prefix:
+            cursor.execute(
+                'SELECT 1 FROM search_vocab WHERE term >= ? AND term < ? LIMIT 1',
+                (term, term + '\U0010ffff')
+            )
+        else:
+            cursor.execute('SELECT 1 FROM search_vocab WHERE term = ?', (term,))
+        return cursor.fetchone() is not None
+
+    def _correct(self, cursor, term, prefix):
+        """Closest vocabulary term within 1 (short terms) or 2 edits, or None."""
+        if len(term) < 3:
+            return None
+        limit = 1 if len(term) <= 5 else 2
+        trigrams = {term[i:i + 3] for i in range(len(term) - 2)}
+        cursor.execute(
+            'SELECT term FROM search_vocab_trigram WHERE search_vocab_trigram MATCH ? ORDER BY rank LIMIT ?',
+            (' OR '.join(_quote(t) for t in trigrams), TYPO_CANDIDATES)
+        )
+        candidates = {row[0] for row in cursor.fetchall()}
+        if len(term) <= 5:
+            # Short terms share few trigrams with their typos; also try terms with the same first letter
+            cursor.execute(
+                'SELECT term FROM search_vocab WHERE term >= ? AND term < ? AND length(term) <= ? LIMIT ?',
+                (term[0], term[0] + '\U0010ffff', len(term) + limit, TYPO_CANDIDATES * 4)
+            )
+            candidates.update(row[0] for row in cursor.fetchall())
+
+        best, best_key = None, None
+        for candidate in sorted(candidates):
+            distance = edit_distance(term, candidate, limit)
+            # While typing, a close prefix of a longer term also counts, ranked after whole-term matches
+            key = (distance, 0, len(candidate))
+            if prefix and distance > 0:
+                key = min(key, (edit_distance(term, candidate[:len(term)], limit), 1, len(candidate)))
+            if key[0] <= limit and (best_key is None or key < best_key):
+                best, best_key = candidate, key
+        return best
+
+    def _match(self, cursor, terms, limit):
+        expression = ' '.join(_quote(t) for t in terms[:-1])
+        expression = f'{expression} {_quote(terms[-1])}*'.strip()
+        cursor.execute(f'''
+            SELECT f.rowid, t.title, t.genre, f.artist_name, t.cover_art, t.plays,
+                   bm25(tracks_fts, {', '.join(str(w) for w in BM25_WEIGHTS)}) AS score
+            FROM tracks_fts f
+            JOIN tracks t ON t.id = f.rowid
+            WHERE tracks_fts MATCH ?
+            ORDER BY score
+            LIMIT ?
+        ''', (expression, limit))
+        return cursor.fetchall()
+
+    def search(self, query, limit=20):
+        """
+        Top `limit` tracks for `query`, best first.
+
+        Returns {'results': [...], 'corrected_query': str or None}; the
+        corrected query is set when typo correction was applied.
+        """
+        terms = tokenize(query)[:10]
+        limit = max(1, min(limit, MAX_RESULTS))
+        if not terms:
+            return {'results': [], 'corrected_query': None}
+
+        conn = self.db.get_db_connection()
+        try:
+            cursor = conn.cursor()
+            rows = self._match(cursor, terms, limit)
+            corrected = None
+            if not rows:
+                fixed = []
+                for i, term in enumerate(terms):
+                    prefix = i == len(terms) - 1
+                    if self._has_term(cursor, term, prefix):
+                        fixed.append(term)
+                    else:
+                        fixed.append(self._correct(cursor, term, prefix) or term)
+                if fixed != terms:
+                    corrected = ' '.join(fixed)
+                    rows = self._match(cursor, fixed, limit)
+        finally:
+            conn.close()
+
+        return {
+            'results': [{
+                'id': row[0],
+                'title': row[1],
+                'genre': row[2],
+                'artist': row[3],
+                'cover_art': row[4],
+                'plays': row[5],
+                'score': round(-row[6], 4)
+            } for row in rows],
+            'corrected_query': corrected
+        }
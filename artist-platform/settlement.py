@@ -0,0 +1,305 @@
+"""
+Off-chain revenue settlement for RevenueDistributor.
+
+Computes what `distributeRevenue` will credit each artist for a period,
+reproducing the contract's integer arithmetic exactly:
+
+    platformFee    = subscriptionRevenue * PLATFORM_FEE / 100
+    artistRevenue  = subscriptionRevenue - platformFee
+    revenuePerPlay = artistRevenue / totalPlaysThisPeriod      (floor)
+    earnings       = plays * revenuePerPlay                    (per token)
+
+and emits a transaction plan: the minimal `tokenIds` list for
+`distributeRevenue` (only tokens with plays) and gas-bounded chunks for
+`batchPayArtists`, plus a dry-run report.
+
+Plays and artists for the open period come from the chain index
+(`chain_indexer.py`): the `PlayRecorded` plays since the last
+`RevenueDistributed`, paid to each token's registered artist, i.e. the
+`trackPlaysThisPeriod` and `trackArtist` the contract reads. Revenue and
+`totalPlaysThisPeriod` are read from the contract when it is configured.
+
+Usage:
+    python settlement.py --out plan.json
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence
+
+import numpy as np
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+# RevenueDistributor constants
+PLATFORM_FEE = 20
+MIN_DISTRIBUTION_AMOUNT = 10 ** 16  # 0.01 ether
+
+# Conservative per-call gas estimates (cold storage access, value transfer)
+DISTRIBUTE_BASE_GAS = 80_000
+DISTRIBUTE_GAS_PER_TOKEN = 32_000
+PAY_BASE_GAS = 30_000
+PAY_GAS_PER_ARTIST = 45_000
+
+INT64_MAX = np.iinfo(np.int64).max
+
+
+@dataclass
+class Settlement:
+    subscription_revenue: int
+    platform_fee: int
+    artist_revenue: int
+    total_plays: int
+    revenue_per_play: int
+    token_ids: np.ndarray
+    artists: List[str]
+    artist_plays: np.ndarray
+    artist_amounts: List[int]
+    skipped_token_ids: List[int] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+    warnings: List[str] = field(default_factory=list)
+
+    @property
+    def total_paid(self) -> int:
+        return sum(self.artist_amounts)
+
+    @property
+    def undistributed(self) -> int:
+        """Rounding dust left in the contract by the floor division."""
+        return self.artist_revenue - self.total_paid
+
+
+def compute_settlement(
+    token_ids: Sequence[int],
+    token_artists: Sequence[Optional[str]],
+    plays: Sequence[int],
+    subscription_revenue: int,
+    total_plays: Optional[int] = None,
+) -> Settlement:
+    """
+    Compute per-artist payouts for one distribution period.
+
+    `total_plays` should be the contract's `totalPlaysThisPeriod`; it
+    defaults to the sum of `plays`, including tokens excluded for having no
+    artist, since the contract still counts their plays in the divisor.
+    Per-token earnings are summed per artist as `artist_plays * revenuePerPlay`,
+    which is exactly the sum of the contract's per-token `plays * revenuePerPlay`.
+    """
+    token_ids = np.asarray(token_ids, dtype=np.int64)
+    plays = np.asarray(plays, dtype=np.int64)
+    artist_keys = np.array([(a or "").lower() for a in token_artists], dtype=object)
+
+    errors, warnings = [], []
+    plays_sum = int(plays.sum())
+    if total_plays is None:
+        total_plays = plays_sum
+    elif total_plays != plays_sum:
+        warnings.append(f"Recorded plays ({plays_sum}) differ from totalPlaysThisPeriod ({total_plays})")
+
+    played = plays > 0
+    missing_artist = played & (artist_keys == "")
+    skipped = token_ids[missing_artist].tolist()
+    if skipped:
+        # distributeRevenue would revert with "Artist not found"
+        warnings.append(f"{len(skipped)} played tokens have no artist and were excluded")
+    keep = played & ~missing_artist
+    token_ids, plays, artist_keys = token_ids[keep], plays[keep], artist_keys[keep]
+
+    platform_fee = subscription_revenue * PLATFORM_FEE // 100
+    artist_revenue = subscription_revenue - platform_fee
+    if total_plays <= 0:
+        errors.append("No plays recorded this period")
+    if subscription_revenue < MIN_DISTRIBUTION_AMOUNT:
+        errors.append("Insufficient revenue")
+    revenue_per_play = artist_revenue // total_plays if total_plays > 0 else 0
+
+    artists, inverse = np.unique(artist_keys.astype(str), return_inverse=True)
+    artist_plays = np.zeros(len(artists), dtype=np.int64)
+    np.add.at(artist_plays, inverse, plays)
+
+    if len(artist_plays) and int(artist_plays.max()) <= INT64_MAX // max(revenue_per_play, 1):
+        artist_amounts = (artist_plays * np.int64(revenue_per_play)).tolist()
+    else:
+        # Products beyond int64: fall back to exact Python ints per artist
+        artist_amounts = [int(p) * revenue_per_play for p in artist_plays.tolist()]
+
+    return Settlement(
+        subscription_revenue=subscription_revenue,
+        platform_fee=platform_fee,
+        artist_revenue=artist_revenue,
+        total_plays=total_plays,
+        revenue_per_play=revenue_per_play,
+        token_ids=token_ids,
+        artists=artists.tolist(),
+        artist_plays=artist_plays,
+        artist_amounts=artist_amounts,
+        skipped_token_ids=skipped,
+        errors=errors,
+        warnings=warnings,
+    )
+
+
+def chunk_by_gas(count: int, base_gas: int, per_item_gas: int, gas_limit: int) -> List[slice]:
+    """Split `count` items into consecutive slices whose estimated gas fits `gas_limit`."""
+    per_chunk = max(1, (gas_limit - base_gas) // per_item_gas)
+    return [slice(i, min(i + per_chunk, count)) for i in range(0, count, per_chunk)]
+
+
+def build_plan(settlement: Settlement, gas_limit: int = 10_000_000) -> dict:
+    """
+    Build the transaction plan for a settlement.
+
+    `distributeRevenue` closes the period on its first call, so it cannot be
+    split; its `tokenIds` are the played tokens only, and a warning is added
+    if the estimated gas exceeds `gas_limit`. `batchPayArtists` is chunked to
+    fit `gas_limit`, skipping zero payouts.
+    """
+    distribute_gas = DISTRIBUTE_BASE_GAS + DISTRIBUTE_GAS_PER_TOKEN * len(settlement.token_ids)
+    warnings = list(settlement.warnings)
+    if distribute_gas > gas_limit:
+        warnings.append(
+            f"distributeRevenue needs ~{distribute_gas} gas for {len(settlement.token_ids)} tokens, "
+            f"above the {gas_limit} budget"
+        )
+
+    payees = [(a, amt) for a, amt in zip(settlement.artists, settlement.artist_amounts) if amt > 0]
+    pay_chunks = [
+        {
+            "artists": [a for a, _ in payees[s]],
+            # wei amounts exceed JSON-safe integers; keep them as strings
+            "amounts": [str(amt) for _, amt in payees[s]],
+            "estimated_gas": PAY_BASE_GAS + PAY_GAS_PER_ARTIST * (s.stop - s.start),
+        }
+        for s in chunk_by_gas(len(payees), PAY_BASE_GAS, PAY_GAS_PER_ARTIST, gas_limit)
+    ]
+
+    return {
+        "summary": {
+            "subscription_revenue": str(settlement.subscription_revenue),
+            "platform_fee": str(settlement.platform_fee),
+            "artist_revenue": str(settlement.artist_revenue),
+            "total_plays": settlement.total_plays,
+            "revenue_per_play": str(settlement.revenue_per_play),
+            "total_paid": str(settlement.total_paid),
+            "undistributed": str(settlement.undistributed),
+            "tokens": len(settlement.token_ids),
+            "artists": len(payees),
+        },
+        "errors": settlement.errors,
+        "warnings": warnings,
+        "skipped_token_ids": settlement.skipped_token_ids,
+        "distributeRevenue": {
+            "tokenIds": settlement.token_ids.tolist(),
+            "estimated_gas": distribute_gas,
+        },
+        "batchPayArtists": pay_chunks,
+    }
+
+
+def format_report(plan: dict, top: int = 10) -> str:
+    """Human-readable dry-run report for a plan."""
+    s = plan["summary"]
+    lines = [
+        "Revenue settlement (dry run)",
+        f"  Subscription revenue: {s['subscription_revenue']} wei",
+        f"  Platform fee ({PLATFORM_FEE}%):    {s['platform_fee']} wei",
+        f"  Artist revenue:       {s['artist_revenue']} wei",
+        f"  Total plays:          {s['total_plays']}",
+        f"  Revenue per play:     {s['revenue_per_play']} wei",
+        f"  Total paid:           {s['total_paid']} wei ({s['undistributed']} wei rounding dust)",
+        f"  distributeRevenue:    1 tx, {s['tokens']} tokens, ~{plan['distributeRevenue']['estimated_gas']} gas",
+        f"  batchPayArtists:      {len(plan['batchPayArtists'])} tx for {s['artists']} artists",
+    ]
+    payees = [
+        (int(amount), artist)
+        for chunk in plan["batchPayArtists"]
+        for artist, amount in zip(chunk["artists"], chunk["amounts"])
+    ]
+    if payees:
+        lines.append(f"  Top {min(top, len(payees))} payouts:")
+        for amount, artist in sorted(payees, reverse=True)[:top]:
+            lines.append(f"    {artist}  {amount} wei")
+    for warning in plan["warnings"]:
+        lines.append(f"  WARNING: {warning}")
+    for error in plan["errors"]:
+        lines.append(f"  ERROR: {error} (distributeRevenue would revert)")
+    return "\n".join(lines)
+
+
+# Views read when the contract is configured
+REVENUE_DISTRIBUTOR_ABI = [
+    {"type": "function", "name": name, "stateMutability": "view", "inputs": [],
+     "outputs": [{"name": "", "type": "uint256"}]}
+    for name in ("subscriptionRevenue", "totalPlaysThisPeriod")
+]
+
+
+def read_period_totals(provider_url: str, contract_address: str):
+    """(subscriptionRevenue, totalPlaysThisPeriod) as the contract holds them now."""
+    from web3 import Web3
+
+    w3 = Web3(Web3.HTTPProvider(provider_url))
+    contract = w3.eth.contract(address=Web3.to_checksum_address(contract_address), abi=REVENUE_DISTRIBUTOR_ABI)
+    return (contract.functions.subscriptionRevenue().call(),
+            contract.functions.totalPlaysThisPeriod().call())
+
+
+def main():
+    load_dotenv()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description="Compute a RevenueDistributor settlement plan")
+    parser.add_argument("--revenue-wei", type=int,
+                        help="subscriptionRevenue in wei (default: read from the contract)")
+    parser.add_argument("--total-plays", type=int,
+                        help="totalPlaysThisPeriod (default: read from the contract, else the indexed plays)")
+    parser.add_argument("--gas-limit", type=int, default=10_000_000, help="Gas budget per transaction")
+    parser.add_argument("--out", help="Write the JSON plan to this file")
+    args = parser.parse_args()
+
+    from chain_indexer import ChainIndexStore
+
+    contract_address = os.getenv('REVENUE_DISTRIBUTOR_CONTRACT')
+    if contract_address and (args.revenue_wei is None or args.total_plays is None):
+        revenue, total_plays = read_period_totals(
+            os.getenv('WEB3_PROVIDER_URL', 'https://sepolia.base.org'), contract_address
+        )
+        if args.revenue_wei is None:
+            args.revenue_wei = revenue
+        if args.total_plays is None:
+            args.total_plays = total_plays
+    if args.revenue_wei is None:
+        parser.error("--revenue-wei is required when REVENUE_DISTRIBUTOR_CONTRACT is not set")
+
+    store = ChainIndexStore(os.getenv('CHAIN_INDEX_DB', 'chain_index.db'))
+    started = time.perf_counter()
+    rows = store.get_period_plays()
+    loaded = time.perf_counter()
+
+    token_ids = [row[0] for row in rows]
+    artists = [row[1] for row in rows]
+    plays = [row[2] for row in rows]
+    settlement = compute_settlement(token_ids, artists, plays, args.revenue_wei, args.total_plays)
+    plan = build_plan(settlement, args.gas_limit)
+    finished = time.perf_counter()
+    logger.info(
+        f"Settled {len(rows)} tokens in {finished - loaded:.3f}s "
+        f"(load {loaded - started:.3f}s)"
+    )
+
+    print(format_report(plan))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(plan, f, indent=2)
+        logger.info(f"Plan written to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+"""
+"Listeners also played": item-item collaborative filtering from `streams`.
+
+The builder reads `streams` in id-ordered batches and reduces them to
+distinct (user, track) listens. Every rebuild reads from the first id, so
+a stream committed out of id order on Postgres is picked up by the next
+rebuild rather than lost. It then counts, for every pair of tracks,
+how many users played both. Counting is done in chunks of users as sparse
+COO arrays (pair key -> count) that are merged with np.unique, so memory
+follows the number of distinct co-listened pairs, not tracks squared.
+
+Similarity is cosine over listener sets:
+    co_listeners(a, b) / sqrt(listeners(a) * listeners(b))
+The top K neighbours of each track go into one structured .npy file:
+
+    track      int64        track id (sorted)
+    neighbors  int64   [K]  neighbour track ids, best first, -1 padded
+    scores     float32 [K]
+
+Lookups memory-map the file and binary-search the track column, touching
+only a few pages per request.
+
+Rebuild periodically as a worker:  python similar_tracks.py
+"""
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+TOP_K = 50
+# Pairs seen by fewer users than this are noise
+MIN_CO_LISTENERS = 2
+# Heavy listeners contribute O(n^2) pairs; sample this many of their tracks
+MAX_TRACKS_PER_USER = 500
+# Reduce pending pair keys once this many have been generated
+PAIR_CHUNK = 5_000_000
+LISTEN_BATCH = 200_000
+
+
+def _reduce(keys, counts):
+    """Sum counts of equal keys. Returns (unique keys, summed counts)."""
+    unique, inverse = np.unique(keys, return_inverse=True)
+    return unique, np.bincount(inverse.reshape(-1), weights=counts, minlength=len(unique)).astype(np.int64)
+
+
+def collect_listens(db, batch_size=LISTEN_BATCH):
+    """Distinct (user_id, track_id) listens as two int64 arrays, sorted by user."""
+    merged = np.array([], dtype=np.int64)
+    pending, pending_size = [], 0
+    last_id = 0
+    while True:
+        rows = db.get_listens_after(last_id, batch_size)
+        if not rows:
+            break
+        batch = np.asarray(rows, dtype=np.int64)
+        pending.append(np.unique((batch[:, 1] << 32) | batch[:, 2]))
+        pending_size += len(pending[-1])
+        last_id = int(batch[-1, 0])
+        if pending_size > PAIR_CHUNK:
+            merged = np.unique(np.concatenate([merged] + pending))
+            pending, pending_size = [], 0
+    merged = np.unique(np.concatenate([merged] + pending))
+    return merged >> 32, merged & 0xFFFFFFFF
+
+
+def _sample(tracks, limit):
+    """Deterministic pseudo-random subset of `tracks` (dense indexes) of size `limit`."""
+    order = np.argsort((tracks * np.int64(2654435761)) & 0xFFFFFFFF, kind='stable')
+    return np.sort(tracks[order[:limit]])
+
+
+def co_occurrence(users, tracks, n_tracks):
+    """
+    Count users per unordered track pair. `tracks` are dense indexes in
+    [0, n_tracks) and `users` must be sorted. Returns (a, b, count) with a < b.
+    """
+    keys, counts = np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    pending, pending_size = [], 0
+    boundaries = np.flatnonzero(np.diff(users)) + 1
+    for listened in np.split(tracks, boundaries):
+        if len(listened) < 2:
+            continue
+        if len(listened) > MAX_TRACKS_PER_USER:
+            listened = _sample(listened, MAX_TRACKS_PER_USER)
+        first, second = np.triu_indices(len(listened), 1)
+        pending.append(listened[first] * n_tracks + listened[second])
+        pending_size += len(first)
+        if pending_size > PAIR_CHUNK:
+            chunk = np.concatenate(pending)
+            keys, counts = _reduce(np.concatenate([keys, chunk]),
+                                   np.concatenate([counts, np.ones(len(chunk), dtype=np.int64)]))
+            pending, pending_size = [], 0
+    if pending:
+        chunk = np.concatenate(pending)
+        keys, counts = _reduce(np.concatenate([keys, chunk]),
+                               np.concatenate([counts, np.ones(len(chunk), dtype=np.int64)]))
+    return keys // n_tracks, keys % n_tracks, counts
+
+
+def top_neighbors(track_ids, listeners, a, b, counts, k=TOP_K, min_co_listeners=MIN_CO_LISTENERS):
+    """
+    Cosine-similarity top-k per track from pair counts. Returns the
+    structured array described in the module docstring.
+    """
+    keep = counts >= min_co_listeners
+    a, b, counts = a[keep], b[keep], counts[keep]
+    scores = (counts / np.sqrt(listeners[a].astype(np.float64) * listeners[b])).astype(np.float32)
+
+    # Both directions, sorted by row then best score first
+    rows = np.concatenate([a, b])
+    cols = np.concatenate([b, a])
+    scores = np.concatenate([scores, scores])
+    order = np.lexsort((cols, -scores, rows))
+    rows, cols, scores = rows[order], cols[order], scores[order]
+
+    starts = np.flatnonzero(np.r_[True, np.diff(rows) != 0])
+    lengths = np.diff(np.r_[starts, len(rows)])
+    rank = np.arange(len(rows)) - np.repeat(starts, lengths)
+    top = rank < k
+    rows, cols, scores, rank = rows[top], cols[top], scores[top], rank[top]
+
+    dtype = np.dtype([('track', np.int64), ('neighbors', np.int64, (k,)), ('scores', np.float32, (k,))])
+    unique_rows, slot = np.unique(rows, return_inverse=True)
+    table = np.zeros(len(unique_rows), dtype=dtype)
+    table['track'] = track_ids[unique_rows]
+    table['neighbors'] = -1
+    table['neighbors'][slot.reshape(-1), rank] = track_ids[cols]
+    table['scores'][slot.reshape(-1), rank] = scores
+    return table
+
+
+def build(db, path, k=TOP_K):
+    """Rebuild the neighbour file at `path`. Returns the number of tracks with neighbours."""
+    started = time.monotonic()
+    users, raw_tracks = collect_listens(db)
+    track_ids, tracks = np.unique(raw_tracks, return_inverse=True)
+    tracks = tracks.reshape(-1)
+    listeners = np.bincount(tracks, minlength=len(track_ids))
+    a, b, counts = co_occurrence(users, tracks, max(len(track_ids), 1))
+    table = top_neighbors(track_ids, listeners, a, b, counts, k)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.npy')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, table)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+    logger.info(
+        f"Built neighbours for {len(table)} tracks from {len(users)} listens "
+        f"and {len(counts)} pairs in {time.monotonic() - started:.1f}s"
+    )
+    return len(table)
+
+
+class SimilarTracks:
+    """Memory-mapped reader for the neighbour file; picks up rebuilds automatically."""
+
+    def __init__(self, path):
+        self.path = path
+        self._table = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if mtime != self._mtime:
+                self._table = np.load(self.path, mmap_mode='r')
+                self._mtime = mtime
+            return self._table
+
+    def neighbors(self, track_id, limit=20):
+        """Up to `limit` (track_id, score) pairs, most similar first."""
+        table = self._load()
+        if table is None or len(table) == 0:
+            return []
+        column = table['track']
+        i = int(np.searchsorted(column, track_id))
+        if i >= len(column) or column[i] != track_id:
+            return []
+        row = table[i]
+        return [
+            (int(n), round(float(s), 4))
+            for n, s in zip(row['neighbors'][:limit], row['scores'][:limit]) if n >= 0
+        ]
+
+
+def main():
+    load_dotenv()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    from models import Database
+
+    db = Database(os.getenv('DATABASE_URL', 'sqlite:///artist_platform.db'))
+    path = os.getenv('SIMILAR_TRACKS_PATH', 'similar_tracks.npy')
+    interval = float(os.getenv('SIMILAR_TRACKS_INTERVAL', '3600'))
+    while True:
+        try:
+            build(db, path)
+        except Exception as e:
+            logger.error(f"Similar tracks build error: {str(e)}", exc_info=True)
+        time.sleep(interval)
+
+
+if __name__ == '__main__':
+    main()
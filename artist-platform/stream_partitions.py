@@ -0,0 +1,414 @@
+"""
+Monthly partitions for `streams`, with retention and archival.
+
+Postgres uses native declarative partitioning: `streams` is partitioned by
+RANGE (date_streamed) into `streams_YYYY_MM` tables, and the planner prunes
+partitions for date-bounded queries. SQLite has no partitioning, so each
+month is its own `streams_YYYY_MM` table and `streams` is a UNION ALL view
+over them. Stream ids come from a single counter (`stream_ids`) so they stay
+globally unique and increasing, which the `id > watermark` tailing in
+play_aggregator, charts, analytics and profile_builder relies on. SQLite
+pushes those `id` and `user_id` filters down into every arm of the view;
+date-bounded queries can go through `period_source`, which names only
+the partitions overlapping the period.
+
+Every partition is indexed on (track_id, date_streamed) and
+(user_id, date_streamed).
+
+Increasing ids are not committed in order on Postgres: a transaction can
+take id 41 and commit after another has committed 42, so a reader that
+already moved its watermark to 42 would never see 41. `StreamCursor`
+re-reads the last `STREAM_ID_LAG` ids below the watermark and keeps the ids
+in that window it has not seen yet, so late commits are picked up exactly
+once. A commit that lands after more than `STREAM_ID_LAG` newer ids is
+still missed. SQLite serializes writers and takes the id inside the write
+transaction, so ids commit in order there and the window is 0.
+
+The retention job writes each partition older than the retention window
+to `<archive dir>/streams_YYYY_MM.csv.gz`, checks the row count, then drops
+the partition. It also creates next month's partition ahead of time; on
+Postgres, inserts go straight to `streams` and rely on that (and on
+`create_schema` at startup) rather than running DDL per insert.
+
+Run as a worker:  python stream_partitions.py
+"""
+import csv
+import gzip
+import logging
+import os
+import re
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+RETAIN_MONTHS = 24
+# Ids below the watermark re-read for late commits (Postgres only); keep it below reader batch sizes
+STREAM_ID_LAG = 1000
+EXPORT_BATCH = 10000
+COLUMNS = ('id', 'user_id', 'track_id', 'date_streamed')
+PARTITION_RE = re.compile(r'^streams_(\d{4})_(\d{2})$')
+
+
+def _add_months(month, n):
+    year, mon = divmod(month[0] * 12 + month[1] - 1 + n, 12)
+    return year, mon + 1
+
+
+def partition_name(month):
+    return 'streams_%04d_%02d' % month
+
+
+def _bounds(month):
+    """[first day, first day of next month) as 'YYYY-MM-DD' strings."""
+    return '%04d-%02d-01' % month, '%04d-%02d-01' % _add_months(month, 1)
+
+
+def current_month(now=None):
+    now = now or datetime.now(timezone.utc)
+    return now.year, now.month
+
+
+def _create_partition(cursor, month, postgres=False):
+    name = partition_name(month)
+    first, following = _bounds(month)
+    if postgres:
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {name} PARTITION OF streams
+            FOR VALUES FROM ('{first}') TO ('{following}')
+        ''')
+        return
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {name} (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            track_id INTEGER NOT NULL,
+            date_streamed DATETIME NOT NULL
+                CHECK (date_streamed >= '{first}' AND date_streamed < '{following}'),
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (track_id) REFERENCES tracks (id)
+        )
+    ''')
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{name}_track ON {name} (track_id, date_streamed)')
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{name}_user ON {name} (user_id, date_streamed)')
+
+
+def _union(names):
+    select = ', '.join(COLUMNS)
+    return ' UNION ALL '.join(f'SELECT {select} FROM {name}' for name in names)
+
+
+def _rebuild_view(cursor):
+    """Point the SQLite `streams` view at the current set of partitions."""
+    cursor.execute('DROP VIEW IF EXISTS streams')
+    cursor.execute(f'CREATE VIEW streams AS {_union(partition_names(cursor))}')
+
+
+def partitions(cursor, postgres=False):
+    """Existing partitions as [(year, month)], oldest first."""
+    if postgres:
+        cursor.execute('''
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            WHERE p.relname = 'streams'
+        ''')
+    else:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'streams\\_%' ESCAPE '\\'")
+    months = []
+    for (name,) in cursor.fetchall():
+        match = PARTITION_RE.match(name)
+        if match:
+            months.append((int(match.group(1)), int(match.group(2))))
+    return sorted(months)
+
+
+def partition_names(cursor, postgres=False):
+    return [partition_name(month) for month in partitions(cursor, postgres)]
+
+
+def ensure_partition(cursor, month, postgres=False):
+    """Create the partition for `month` if it is missing."""
+    name = partition_name(month)
+    if postgres:
+        cursor.execute('SELECT to_regclass(%s)', (name,))
+        if cursor.fetchone()[0] is None:
+            _create_partition(cursor, month, postgres=True)
+        return
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,))
+    if cursor.fetchone() is None:
+        _create_partition(cursor, month)
+        _rebuild_view(cursor)
+
+
+def _migrate_sqlite(cursor):
+    """Move rows of a pre-partitioning `streams` table into monthly partitions, keeping ids."""
+    cursor.execute('ALTER TABLE streams RENAME TO streams_legacy')
+    cursor.execute('DROP INDEX IF EXISTS idx_streams_user')
+    cursor.execute("SELECT DISTINCT substr(COALESCE(date_streamed, CURRENT_TIMESTAMP), 1, 7) FROM streams_legacy")
+    for (prefix,) in cursor.fetchall():
+        month = (int(prefix[:4]), int(prefix[5:7]))
+        _create_partition(cursor, month)
+        cursor.execute(f'''
+            INSERT INTO {partition_name(month)} (id, user_id, track_id, date_streamed)
+            SELECT id, user_id, track_id, COALESCE(date_streamed, CURRENT_TIMESTAMP) FROM streams_legacy
+            WHERE substr(COALESCE(date_streamed, CURRENT_TIMESTAMP), 1, 7) = ?
+        ''', (prefix,))
+    # Continue numbering after the highest id ever handed out, not just the highest surviving one
+    cursor.execute('''
+        SELECT MAX(n) FROM (
+            SELECT MAX(id) AS n FROM streams_legacy
+            UNION ALL SELECT seq FROM sqlite_sequence WHERE name = 'streams_legacy'
+        )
+    ''')
+    cursor.execute('UPDATE stream_ids SET last_id = ?', (cursor.fetchone()[0] or 0,))
+    cursor.execute('DROP TABLE streams_legacy')
+
+
+def _migrate_postgres(cursor):
+    cursor.execute('ALTER TABLE streams RENAME TO streams_legacy')
+    cursor.execute('ALTER INDEX IF EXISTS streams_pkey RENAME TO streams_legacy_pkey')
+    _create_postgres_parent(cursor)
+    cursor.execute("SELECT DISTINCT date_trunc('month', date_streamed) FROM streams_legacy")
+    for (first,) in cursor.fetchall():
+        _create_partition(cursor, (first.year, first.month), postgres=True)
+    cursor.execute('''
+        INSERT INTO streams (id, user_id, track_id, date_streamed)
+        SELECT id, user_id, track_id, date_streamed FROM streams_legacy
+    ''')
+    cursor.execute("SELECT setval(pg_get_serial_sequence('streams', 'id'), COALESCE(MAX(id), 1)) FROM streams_legacy")
+    cursor.execute('DROP TABLE streams_legacy')
+
+
+def _create_postgres_parent(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS streams (
+            id BIGSERIAL,
+            user_id INTEGER NOT NULL,
+            track_id INTEGER NOT NULL,
+            date_streamed TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id, date_streamed)
+        ) PARTITION BY RANGE (date_streamed)
+    ''')
+    # Created on the parent, so every partition gets them
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_streams_track_date ON streams (track_id, date_streamed)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_streams_user_date ON streams (user_id, date_streamed)')
+
+
+def create_schema(cursor, postgres=False):
+    """Create (or migrate to) the partitioned `streams` with partitions for this month and the next."""
+    month = current_month()
+    if postgres:
+        cursor.execute("SELECT relkind FROM pg_class WHERE relname = 'streams' AND relkind IN ('r', 'p')")
+        row = cursor.fetchone()
+        if row is None:
+            _create_postgres_parent(cursor)
+        elif row[0] == 'r':
+            _migrate_postgres(cursor)
+        ensure_partition(cursor, month, postgres=True)
+        ensure_partition(cursor, _add_months(month, 1), postgres=True)
+        return
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stream_ids (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            last_id INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO stream_ids (id, last_id) VALUES (0, 0)')
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'streams'")
+    if cursor.fetchone() is not None:
+        _migrate_sqlite(cursor)
+    _create_partition(cursor, month)
+    _create_partition(cursor, _add_months(month, 1))
+    _rebuild_view(cursor)
+
+
+def insert_stream(cursor, user_id, track_id, postgres=False, now=None):
+    """Insert a stream into its month's partition and return its id."""
+    now = now or datetime.now(timezone.utc)
+    date_streamed = now.strftime('%Y-%m-%d %H:%M:%S')
+    if postgres:
+        # Routed by Postgres; create_schema and run_retention keep this month's partition in place
+        cursor.execute('''
+            INSERT INTO streams (user_id, track_id, date_streamed)
+            VALUES (%s, %s, %s)
+            RETURNING id
+        ''', (user_id, track_id, date_streamed))
+        return cursor.fetchone()[0]
+    # The counter update takes the write lock first, so the partition DDL below is part of the same transaction
+    cursor.execute('UPDATE stream_ids SET last_id = last_id + 1')
+    cursor.execute('SELECT last_id FROM stream_ids')
+    stream_id = cursor.fetchone()[0]
+    month = current_month(now)
+    ensure_partition(cursor, month)
+    cursor.execute(f'''
+        INSERT INTO {partition_name(month)} (id, user_id, track_id, date_streamed)
+        VALUES (?, ?, ?, ?)
+    ''', (stream_id, user_id, track_id, date_streamed))
+    return stream_id
+
+
+def period_source(cursor, start, end, postgres=False):
+    """
+    FROM-clause source for streams in [start, end).
+
+    Postgres prunes partitions itself. On SQLite this is a UNION ALL of only
+    the month partitions overlapping the period, instead of the whole view.
+    """
+    if postgres:
+        return 'streams'
+    names = []
+    for month in partitions(cursor):
+        first, following = _bounds(month)
+        if first < str(end) and following > str(start):
+            names.append(partition_name(month))
+    if not names:
+        return '(SELECT NULL AS id, NULL AS user_id, NULL AS track_id, NULL AS date_streamed WHERE 0)'
+    return f'({_union(names)})'
+
+
+def tail_lag(postgres=False):
+    """Re-read window for `StreamCursor`: STREAM_ID_LAG ids on Postgres, none on SQLite."""
+    return int(os.getenv('STREAM_ID_LAG', str(STREAM_ID_LAG))) if postgres else 0
+
+
+class StreamCursor:
+    """
+    Watermark over stream ids that tolerates out-of-order commits.
+
+    Read with `id > cursor.start` and pass the rows to `advance`, which
+    returns only the ones not seen before. `gaps` are the ids inside the
+    re-read window that have not been seen; they are the only ids below
+    the watermark still accepted.
+    """
+
+    def __init__(self, last_id=0, gaps=(), lag=0):
+        self.last_id = last_id
+        self.gaps = set(gaps)
+        self.lag = lag
+
+    @property
+    def start(self):
+        return max(0, self.last_id - self.lag)
+
+    def advance(self, rows):
+        """Rows (id first, ascending) not seen yet; moves the watermark past them."""
+        new = []
+        seen = set()
+        for row in rows:
+            stream_id = row[0]
+            if stream_id > self.last_id:
+                new.append(row)
+                seen.add(stream_id)
+            elif stream_id in self.gaps:
+                new.append(row)
+                self.gaps.discard(stream_id)
+        if rows and rows[-1][0] > self.last_id:
+            last_id = rows[-1][0]
+            floor = last_id - self.lag
+            self.gaps.update(i for i in range(max(self.last_id, floor) + 1, last_id) if i not in seen)
+            self.gaps = {i for i in self.gaps if i > floor}
+            self.last_id = last_id
+        return new
+
+    def state(self):
+        return {'last_stream_id': self.last_id, 'stream_gaps': sorted(self.gaps)}
+
+    @classmethod
+    def from_state(cls, data, lag=0):
+        return cls(data.get('last_stream_id', 0), data.get('stream_gaps', ()), lag)
+
+
+def archive_partition(conn, month, archive_dir, postgres=False):
+    """Write a partition to `<archive_dir>/streams_YYYY_MM.csv.gz`, then drop it. Returns rows archived."""
+    name = partition_name(month)
+    path = os.path.join(archive_dir, f'{name}.csv.gz')
+    os.makedirs(archive_dir, exist_ok=True)
+    cursor = conn.cursor()
+
+    fd, tmp_path = tempfile.mkstemp(dir=archive_dir, suffix='.tmp')
+    rows = 0
+    try:
+        with os.fdopen(fd, 'wb') as raw, gzip.open(raw, 'wt', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(COLUMNS)
+            cursor.execute(f'SELECT {", ".join(COLUMNS)} FROM {name} ORDER BY id')
+            while True:
+                batch = cursor.fetchmany(EXPORT_BATCH)
+                if not batch:
+                    break
+                writer.writerows(batch)
+                rows += len(batch)
+        cursor.execute(f'SELECT COUNT(*) FROM {name}')
+        expected = cursor.fetchone()[0]
+        if rows != expected:
+            raise RuntimeError(f'{name}: archived {rows} rows but the partition has {expected}')
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+    if postgres:
+        cursor.execute(f'ALTER TABLE streams DETACH PARTITION {name}')
+        cursor.execute(f'DROP TABLE {name}')
+    else:
+        cursor.execute(f'DROP TABLE {name}')
+        _rebuild_view(cursor)
+    conn.commit()
+    return rows
+
+
+def run_retention(db, archive_dir, retain_months=RETAIN_MONTHS, now=None):
+    """
+    Archive and drop partitions older than `retain_months` (the current month
+    counts as one) and make sure this month's and next month's exist.
+    Returns {partition: rows}.
+    """
+    if retain_months < 1:
+        raise ValueError('retain_months must be at least 1')
+    postgres = bool(db.db_url)
+    month = current_month(now)
+    cutoff = _add_months(month, 1 - retain_months)
+    archived = {}
+    conn = db.get_db_connection()
+    try:
+        cursor = conn.cursor()
+        ensure_partition(cursor, month, postgres=postgres)
+        ensure_partition(cursor, _add_months(month, 1), postgres=postgres)
+        conn.commit()
+        for expired in partitions(cursor, postgres):
+            if expired >= cutoff:
+                break
+            archived[partition_name(expired)] = archive_partition(conn, expired, archive_dir, postgres=postgres)
+    finally:
+        conn.close()
+    return archived
+
+
+def main():
+    load_dotenv()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    from models import Database
+
+    db = Database(os.getenv('DATABASE_URL', 'sqlite:///artist_platform.db'))
+    archive_dir = os.getenv('STREAM_ARCHIVE_DIR', 'archive/streams')
+    retain_months = int(os.getenv('STREAM_RETENTION_MONTHS', RETAIN_MONTHS))
+    interval = float(os.getenv('STREAM_RETENTION_INTERVAL', '86400'))
+    while True:
+        try:
+            for name, rows in run_retention(db, archive_dir, retain_months).items():
+                logger.info(f"Archived {rows} streams from {name} to {archive_dir}")
+        except Exception as e:
+            logger.error(f"Stream retention error: {str(e)}", exc_info=True)
+        time.sleep(interval)
+
+
+if __name__ == '__main__':
+    main()
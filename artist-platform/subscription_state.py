@@ -0,0 +1,191 @@
+"""
+Subscription state cache for SubscriptionV2.
+
+Keeps each user's subscription end time in memory so gating a play is a
+dictionary lookup instead of an `eth_call`. End times are kept current by
+following `Subscribed` / `SubscriptionExtended` logs (a background thread
+polls `eth_getLogs` up to `head - confirmations`); a user the cache has no
+live entry for is looked up once with `userSubscriptions(user)`, under a
+concurrency bound and a short negative TTL.
+
+Only `w3.eth` calls are used, so the cache runs unchanged against a local
+chain (Hardhat/anvil node or web3's EthereumTesterProvider).
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIPTION_V2_ABI = [
+    {
+        "type": "event", "name": "Subscribed", "anonymous": False,
+        "inputs": [
+            {"name": "user", "type": "address", "indexed": True},
+            {"name": "plan", "type": "uint256", "indexed": False},
+            {"name": "amount", "type": "uint256", "indexed": False},
+            {"name": "duration", "type": "uint256", "indexed": False}
+        ]
+    },
+    {
+        "type": "event", "name": "SubscriptionExtended", "anonymous": False,
+        "inputs": [
+            {"name": "user", "type": "address", "indexed": True},
+            {"name": "plan", "type": "uint256", "indexed": False},
+            {"name": "amount", "type": "uint256", "indexed": False},
+            {"name": "newEndTime", "type": "uint256", "indexed": False}
+        ]
+    },
+    {
+        "name": "userSubscriptions",
+        "type": "function",
+        "stateMutability": "view",
+        "inputs": [{"name": "", "type": "address"}],
+        "outputs": [
+            {"name": "startTime", "type": "uint256"},
+            {"name": "endTime", "type": "uint256"},
+            {"name": "isActive", "type": "bool"},
+            {"name": "totalPaid", "type": "uint256"}
+        ]
+    }
+]
+
+
+class SubscriptionLookupError(Exception):
+    """The cache had no answer and the RPC fallback was unavailable."""
+
+
+class SubscriptionState:
+    def __init__(self, w3, contract_address, start_block=0, batch_size=2000, confirmations=3,
+                 miss_ttl=30, max_rpc_calls=8, rpc_wait=2.0):
+        self.w3 = w3
+        self.contract = w3.eth.contract(address=w3.to_checksum_address(contract_address),
+                                        abi=SUBSCRIPTION_V2_ABI)
+        self.next_block = start_block
+        self.max_batch_size = batch_size
+        self.batch_size = batch_size
+        self.confirmations = confirmations
+        self.miss_ttl = miss_ttl
+        self.rpc_wait = rpc_wait
+
+        self._end_times = {}   # lowercased address -> endTime (unix seconds)
+        self._checked = {}     # lowercased address -> when the RPC fallback last ran
+        self._lock = threading.Lock()
+        self._rpc_slots = threading.BoundedSemaphore(max_rpc_calls)
+        self._thread = None
+
+        self._subscribed = self.contract.events.Subscribed()
+        self._extended = self.contract.events.SubscriptionExtended()
+        self._topics = {
+            w3.keccak(text='Subscribed(address,uint256,uint256,uint256)').hex(): self._subscribed,
+            w3.keccak(text='SubscriptionExtended(address,uint256,uint256,uint256)').hex(): self._extended
+        }
+
+    def _set_end_time(self, user, end_time):
+        with self._lock:
+            # End times only move forward; a late RPC read must not undo a newer event
+            if end_time >= self._end_times.get(user, 0):
+                self._end_times[user] = end_time
+
+    def apply_logs(self, logs):
+        """
+        Fold raw SubscriptionV2 logs into the cache.
+
+        An extension emits `SubscriptionExtended` (with the new end time)
+        followed by `Subscribed` in the same transaction; a new subscription
+        emits only `Subscribed`, whose end time is the block timestamp plus
+        `duration`.
+        """
+        decoded = []
+        for log in logs:
+            event = self._topics.get(log['topics'][0].hex()) if log['topics'] else None
+            if event is not None:
+                decoded.append(event.process_log(log))
+
+        extended_txs = {ev['transactionHash'] for ev in decoded if ev['event'] == 'SubscriptionExtended'}
+        block_times = {}
+        for ev in decoded:
+            user = ev['args']['user'].lower()
+            if ev['event'] == 'SubscriptionExtended':
+                self._set_end_time(user, ev['args']['newEndTime'])
+            elif ev['transactionHash'] not in extended_txs:
+                number = ev['blockNumber']
+                if number not in block_times:
+                    block_times[number] = self.w3.eth.get_block(number)['timestamp']
+                self._set_end_time(user, block_times[number] + ev['args']['duration'])
+        return len(decoded)
+
+    def sync(self):
+        """Apply logs up to the confirmed head. Returns the number of blocks processed."""
+        safe_head = self.w3.eth.block_number - self.confirmations
+        processed = 0
+        while self.next_block <= safe_head:
+            to_block = min(safe_head, self.next_block + self.batch_size - 1)
+            try:
+                logs = self.w3.eth.get_logs({
+                    'fromBlock': self.next_block,
+                    'toBlock': to_block,
+                    'address': self.contract.address
+                })
+            except Exception as e:
+                if self.batch_size == 1:
+                    raise
+                self.batch_size = max(1, self.batch_size // 2)
+                logger.warning(f"get_logs failed ({e}), batch size now {self.batch_size}")
+                continue
+            events = self.apply_logs(logs)
+            if events:
+                logger.info(f"Applied {events} subscription events from blocks {self.next_block}-{to_block}")
+            processed += to_block - self.next_block + 1
+            self.next_block = to_block + 1
+            self.batch_size = min(self.max_batch_size, self.batch_size * 2)
+        return processed
+
+    def start(self, poll_interval=5):
+        """Sync in a daemon thread."""
+        def loop():
+            while True:
+                try:
+                    self.sync()
+                except Exception as e:
+                    logger.error(f"Subscription sync error: {str(e)}", exc_info=True)
+                time.sleep(poll_interval)
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=loop, name='subscription-sync', daemon=True)
+            self._thread.start()
+
+    def get_end_time(self, user, now=None):
+        """
+        Return the user's subscription end time (0 if never subscribed).
+
+        Live entries are answered from memory. Otherwise the contract is
+        read once per `miss_ttl`; raises SubscriptionLookupError if no RPC
+        slot frees up within `rpc_wait` seconds or the call fails.
+        """
+        now = now or time.time()
+        user = user.lower()
+        with self._lock:
+            end_time = self._end_times.get(user, 0)
+            if end_time > now or now - self._checked.get(user, float('-inf')) < self.miss_ttl:
+                return end_time
+
+        if not self._rpc_slots.acquire(timeout=self.rpc_wait):
+            raise SubscriptionLookupError('Subscription lookup is overloaded')
+        try:
+            _, end_time, is_active, _ = self.contract.functions.userSubscriptions(
+                self.w3.to_checksum_address(user)
+            ).call()
+        except Exception as e:
+            raise SubscriptionLookupError(str(e)) from e
+        finally:
+            self._rpc_slots.release()
+
+        self._set_end_time(user, end_time if is_active else 0)
+        with self._lock:
+            self._checked[user] = now
+            return self._end_times.get(user, 0)
+
+    def is_active(self, user, now=None):
+        now = now or time.time()
+        return self.get_end_time(user, now) > now
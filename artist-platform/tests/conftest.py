@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+# The app modules are top-level scripts in artist-platform/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# ...and the root backend's (ledger.py) one level up, after them
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+
+@pytest.fixture
+def db(tmp_path):
+    """models.Database on a fresh SQLite file, with no replicas."""
+    pytest.importorskip('psycopg2')
+    from models import Database
+
+    return Database(f"sqlite:///{tmp_path / 'artist_platform.db'}", replica_urls='')
+
+
+@pytest.fixture
+def chain_index(tmp_path):
+    """An empty ChainIndexStore."""
+    from chain_indexer import ChainIndexStore
+
+    return ChainIndexStore(str(tmp_path / 'chain_index.db'))
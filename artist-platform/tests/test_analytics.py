@@ -0,0 +1,99 @@
+"""Daily per-artist analytics compacted from an in-memory `streams` stand-in."""
+from datetime import date, datetime, timezone
+
+import numpy as np
+
+import analytics
+from analytics import TRACK_BLOCK, AnalyticsStore
+
+
+class Streams:
+    """Stream facts: (id, track_id, artist_id, price, date_streamed)."""
+
+    def __init__(self):
+        self.rows = []
+        self.stream_id_lag = 0
+
+    def play(self, track_id, artist_id, price, day, times=1):
+        streamed_at = datetime.combine(day, datetime.min.time()).strftime('%Y-%m-%d %H:%M:%S')
+        for _ in range(times):
+            self.rows.append((len(self.rows) + 1, track_id, artist_id, price, streamed_at))
+
+    def get_stream_facts_after(self, last_stream_id, limit=50000):
+        return [row for row in self.rows if row[0] > last_stream_id][:limit]
+
+
+def _by_track(result):
+    return {int(t): (result['plays'][:, i].tolist(), result['earnings'][:, i].tolist())
+            for i, t in enumerate(result['track_ids'])}
+
+
+def test_daily_plays_and_earnings_per_track(tmp_path):
+    db = Streams()
+    db.play(1, 10, 0.5, date(2024, 3, 1), times=2)
+    db.play(2, 10, 0.25, date(2024, 3, 3))
+    db.play(3, 20, 1.0, date(2024, 3, 2))
+    db.play(4, None, 1.0, date(2024, 3, 2))    # track without an artist
+    store = AnalyticsStore(str(tmp_path))
+    assert store.compact(db, batch_size=2) == 5
+
+    result = store.daily(10, days=3, end=date(2024, 3, 3))
+    assert result['days'] == ['2024-03-01', '2024-03-02', '2024-03-03']
+    assert _by_track(result) == {1: ([2, 0, 0], [1.0, 0.0, 0.0]), 2: ([0, 0, 1], [0.0, 0.0, 0.25])}
+    assert _by_track(store.daily(20, days=1, end=date(2024, 3, 2))) == {3: ([1], [1.0])}
+    assert store.daily(30) is None
+
+
+def test_compaction_resumes_without_double_counting(tmp_path):
+    db = Streams()
+    db.play(1, 10, 1.0, date(2024, 3, 1), times=3)
+    store = AnalyticsStore(str(tmp_path))
+    store.compact(db)
+
+    db.play(1, 10, 1.0, date(2024, 3, 1))
+    assert AnalyticsStore(str(tmp_path)).compact(db) == 1
+    plays = store.daily(10, days=1, end=date(2024, 3, 1))['plays']
+    assert plays.tolist() == [[4]]
+
+    # A batch the artist already folded in (crash before state.json was written) is skipped
+    series = store.artist(10)
+    day = (date(2024, 3, 1) - date(1970, 1, 1)).days
+    series.add(np.array([day]), np.array([1]), np.array([5]), np.array([5.0]), batch=2)
+    assert store.daily(10, days=1, end=date(2024, 3, 1))['plays'].tolist() == [[4]]
+
+
+def test_arrays_grow_for_earlier_days_and_new_tracks(tmp_path):
+    db = Streams()
+    db.play(1, 10, 1.0, date(2024, 3, 10))
+    store = AnalyticsStore(str(tmp_path))
+    store.compact(db)
+
+    db.play(1, 10, 1.0, date(2024, 1, 1))
+    for track_id in range(2, TRACK_BLOCK + 3):
+        db.play(track_id, 10, 1.0, date(2024, 3, 10))
+    store.compact(db)
+
+    result = _by_track(store.daily(10, days=70, end=date(2024, 3, 10)))
+    assert len(result) == TRACK_BLOCK + 2
+    assert result[1][0][0] == 1 and result[1][0][-1] == 1 and sum(result[1][0]) == 2
+    assert sum(result[TRACK_BLOCK + 2][0]) == 1
+
+
+def test_default_range_ends_today_in_utc(tmp_path, monkeypatch):
+    # 23:30 UTC: already the next day east of UTC
+    instant = datetime(2024, 3, 1, 23, 30, tzinfo=timezone.utc)
+
+    class FixedDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return instant.astimezone(tz)
+
+    monkeypatch.setattr(analytics, 'datetime', FixedDatetime)
+    db = Streams()
+    db.play(1, 10, 1.0, date(2024, 3, 1))
+    store = AnalyticsStore(str(tmp_path))
+    store.compact(db)
+
+    result = store.daily(10, days=1)
+    assert result['days'] == ['2024-03-01']
+    assert result['plays'].tolist() == [[1]]
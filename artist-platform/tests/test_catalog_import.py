@@ -0,0 +1,108 @@
+"""Bulk catalog import into the SQLite backend: dedupe, path checks and checkpoint resume."""
+import csv
+import json
+import os
+
+import pytest
+
+from catalog_import import CatalogImporter, load_checkpoint
+
+
+@pytest.fixture
+def audio_dir(tmp_path):
+    directory = tmp_path / 'audio'
+    directory.mkdir()
+    for name, content in [('a.mp3', b'aaa'), ('b.mp3', b'bbb'), ('c.mp3', b'ccc'), ('a_copy.mp3', b'aaa')]:
+        (directory / name).write_bytes(content)
+    (tmp_path / 'secret.mp3').write_bytes(b'secret')
+    return directory
+
+
+def _manifest(tmp_path, files):
+    path = tmp_path / 'manifest.csv'
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['file', 'title', 'genre'])
+        writer.writeheader()
+        for name in files:
+            writer.writerow({'file': name, 'title': name.split('.')[0], 'genre': 'Rock'})
+    return str(path)
+
+
+def _importer(db, audio_dir, tmp_path, **kwargs):
+    upload_dir = tmp_path / 'uploads'
+    upload_dir.mkdir(exist_ok=True)
+    return CatalogImporter(db, str(audio_dir), str(upload_dir), artist_id=1, workers=2, **kwargs)
+
+
+def _track_count(db):
+    conn = db.get_db_connection()
+    try:
+        return conn.execute('SELECT COUNT(*) FROM tracks').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_duplicate_audio_is_inserted_once(db, audio_dir, tmp_path):
+    manifest = _manifest(tmp_path, ['a.mp3', 'b.mp3', 'a_copy.mp3'])
+    report = _importer(db, audio_dir, tmp_path).run(manifest, str(tmp_path / 'checkpoint.json'))
+    assert (report['inserted'], report['failed']) == (2, 0)
+    assert _track_count(db) == 2
+
+    # A second import of the same files, from a fresh checkpoint, adds nothing
+    again = _importer(db, audio_dir, tmp_path).run(manifest, str(tmp_path / 'other.json'))
+    assert (again['rows'], again['inserted']) == (3, 0)
+    assert _track_count(db) == 2
+
+
+def test_paths_outside_audio_dir_are_rejected(db, audio_dir, tmp_path):
+    os.symlink(tmp_path / 'secret.mp3', audio_dir / 'link.mp3')
+    manifest = _manifest(tmp_path, ['../secret.mp3', str(tmp_path / 'secret.mp3'), 'link.mp3', 'missing.mp3', 'b.mp3'])
+    report = _importer(db, audio_dir, tmp_path).run(manifest, str(tmp_path / 'checkpoint.json'))
+    assert (report['inserted'], report['failed']) == (1, 4)
+    assert not [name for name in os.listdir(tmp_path / 'uploads') if 'secret' in name or 'link' in name]
+
+
+def test_interrupted_import_resumes_after_the_last_chunk(db, audio_dir, tmp_path, monkeypatch):
+    manifest = _manifest(tmp_path, ['a.mp3', 'b.mp3', 'c.mp3'])
+    checkpoint = str(tmp_path / 'checkpoint.json')
+    insert = db.bulk_create_tracks
+    calls = []
+
+    def failing_second_chunk(rows, **kwargs):
+        calls.append(len(rows))
+        if len(calls) == 2:
+            raise RuntimeError('connection lost')
+        return insert(rows, **kwargs)
+
+    monkeypatch.setattr(db, 'bulk_create_tracks', failing_second_chunk)
+    with pytest.raises(RuntimeError):
+        _importer(db, audio_dir, tmp_path, chunk_size=2).run(manifest, checkpoint)
+    with open(checkpoint) as f:
+        assert json.load(f)['rows_done'] == 2
+
+    report = _importer(db, audio_dir, tmp_path, chunk_size=2).run(manifest, checkpoint)
+    assert calls == [2, 1, 1]
+    assert (report['rows'], report['rows_total'], report['inserted']) == (1, 3, 3)
+    assert _track_count(db) == 3
+
+    # Everything done: rerunning reads no rows
+    assert _importer(db, audio_dir, tmp_path).run(manifest, checkpoint)['rows'] == 0
+
+
+def test_checkpoint_belongs_to_one_manifest(tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    with open(path, 'w') as f:
+        json.dump({'manifest': '/labels/one.csv', 'rows_done': 10, 'inserted': 10, 'failed': 0}, f)
+    assert load_checkpoint(path, '/labels/one.csv')['rows_done'] == 10
+    with pytest.raises(SystemExit):
+        load_checkpoint(path, '/labels/two.csv')
+
+
+def test_moderation_queue_gets_new_tracks(db, audio_dir, tmp_path):
+    manifest = _manifest(tmp_path, ['a.mp3', 'b.mp3'])
+    _importer(db, audio_dir, tmp_path, enqueue_moderation=True).run(manifest, str(tmp_path / 'checkpoint.json'))
+    pending = db.get_pending_moderation()
+    assert [row[1] for row in pending] == ['a', 'b']
+
+    db.set_moderation_status([pending[0][0]], 'submitted')
+    assert [row[1] for row in db.get_pending_moderation()] == ['b']
@@ -0,0 +1,106 @@
+"""Windowed charts against an in-memory `streams` stand-in."""
+import gzip
+import json
+import time
+
+from charts import MAX_CHART_SIZE, ChartsEngine, WindowCounter
+
+HOUR = 3600
+DAY = 86400
+NOW = 1700000000 - 1700000000 % DAY + 12 * HOUR   # noon, UTC
+
+
+class Streams:
+    def __init__(self):
+        self.rows = []
+        self.stream_id_lag = 0
+
+    def play(self, track_id, timestamp, times=1):
+        for _ in range(times):
+            self.rows.append((len(self.rows) + 1, track_id, timestamp))
+
+    def get_stream_events_after(self, last_stream_id, limit=10000):
+        return [row for row in self.rows if row[0] > last_stream_id][:limit]
+
+
+def test_counts_leave_the_window_a_bucket_at_a_time():
+    counter = WindowCounter(DAY, HOUR)
+    counter.add(1, NOW - DAY + 10)        # the window's oldest hour
+    counter.add(1, NOW - HOUR)
+    counter.add(2, NOW)
+    assert counter.top(10, NOW) == [(1, 2), (2, 1)]   # ties go to the lower id
+
+    assert counter.top(10, NOW + HOUR) == [(1, 1), (2, 1)]
+    assert counter.top(10, NOW + DAY) == [(2, 1)]
+    assert counter.top(10, NOW + 2 * DAY) == []
+    assert counter.buckets == {}
+
+
+def test_windows_are_day_week_and_month():
+    db = Streams()
+    db.play(1, NOW - 2 * HOUR, times=2)
+    db.play(2, NOW - 3 * DAY, times=5)
+    db.play(3, NOW - 20 * DAY, times=9)
+    db.play(4, NOW - 40 * DAY, times=20)
+    engine = ChartsEngine(db)
+    assert engine.ingest(now=NOW) == 36
+    engine.refresh_charts(NOW)
+
+    assert engine.top('day') == [(1, 2)]
+    assert engine.top('week') == [(2, 5), (1, 2)]
+    assert engine.top('month') == [(3, 9), (2, 5), (1, 2)]
+    assert engine.top('month', limit=1) == [(3, 9)]
+    assert engine.counters['month'].totals.keys() == {1, 2, 3}
+
+
+def test_requests_read_the_last_computed_chart():
+    db = Streams()
+    engine = ChartsEngine(db)
+    db.play(1, NOW)
+    engine.ingest(now=NOW)
+    assert engine.top('day') == []          # not computed yet
+
+    engine.refresh_charts(NOW)
+    db.play(2, NOW, times=3)
+    engine.ingest(now=NOW)
+    assert engine.top('day') == [(1, 1)]
+    engine.refresh_charts(NOW)
+    assert engine.top('day', limit=10 * MAX_CHART_SIZE) == [(2, 3), (1, 1)]
+
+
+def test_snapshot_resumes_without_double_counting(tmp_path):
+    path = str(tmp_path / 'charts.snapshot.json.gz')
+    db = Streams()
+    db.play(1, NOW - HOUR, times=3)
+    engine = ChartsEngine(db, snapshot_path=path)
+    engine.ingest(now=NOW)
+    assert engine.save_snapshot(force=True)
+
+    db.play(1, NOW, times=2)
+    restarted = ChartsEngine(db, snapshot_path=path)
+    assert restarted.load_snapshot()
+    assert restarted.ingest(now=NOW) == 2
+    restarted.refresh_charts(NOW)
+    assert restarted.top('week') == [(1, 5)]
+
+
+def test_snapshot_in_an_older_format_is_ignored(tmp_path):
+    path = str(tmp_path / 'charts.snapshot.json.gz')
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        json.dump({'last_stream_id': 5, 'windows': {'day': {'reference': 0, 'scores': {'1': 2.0}}}}, f)
+    engine = ChartsEngine(Streams(), snapshot_path=path)
+    assert not engine.load_snapshot()
+    assert engine.stream.last_id == 0
+
+
+def test_one_worker_ingests_and_the_others_follow(tmp_path):
+    path = str(tmp_path / 'charts.snapshot.json.gz')
+    db = Streams()
+    db.play(7, time.time(), times=4)
+    leader, follower = ChartsEngine(db, snapshot_path=path), ChartsEngine(db, snapshot_path=path)
+
+    assert leader.run_once()
+    assert not follower.run_once()
+    assert follower.stream.last_id == 0       # never read `streams`
+    assert follower.top('day') == leader.top('day') == [(7, 4)]
+    assert not follower.load_charts()          # unchanged since the last reload
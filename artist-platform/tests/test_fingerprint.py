@@ -0,0 +1,69 @@
+"""Fingerprint matching on synthetic tone sequences."""
+import wave
+
+import numpy as np
+import pytest
+
+from fingerprint import SAMPLE_RATE, FingerprintIndex, fingerprint, fingerprint_file, load_audio
+
+
+def _tune(seed, seconds=20, rate=SAMPLE_RATE):
+    """A sequence of random chords, a quarter second each."""
+    rng = np.random.default_rng(seed)
+    note = rate // 4
+    t = np.arange(note) / rate
+    chords = [sum(np.sin(2 * np.pi * f * t) for f in rng.uniform(200, 4000, size=3))
+              for _ in range(seconds * 4)]
+    return (np.concatenate(chords) / 3).astype(np.float32)
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = FingerprintIndex(str(tmp_path / 'fingerprints.db'))
+    for track_id, seed in ((1, 1), (2, 2), (3, 3)):
+        index.add(track_id, *fingerprint(_tune(seed)))
+    return index
+
+
+def test_trimmed_quieter_copy_is_an_exact_match(index):
+    copy = _tune(2)[3 * SAMPLE_RATE:15 * SAMPLE_RATE] * 0.3
+    matches = index.match(*fingerprint(copy))
+    assert [m['track_id'] for m in matches] == [2]
+    assert matches[0]['exact']
+    assert matches[0]['offset_seconds'] == pytest.approx(3.0, abs=0.1)
+
+
+def test_noisy_copy_is_a_near_match(index):
+    copy = _tune(2)[3 * SAMPLE_RATE:15 * SAMPLE_RATE]
+    copy += np.random.default_rng(0).normal(0, 0.1, len(copy)).astype(np.float32)
+    matches = index.match(*fingerprint(copy))
+    assert [m['track_id'] for m in matches] == [2]
+    assert not matches[0]['exact']
+
+
+def test_unrelated_audio_matches_nothing(index):
+    assert index.match(*fingerprint(_tune(99))) == []
+    assert index.match(*fingerprint(np.zeros(100, dtype=np.float32))) == []
+
+
+def test_excluded_and_removed_tracks_are_not_matched(index):
+    hashes, offsets = fingerprint(_tune(1))
+    assert index.match(hashes, offsets, exclude_track_id=1) == []
+    index.remove(1)
+    assert index.match(hashes, offsets) == []
+    assert index.indexed_track_ids() == {2, 3}
+
+
+def test_stereo_wav_at_another_rate_matches(index, tmp_path):
+    rate = 44100
+    mono = _tune(3, seconds=10, rate=rate)
+    path = str(tmp_path / 'upload.wav')
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes((np.repeat(mono, 2) * 20000).astype('<i2').tobytes())
+
+    assert len(load_audio(path)) == pytest.approx(10 * SAMPLE_RATE, abs=1)
+    matches = index.match(*fingerprint_file(path))
+    assert matches[0]['track_id'] == 3 and matches[0]['exact']
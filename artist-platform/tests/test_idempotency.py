@@ -0,0 +1,89 @@
+"""Idempotency-Key replay and conflict handling on a SQLite-backed store."""
+import sqlite3
+
+import pytest
+
+flask = pytest.importorskip('flask')
+
+from blockmusic_common.idempotency import REPLAYED_HEADER, IdempotencyStore, idempotent
+
+
+@pytest.fixture
+def store(tmp_path):
+    path = str(tmp_path / 'idempotency.db')
+    store = IdempotencyStore(lambda: sqlite3.connect(path), placeholder='?')
+    store.create_tables()
+    return store
+
+
+@pytest.fixture
+def client(store):
+    """An app whose /charge view counts its runs; the caller is the X-User header."""
+    app = flask.Flask(__name__)
+    app.runs = 0
+
+    @app.route('/charge', methods=['POST'])
+    @idempotent(store, 'charge', lambda: flask.request.headers['X-User'])
+    def charge():
+        app.runs += 1
+        if flask.request.get_json().get('fail'):
+            return {'error': 'upstream'}, 502
+        return {'run': app.runs}, 201
+
+    client = app.test_client()
+    client.runs = lambda: app.runs
+    return client
+
+
+def _post(client, body, key='k1', user='alice'):
+    return client.post('/charge', json=body, headers={'Idempotency-Key': key, 'X-User': user})
+
+
+def test_retry_replays_the_stored_response(client, store):
+    first = _post(client, {'amount': 5})
+    assert first.status_code == 201 and REPLAYED_HEADER not in first.headers
+
+    retry = _post(client, {'amount': 5})
+    assert retry.status_code == 201
+    assert retry.headers[REPLAYED_HEADER] == 'true'
+    assert retry.get_json() == {'run': 1}
+
+    # A store without the in-memory copy replays from the table
+    store._hot.clear()
+    assert _post(client, {'amount': 5}).get_json() == {'run': 1}
+    assert client.runs() == 1
+
+
+def test_same_key_with_a_different_body_conflicts(client):
+    _post(client, {'amount': 5})
+    conflict = _post(client, {'amount': 6})
+    assert conflict.status_code == 422
+    assert client.runs() == 1
+
+
+def test_keys_are_scoped_per_caller(client):
+    _post(client, {'amount': 5}, user='alice')
+    other = _post(client, {'amount': 5}, user='bob')
+    assert other.status_code == 201 and REPLAYED_HEADER not in other.headers
+    assert other.get_json() == {'run': 2}
+    assert _post(client, {'amount': 6}, user='carol').status_code == 201
+
+
+def test_unfinished_claim_blocks_until_released(store):
+    assert store.begin('charge:alice', 'k1', 'h') == ('new', None)
+    assert store.begin('charge:alice', 'k1', 'h') == ('in_progress', None)
+    assert store.begin('charge:bob', 'k1', 'h') == ('new', None)
+    store.release('charge:alice', 'k1')
+    assert store.begin('charge:alice', 'k1', 'h') == ('new', None)
+
+
+def test_server_error_releases_the_key(client):
+    assert _post(client, {'fail': True}).status_code == 502
+    assert _post(client, {'fail': True}).status_code == 502
+    assert client.runs() == 2
+
+
+def test_requests_without_a_key_always_run(client):
+    for _ in range(2):
+        client.post('/charge', json={'amount': 5}, headers={'X-User': 'alice'})
+    assert client.runs() == 2
@@ -0,0 +1,156 @@
+"""
+The root backend's double-entry ledger (ledger.py).
+
+ledger.py is written for Postgres through database.Database; here it runs on
+SQLite behind a small stand-in that rewrites the two Postgres-only spellings
+it uses (`%s` placeholders and SERIAL keys). Everything else it issues
+(ON CONFLICT, RETURNING, row-value comparison) SQLite runs as is.
+"""
+import sqlite3
+
+import pytest
+
+from ledger import InsufficientFunds, Ledger, from_units, to_units
+
+
+def _sqlite(query):
+    return (query.replace('%s', '?')
+            .replace('BIGSERIAL PRIMARY KEY', 'INTEGER PRIMARY KEY')
+            .replace('SERIAL PRIMARY KEY', 'INTEGER PRIMARY KEY'))
+
+
+class _Cursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, query, params=()):
+        return self._cursor.execute(_sqlite(query), params)
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+
+class _Connection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self):
+        return _Cursor(self._conn.cursor())
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+
+class _Replicas:
+    writes = 0
+
+    def mark_write(self):
+        self.writes += 1
+
+
+class SQLiteDatabase:
+    """The slice of database.Database the ledger uses."""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.replicas = _Replicas()
+
+    def get_db_connection(self):
+        return _Connection(sqlite3.connect(self.path))
+
+    def execute_query(self, query, params=()):
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        try:
+            return [dict(row) for row in conn.execute(_sqlite(query), params)]
+        finally:
+            conn.close()
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    db = SQLiteDatabase(tmp_path / 'ledger.db')
+    conn = sqlite3.connect(db.path)
+    conn.execute('CREATE TABLE wallets (id INTEGER PRIMARY KEY, user_id INTEGER, balance REAL DEFAULT 0.0)')
+    conn.executemany('INSERT INTO wallets (id, balance) VALUES (?, ?)', [(1, 12.5), (2, 0.0)])
+    conn.commit()
+    conn.close()
+    ledger = Ledger(db)
+    ledger.create_tables()
+    return ledger
+
+
+def _postings_sum(ledger):
+    return ledger.db.execute_query('SELECT SUM(amount) AS total FROM ledger_entries')[0]['total']
+
+
+def test_units_are_exact():
+    assert to_units(0.1) + to_units(0.2) == to_units('0.3') == 300000
+    assert to_units('1.0000005') == 1000000   # half-even
+    assert from_units(to_units(19.99)) == 19.99
+
+
+def test_legacy_balance_becomes_an_opening_entry(ledger):
+    assert ledger.get_balance_units(1) == to_units(12.5)   # no account yet: legacy column
+    result = ledger.deposit(1, '2.25')
+    assert result['balance_units'] == to_units(14.75)
+    assert ledger.get_balance_units(1) == to_units(14.75)
+
+    kinds = [entry['kind'] for entry in ledger.get_statement(1)]
+    assert kinds == ['deposit', 'opening_balance']
+    assert _postings_sum(ledger) == 0
+
+
+def test_overdraft_rolls_back(ledger):
+    ledger.deposit(2, 5)
+    with pytest.raises(InsufficientFunds):
+        ledger.withdraw(2, '5.000001')
+    assert ledger.get_balance_units(2) == to_units(5)
+    assert len(ledger.get_statement(2)) == 1
+
+    ledger.withdraw(2, 5)
+    assert ledger.get_balance_units(2) == 0
+
+
+def test_transfer_moves_units_between_wallets(ledger):
+    ledger.transfer(1, 2, '2.5', reference='tip')
+    assert ledger.get_balance_units(1) == to_units(10)
+    assert ledger.get_balance_units(2) == to_units(2.5)
+    with pytest.raises(InsufficientFunds):
+        ledger.transfer(2, 1, 3)
+    assert ledger.get_balance_units(2) == to_units(2.5)
+    assert _postings_sum(ledger) == 0
+
+
+def test_unknown_wallet(ledger):
+    assert ledger.deposit(99, 1) is None
+    assert ledger.transfer(1, 99, 1) is None
+    assert ledger.get_balance_units(99) is None
+    assert ledger.get_balance_units(1) == to_units(12.5)
+
+
+def test_postings_must_balance(ledger):
+    conn = ledger.db.get_db_connection()
+    try:
+        with pytest.raises(ValueError):
+            ledger._post(conn.cursor(), 'deposit', [(1, 10), (2, -9)])
+    finally:
+        conn.close()
+
+
+def test_statement_pages_with_a_keyset_cursor(ledger):
+    for amount in range(1, 6):
+        ledger.deposit(2, amount)
+    first = ledger.get_statement(2, limit=2)
+    assert [entry['amount'] for entry in first] == [to_units(5), to_units(4)]
+
+    last = first[-1]
+    second = ledger.get_statement(2, limit=2, before=(last['created_at'], last['id']))
+    assert [entry['amount'] for entry in second] == [to_units(3), to_units(2)]
+    assert second[0]['balance_after'] == to_units(1 + 2 + 3)
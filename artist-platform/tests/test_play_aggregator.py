@@ -0,0 +1,142 @@
+"""PlayAggregator ingest and flush against in-memory stand-ins for the database and MusicNFT."""
+import pytest
+
+pytest.importorskip('psycopg2')
+
+from play_aggregator import PlayAggregator, PlayCheckpoint
+
+
+class Streams:
+    """`streams` rows as Postgres can expose them: ids become visible out of order."""
+
+    def __init__(self, lag):
+        self.rows = []
+        self.stream_id_lag = lag
+
+    def commit(self, stream_id, track_id):
+        self.rows.append((stream_id, track_id))
+
+    def get_streams_after(self, last_stream_id, limit=10000):
+        return sorted(r for r in self.rows if r[0] > last_stream_id)[:limit]
+
+    def get_track_token_ids(self, track_ids):
+        return {t: 1000 + t for t in track_ids}
+
+
+class Sink:
+    """Mines every transaction at once, unless `hold` is set; one carrying a token in `bad` reverts."""
+
+    def __init__(self, chunk_size=10, bad=(), hold=False):
+        self.chunk_size = chunk_size
+        self.bad = set(bad)
+        self.hold = hold
+        self.sent = []
+        self._results = {}
+
+    def sign(self, token_deltas):
+        tx_hash = f'0x{len(self._results):04x}'
+        self._results[tx_hash] = None if self.hold else not self.bad & set(token_deltas)
+        return tx_hash, dict(token_deltas)
+
+    def send(self, raw_tx):
+        self.sent.append(raw_tx)
+
+    def status(self, tx_hash):
+        return self._results[tx_hash]
+
+
+def _aggregator(tmp_path, db, sink, **kwargs):
+    checkpoint = PlayCheckpoint(str(tmp_path / 'checkpoint.json'), lag=db.stream_id_lag)
+    kwargs.setdefault('ingest_batch', 3)
+    return PlayAggregator(db, sink, checkpoint, **kwargs)
+
+
+def test_late_commit_below_watermark_is_counted_once(tmp_path):
+    db = Streams(lag=4)
+    aggregator = _aggregator(tmp_path, db, Sink(), ingest_batch=5)
+    for stream_id in (1, 2, 4, 5):
+        db.commit(stream_id, 7)
+    assert aggregator.ingest() == 4
+
+    # Stream 3 commits after the watermark passed it
+    db.commit(3, 8)
+    db.commit(6, 7)
+    assert aggregator.ingest() == 2
+    assert aggregator.ingest() == 0
+    assert aggregator.checkpoint.pending == {7: 5, 8: 1}
+
+    restarted = PlayCheckpoint(aggregator.checkpoint.path, lag=4)
+    restarted.load()
+    assert restarted.stream.state() == aggregator.checkpoint.stream.state()
+
+
+def test_failing_token_is_isolated_then_held_back(tmp_path):
+    db = Streams(lag=0)
+    sink = Sink(bad={1002})
+    aggregator = _aggregator(tmp_path, db, sink, max_failures=2)
+    for stream_id, track_id in enumerate((1, 2, 3), start=1):
+        db.commit(stream_id, track_id)
+    aggregator.ingest()
+
+    # The batch reverts; the next flush sends each of its tracks alone
+    aggregator.flush()
+    assert sink.sent == [{1001: 1, 1002: 1, 1003: 1}]
+    aggregator.flush()
+    assert sink.sent[1:] == [{1001: 1}, {1002: 1}, {1003: 1}]
+    assert aggregator.checkpoint.failures == {2: 2}
+
+    # Track 2 reached max_failures: its plays are kept but no longer sent
+    db.commit(4, 2)
+    db.commit(5, 1)
+    aggregator.ingest()
+    aggregator.flush()
+    assert sink.sent[4:] == [{1001: 1}]
+    assert aggregator.checkpoint.pending == {2: 2}
+
+
+def test_dropped_transaction_is_resent_without_waiting_for_later_ones(tmp_path):
+    db = Streams(lag=0)
+    sink = Sink(chunk_size=1, hold=True)
+    aggregator = _aggregator(tmp_path, db, sink)
+    db.commit(1, 1)
+    db.commit(2, 2)
+    aggregator.ingest()
+    aggregator.flush()
+    assert len(aggregator.checkpoint.inflight) == 2
+
+    # The node drops the first transaction; the second waits behind its nonce
+    sink._results['0x0000'] = False
+    aggregator.flush()
+    assert sink.sent[2:] == [{1001: 1}]
+    assert [tx['deltas'] for tx in aggregator.checkpoint.inflight] == [{2: 1}, {1: 1}]
+
+
+def test_sink_status_polls_once_and_refetches_the_nonce_after_a_drop():
+    pytest.importorskip('web3')
+    from web3.exceptions import TransactionNotFound
+
+    from play_aggregator import MusicNFTPlaySink
+
+    class Eth:
+        receipts = {'0xmined': {'status': 1}, '0xreverted': {'status': 0}}
+        pool = {'0xpending'}
+
+        def get_transaction_receipt(self, tx_hash):
+            if tx_hash not in self.receipts:
+                raise TransactionNotFound(tx_hash)
+            return self.receipts[tx_hash]
+
+        def get_transaction(self, tx_hash):
+            if tx_hash not in self.pool:
+                raise TransactionNotFound(tx_hash)
+            return {'hash': tx_hash}
+
+    sink = MusicNFTPlaySink.__new__(MusicNFTPlaySink)
+    sink.w3 = type('W3', (), {'eth': Eth()})()
+    sink._nonce = 7
+    assert sink.status('0xmined') is True
+    assert sink.status('0xreverted') is False
+    assert sink.status('0xpending') is None
+    assert sink._nonce == 7
+    assert sink.status('0xdropped') is False
+    assert sink._nonce is None
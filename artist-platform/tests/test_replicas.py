@@ -0,0 +1,119 @@
+"""Read/write routing against two local SQLite databases standing in for a primary and a replica."""
+import sqlite3
+import time
+
+import pytest
+
+from blockmusic_common import replicas
+from blockmusic_common.idempotency import IdempotencyStore
+
+
+@pytest.fixture(autouse=True)
+def unpinned():
+    token = replicas._last_write.set(0.0)
+    yield
+    replicas._last_write.reset(token)
+
+
+@pytest.fixture
+def databases(tmp_path):
+    """(primary path, replica path), both holding a `users` table; only the primary has bob."""
+    paths = str(tmp_path / 'primary.db'), str(tmp_path / 'replica.db')
+    for path in paths:
+        with sqlite3.connect(path) as conn:
+            conn.execute('CREATE TABLE users (name TEXT)')
+            conn.execute("INSERT INTO users VALUES ('alice')")
+    with sqlite3.connect(paths[0]) as conn:
+        conn.execute("INSERT INTO users VALUES ('bob')")
+    return paths
+
+
+def _router(databases, **kwargs):
+    primary, replica = databases
+    return replicas.ReplicaRouter(lambda: sqlite3.connect(primary),
+                                  {'replica': lambda: sqlite3.connect(replica)}, **kwargs)
+
+
+def _names(conn):
+    try:
+        return sorted(name for name, in conn.execute('SELECT name FROM users'))
+    finally:
+        conn.close()
+
+
+def test_reads_go_to_the_replica(databases):
+    router = _router(databases)
+    assert _names(router.read_connection()) == ['alice']
+    assert router.status()['replicas'][0]['reads'] == 1
+
+
+def test_primary_connection_does_not_pin(databases):
+    router = _router(databases)
+    _names(router.primary_connection())
+    assert not router.pinned()
+    assert _names(router.read_connection()) == ['alice']
+
+
+def test_write_pins_reads_to_the_primary_until_the_pin_expires(databases):
+    router = _router(databases, pin_seconds=0.2)
+    router.mark_write()
+    assert _names(router.read_connection()) == ['alice', 'bob']
+    time.sleep(0.25)
+    assert _names(router.read_connection()) == ['alice']
+
+
+def test_unreachable_replica_falls_back_to_the_primary(databases, tmp_path):
+    router = replicas.ReplicaRouter(
+        lambda: sqlite3.connect(databases[0]),
+        {'replica': lambda: sqlite3.connect(str(tmp_path / 'missing' / 'replica.db'))}
+    )
+    assert _names(router.read_connection()) == ['alice', 'bob']
+    assert router.status()['replicas'][0]['healthy'] is False
+
+
+def test_idempotency_lookups_do_not_pin(databases):
+    router = _router(databases)
+    store = IdempotencyStore(router.primary_connection, placeholder='?')
+    store.create_tables()
+    assert store.begin('scope', 'key', 'hash') == ('new', None)
+    assert store.begin('scope', 'key', 'hash') == ('in_progress', None)
+    assert not router.pinned()
+
+
+def test_pin_is_carried_between_requests_in_a_cookie(databases):
+    flask = pytest.importorskip('flask')
+    router = _router(databases, pin_seconds=5)
+    app = flask.Flask(__name__)
+    router.init_app(app)
+
+    @app.route('/write', methods=['POST'])
+    def write():
+        router.mark_write()
+        return ''
+
+    @app.route('/names')
+    def names():
+        return {'names': _names(router.read_connection())}
+
+    client = app.test_client()
+    assert client.get('/names').json['names'] == ['alice']
+    client.post('/write')
+    assert client.get('/names').json['names'] == ['alice', 'bob']
+    assert app.test_client().get('/names').json['names'] == ['alice']
+
+
+def test_database_reads_its_own_writes(tmp_path):
+    pytest.importorskip('psycopg2')
+    import shutil
+
+    from models import Database
+
+    primary, replica = tmp_path / 'primary.db', tmp_path / 'replica.db'
+    Database(f'sqlite:///{primary}', replica_urls='')
+    shutil.copy(primary, replica)
+    db = Database(f'sqlite:///{primary}', replica_urls=f'sqlite:///{replica}')
+
+    db.create_user('carol', 'carol@example.com', 'pw')
+    assert db.get_user_by_username('carol')['username'] == 'carol'
+    replicas._last_write.set(0.0)
+    assert db.get_user_by_username('carol') is None
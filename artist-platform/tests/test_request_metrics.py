@@ -0,0 +1,37 @@
+"""Per-endpoint timing on a minimal Flask app."""
+import pytest
+
+flask = pytest.importorskip('flask')
+
+from blockmusic_common import request_metrics
+
+
+def _sample(name, **labels):
+    for metric in request_metrics.HTTP_REQUEST_SECONDS.collect() + request_metrics.HTTP_REQUESTS_TOTAL.collect():
+        for sample in metric.samples:
+            if sample.name == name and sample.labels == labels:
+                return sample.value
+    return 0.0
+
+
+def test_requests_are_timed_by_route_rule():
+    app = flask.Flask(__name__)
+    request_metrics.instrument_flask(app)
+
+    @app.route('/things/<int:thing_id>')
+    def thing(thing_id):
+        if thing_id == 0:
+            return {'error': 'missing'}, 404
+        return {'id': thing_id}
+
+    route = '/things/<int:thing_id>'
+    before = _sample('http_request_duration_seconds_count', method='GET', route=route)
+    client = app.test_client()
+    client.get('/things/1')
+    client.get('/things/2')
+    client.get('/things/0')
+
+    assert _sample('http_request_duration_seconds_count', method='GET', route=route) == before + 3
+    assert _sample('http_requests_total', method='GET', route=route, status='404') >= 1
+    body = client.get('/metrics').get_data(as_text=True)
+    assert 'http_request_duration_seconds_bucket{le="0.005",method="GET",route="/things/<int:thing_id>"}' in body
@@ -0,0 +1,70 @@
+"""Track search and typo correction on the SQLite FTS5 index."""
+import pytest
+
+import search
+from search import TrackSearch, edit_distance
+
+
+@pytest.fixture
+def catalog(db):
+    artist = db.create_user('beatles', 'fab@example.com', 'Password1', is_artist=True)
+    other = db.create_user('Beyoncé', 'b@example.com', 'Password1', is_artist=True)
+    db.create_track('Yesterday', 'A ballad', 'Pop', 125, 0, 'y.mp3', artist)
+    db.create_track('Help', 'Yesterday was easier', 'Rock', 140, 0, 'h.mp3', artist)
+    db.create_track('Halo', 'Ballad', 'Rhythm', 261, 0, 'halo.mp3', other)
+    return TrackSearch(db)
+
+
+def _titles(result):
+    return [track['title'] for track in result['results']]
+
+
+def test_edit_distance():
+    assert edit_distance('beatles', 'beatles', 2) == 0
+    assert edit_distance('beatels', 'beatles', 2) == 1   # one transposition
+    assert edit_distance('rok', 'rock', 1) == 1
+    assert edit_distance('halo', 'yesterday', 2) == 3    # gives up past the limit
+
+
+def test_title_matches_rank_above_description(catalog):
+    result = catalog.search('yesterday')
+    assert _titles(result) == ['Yesterday', 'Help']
+    assert result['corrected_query'] is None
+
+
+def test_last_term_matches_as_a_prefix(catalog):
+    assert _titles(catalog.search('yest')) == ['Yesterday', 'Help']
+    assert _titles(catalog.search('beyonce ha')) == ['Halo']   # diacritics are folded
+
+
+def test_misspelled_terms_are_corrected(catalog):
+    result = catalog.search('beatels help')
+    assert result['corrected_query'] == 'beatles help'
+    assert _titles(result) == ['Help']
+
+    result = catalog.search('rok')
+    assert result['corrected_query'] == 'rock'
+    assert _titles(result) == ['Help']
+
+
+def test_misspelled_prefix_is_corrected_while_typing(catalog):
+    result = catalog.search('yesetr')
+    assert result['corrected_query'] == 'yesterday'
+    assert _titles(result) == ['Yesterday', 'Help']
+
+
+def test_nothing_close_returns_no_results(catalog):
+    assert catalog.search('zzzzzz') == {'results': [], 'corrected_query': None}
+    assert catalog.search('  ') == {'results': [], 'corrected_query': None}
+
+
+def test_rebuild_indexes_tracks_written_without_it(db, catalog):
+    conn = db.get_db_connection()
+    try:
+        conn.execute("INSERT INTO tracks (title, file_path, artist_id) VALUES ('Imported', 'i.mp3', 1)")
+        assert search.rebuild(conn.cursor()) == 1
+        assert search.rebuild(conn.cursor()) == 0
+        conn.commit()
+    finally:
+        conn.close()
+    assert _titles(catalog.search('imported')) == ['Imported']
@@ -0,0 +1,96 @@
+"""Settlement math against RevenueDistributor's integer rounding, and the period read from the chain index."""
+import pytest
+
+from chain_indexer import SUBSCRIBER
+from settlement import MIN_DISTRIBUTION_AMOUNT, build_plan, compute_settlement
+
+ALICE = '0x' + 'aa' * 20
+BOB = '0x' + 'bb' * 20
+ETHER = 10 ** 18
+
+
+def _contract(token_artists, plays, revenue, total_plays):
+    """RevenueDistributor.distributeRevenue, step by step: artistPendingRevenue per artist."""
+    platform_fee = revenue * 20 // 100
+    revenue_per_play = (revenue - platform_fee) // total_plays
+    pending = {}
+    for artist, count in zip(token_artists, plays):
+        if count:
+            pending[artist] = pending.get(artist, 0) + count * revenue_per_play
+    return pending
+
+
+def test_payouts_floor_like_the_contract():
+    artists, plays = [ALICE, BOB, ALICE], [3, 1, 3]
+    settlement = compute_settlement([1, 2, 3], artists, plays, ETHER)
+
+    assert settlement.platform_fee == ETHER // 5
+    assert settlement.revenue_per_play == (ETHER - ETHER // 5) // 7
+    assert dict(zip(settlement.artists, settlement.artist_amounts)) == _contract(artists, plays, ETHER, 7)
+    # 0.8 ether doesn't divide by 7 plays; the remainder stays in the contract
+    assert settlement.undistributed == (ETHER - ETHER // 5) % 7
+    assert not settlement.errors
+
+
+def test_artistless_tokens_still_count_in_total_plays():
+    artists, plays = [ALICE, None, BOB], [2, 6, 2]
+    settlement = compute_settlement([1, 2, 3], artists, plays, ETHER)
+
+    # The contract divides by all 10 plays, not the 4 it can pay out
+    assert settlement.total_plays == 10
+    assert settlement.revenue_per_play == (ETHER - ETHER // 5) // 10
+    assert settlement.skipped_token_ids == [2]
+    assert settlement.token_ids.tolist() == [1, 3]
+    assert settlement.total_paid <= settlement.artist_revenue
+    assert not any('differ' in w for w in settlement.warnings)
+
+
+def test_total_plays_mismatch_and_low_revenue_are_reported():
+    settlement = compute_settlement([1], [ALICE], [4], MIN_DISTRIBUTION_AMOUNT - 1, total_plays=5)
+    assert any('differ from totalPlaysThisPeriod (5)' in w for w in settlement.warnings)
+    assert 'Insufficient revenue' in settlement.errors
+
+
+def test_plan_chunks_payouts_by_gas():
+    artists = [f'0x{i:040x}' for i in range(10)]
+    settlement = compute_settlement(range(10), artists, [1] * 10, ETHER)
+    plan = build_plan(settlement, gas_limit=30_000 + 45_000 * 4)
+
+    assert [len(chunk['artists']) for chunk in plan['batchPayArtists']] == [4, 4, 2]
+    assert sum(int(a) for chunk in plan['batchPayArtists'] for a in chunk['amounts']) == settlement.total_paid
+    assert plan['distributeRevenue']['tokenIds'] == list(range(10))
+
+
+def _event(name, block, args):
+    return {'event': name, 'args': args, 'block_number': block, 'log_index': 0, 'tx_hash': f'0x{block:02x}'}
+
+
+def test_period_plays_start_after_the_last_distribution(chain_index):
+    blocks = [(n, f'0x{n:064x}') for n in range(1, 8)]
+    chain_index.apply([
+        _event('TrackRegistered', 1, {'tokenId': 1, 'artist': ALICE}),
+        _event('PlayRecorded', 2, {'tokenId': 1, 'listener': BOB, 'timestamp': 0}),
+        _event('RevenueDistributed', 3, {'totalRevenue': ETHER, 'totalPlays': 1,
+                                         'platformFee': ETHER // 5, 'artistRevenue': ETHER - ETHER // 5}),
+        _event('PlayRecorded', 4, {'tokenId': 1, 'listener': BOB, 'timestamp': 0}),
+        _event('PlayRecorded', 5, {'tokenId': 2, 'listener': BOB, 'timestamp': 0}),
+        # Reassigned: the contract pays the new artist for the whole period
+        _event('TrackRegistered', 6, {'tokenId': 1, 'artist': BOB}),
+        _event('PlayRecorded', 7, {'tokenId': 1, 'listener': ALICE, 'timestamp': 0}),
+    ], blocks)
+
+    rows = chain_index.get_period_plays()
+    assert rows == [(1, BOB, 2), (2, None, 1)]
+    settlement = compute_settlement(*zip(*rows), ETHER)
+    assert settlement.total_plays == 3
+    assert settlement.artists == [BOB]
+    assert settlement.skipped_token_ids == [2]
+    assert chain_index.get_track_plays(1) == {SUBSCRIBER: 3}
+
+
+@pytest.mark.parametrize('plays', [[10 ** 12, 1], [1, 10 ** 6]])
+def test_large_counts_stay_exact(plays):
+    revenue = 10 ** 30
+    settlement = compute_settlement([1, 2], [ALICE, BOB], plays, revenue)
+    assert dict(zip(settlement.artists, settlement.artist_amounts)) == \
+        _contract([ALICE, BOB], plays, revenue, sum(plays))
@@ -0,0 +1,145 @@
+"""Monthly `streams` partitions on SQLite: migration, inserts, period reads and retention."""
+import csv
+import gzip
+import sqlite3
+from datetime import datetime, timezone
+
+import pytest
+
+import stream_partitions
+from stream_partitions import create_schema, insert_stream, partitions, period_source, run_retention
+
+NOW = datetime(2024, 3, 15, 12, 0, tzinfo=timezone.utc)
+
+
+class SQLiteDB:
+    """What run_retention needs from models.Database."""
+
+    db_url = None
+
+    def __init__(self, path):
+        self.path = path
+
+    def get_db_connection(self):
+        return sqlite3.connect(self.path)
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'streams.db'))
+    yield conn
+    conn.close()
+
+
+def _legacy_streams(conn, rows):
+    conn.execute('''
+        CREATE TABLE streams (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            track_id INTEGER NOT NULL,
+            date_streamed DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('CREATE INDEX idx_streams_user ON streams (user_id)')
+    conn.executemany('INSERT INTO streams (id, user_id, track_id, date_streamed) VALUES (?, ?, ?, ?)', rows)
+    conn.commit()
+
+
+def _streams(conn):
+    return conn.execute('SELECT id, user_id, track_id, date_streamed FROM streams ORDER BY id').fetchall()
+
+
+def test_legacy_table_is_migrated_keeping_ids(conn, monkeypatch):
+    monkeypatch.setattr(stream_partitions, 'current_month', lambda now=None: (2024, 3))
+    rows = [(1, 1, 10, '2024-01-05 10:00:00'), (2, 2, 11, '2024-02-29 23:59:59'), (5, 1, 12, '2024-03-01 00:00:00')]
+    _legacy_streams(conn, rows)
+    conn.execute('DELETE FROM streams WHERE id = 5')
+    conn.execute("INSERT INTO streams (id, user_id, track_id, date_streamed) VALUES (3, 3, 13, '2024-02-01 00:00:00')")
+    create_schema(conn.cursor())
+    conn.commit()
+
+    assert partitions(conn.cursor()) == [(2024, 1), (2024, 2), (2024, 3), (2024, 4)]
+    assert _streams(conn) == sorted(rows[:2] + [(3, 3, 13, '2024-02-01 00:00:00')])
+    assert conn.execute('SELECT COUNT(*) FROM streams_2024_02').fetchone()[0] == 2
+    # Numbering continues after the highest id ever handed out (5), not the highest left (3)
+    assert insert_stream(conn.cursor(), 4, 14, now=NOW) == 6
+
+    # Running it again is a no-op
+    create_schema(conn.cursor())
+    assert len(_streams(conn)) == 4
+
+
+def test_inserts_go_to_their_month(conn):
+    create_schema(conn.cursor())
+    first = insert_stream(conn.cursor(), 1, 10, now=NOW)
+    second = insert_stream(conn.cursor(), 1, 11, now=datetime(2030, 7, 1, tzinfo=timezone.utc))
+    conn.commit()
+    assert second == first + 1
+    assert (2030, 7) in partitions(conn.cursor())
+    assert conn.execute('SELECT id FROM streams_2030_07').fetchall() == [(second,)]
+    assert [row[0] for row in _streams(conn)] == [first, second]
+
+
+def test_period_source_reads_only_overlapping_partitions(conn):
+    create_schema(conn.cursor())
+    for day in (datetime(2024, 1, 31, 23, tzinfo=timezone.utc), datetime(2024, 2, 1, tzinfo=timezone.utc),
+                datetime(2024, 3, 1, tzinfo=timezone.utc)):
+        insert_stream(conn.cursor(), 1, 10, now=day)
+
+    source = period_source(conn.cursor(), '2024-02-01', '2024-03-01')
+    assert 'streams_2024_02' in source and 'streams_2024_01' not in source and 'streams_2024_03' not in source
+    count = conn.execute(f"SELECT COUNT(*) FROM {source} AS s "
+                         f"WHERE s.date_streamed >= '2024-02-01' AND s.date_streamed < '2024-03-01'").fetchone()[0]
+    assert count == 1
+    assert conn.execute(f'SELECT COUNT(*) FROM {period_source(conn.cursor(), "1990-01-01", "1990-02-01")}').fetchone()[0] == 0
+    assert period_source(conn.cursor(), '2024-02-01', '2024-03-01', postgres=True) == 'streams'
+
+
+def test_retention_archives_then_drops_old_partitions(tmp_path):
+    db = SQLiteDB(str(tmp_path / 'streams.db'))
+    conn = db.get_db_connection()
+    create_schema(conn.cursor())
+    for month in (1, 2, 3):
+        for day in (1, 2):
+            insert_stream(conn.cursor(), day, month, now=datetime(2024, month, day, tzinfo=timezone.utc))
+    conn.commit()
+    conn.close()
+
+    archive_dir = str(tmp_path / 'archive')
+    archived = run_retention(db, archive_dir, retain_months=2, now=NOW)
+    assert archived == {'streams_2024_01': 2}
+
+    with gzip.open(tmp_path / 'archive' / 'streams_2024_01.csv.gz', 'rt', newline='') as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ['id', 'user_id', 'track_id', 'date_streamed']
+    assert [row[2] for row in rows[1:]] == ['1', '1']
+
+    conn = db.get_db_connection()
+    try:
+        assert partitions(conn.cursor())[0] == (2024, 2)
+        assert (2024, 4) in partitions(conn.cursor())
+        assert [row[2] for row in _streams(conn)] == [2, 2, 3, 3]
+    finally:
+        conn.close()
+    assert run_retention(db, archive_dir, retain_months=2, now=NOW) == {}
+    with pytest.raises(ValueError):
+        run_retention(db, archive_dir, retain_months=0, now=NOW)
+
+
+class RecordingCursor:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, query, params=None):
+        self.statements.append(' '.join(query.split()))
+
+    def fetchone(self):
+        return (42,)
+
+
+def test_postgres_insert_runs_no_ddl():
+    cursor = RecordingCursor()
+    assert insert_stream(cursor, 1, 10, postgres=True, now=NOW) == 42
+    assert cursor.statements == [
+        'INSERT INTO streams (user_id, track_id, date_streamed) VALUES (%s, %s, %s) RETURNING id'
+    ]
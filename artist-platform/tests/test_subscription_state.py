@@ -0,0 +1,168 @@
+"""
+SubscriptionState against an in-process chain (web3's EthereumTesterProvider).
+
+SubscriptionV2 is replaced by hand-assembled stand-ins: one emits the
+`Subscribed` / `SubscriptionExtended` logs described by its call data (up to
+two per transaction, as an extension does), the other answers
+`userSubscriptions` with fixed values for the RPC fallback.
+"""
+import threading
+
+import pytest
+
+pytest.importorskip('eth_tester')
+
+from eth_abi import encode
+from web3 import EthereumTesterProvider, Web3
+
+from subscription_state import SubscriptionLookupError, SubscriptionState
+
+USER = '0x' + '33' * 20
+DAY = 86400
+
+
+def _deploy_code(runtime):
+    """Init code that returns `runtime` as the contract's code."""
+    assert len(runtime) < 256
+    return bytes([0x60, len(runtime), 0x80, 0x60, 0x0b, 0x60, 0x00, 0x39, 0x60, 0x00, 0xf3]) + runtime
+
+
+def _log2(base):
+    """LOG2 of the 160-byte record at call data offset `base`: two topics, then three data words."""
+    return bytes([
+        0x60, 0x60, 0x60, base + 64, 0x60, 0x00, 0x37,   # CALLDATACOPY(0, base + 64, 96)
+        0x60, base + 32, 0x35, 0x60, base, 0x35,         # topic1, topic0
+        0x60, 0x60, 0x60, 0x00, 0xa2                     # LOG2(0, 96, topic0, topic1)
+    ])
+
+
+def _event_emitter_code():
+    """Logs the first record, and the second one when the call data holds two."""
+    first = _log2(0)
+    end = len(first) + 9 + len(_log2(160))
+    runtime = first + bytes([0x60, 0xa0, 0x36, 0x11, 0x15, 0x60, end, 0x57])   # stop unless size > 160
+    runtime += b'\x00' + _log2(160) + bytes([0x5b, 0x00])                      # ...; JUMPDEST STOP
+    assert runtime[end] == 0x5b
+    return _deploy_code(runtime)
+
+
+def _returner_code(data):
+    """A contract that answers every call with `data`."""
+    runtime = bytes([0x60, len(data), 0x60, 0x0c, 0x60, 0x00, 0x39, 0x60, len(data), 0x60, 0x00, 0xf3])
+    return _deploy_code(runtime + data)
+
+
+class Chain:
+    def __init__(self):
+        self.w3 = Web3(EthereumTesterProvider())
+        self.sender = self.w3.eth.accounts[0]
+        self.subscriptions = self.deploy(_event_emitter_code())
+
+    def deploy(self, code):
+        tx = self.w3.eth.send_transaction({'from': self.sender, 'data': code})
+        return self.w3.eth.get_transaction_receipt(tx)['contractAddress']
+
+    def _record(self, signature, user, words):
+        return (self.w3.keccak(text=signature) + encode(['address'], [user])
+                + encode(['uint256'] * 3, words))
+
+    def subscribed(self, user, duration, plan=1, amount=10):
+        return self._record('Subscribed(address,uint256,uint256,uint256)', user, [plan, amount, duration])
+
+    def extended(self, user, new_end_time, plan=1, amount=10):
+        return self._record('SubscriptionExtended(address,uint256,uint256,uint256)', user,
+                            [plan, amount, new_end_time])
+
+    def emit(self, *records):
+        tx = self.w3.eth.send_transaction({
+            'from': self.sender, 'to': self.subscriptions, 'gas': 100000, 'data': b''.join(records)
+        })
+        receipt = self.w3.eth.get_transaction_receipt(tx)
+        return self.w3.eth.get_block(receipt['blockNumber'])['timestamp']
+
+    def mine(self, blocks):
+        self.w3.provider.ethereum_tester.mine_blocks(blocks)
+
+
+@pytest.fixture
+def chain():
+    return Chain()
+
+
+def test_subscribed_sets_end_time_once_confirmed(chain):
+    state = SubscriptionState(chain.w3, chain.subscriptions, confirmations=2)
+    timestamp = chain.emit(chain.subscribed(USER, 30 * DAY))
+    state.sync()
+    assert USER.lower() not in state._end_times
+
+    chain.mine(2)
+    state.sync()
+    assert state.get_end_time(USER, now=timestamp) == timestamp + 30 * DAY
+    assert state.is_active(USER, now=timestamp)
+
+
+def test_extension_uses_the_new_end_time(chain):
+    state = SubscriptionState(chain.w3, chain.subscriptions, confirmations=0)
+    timestamp = chain.emit(chain.subscribed(USER, 30 * DAY))
+    # An extension logs SubscriptionExtended then Subscribed in one transaction;
+    # the Subscribed duration must not be read as counting from this block
+    new_end = timestamp + 40 * DAY
+    chain.emit(chain.extended(USER, new_end), chain.subscribed(USER, 365 * DAY))
+    state.sync()
+    assert state.get_end_time(USER, now=timestamp) == new_end
+
+
+def test_end_time_never_moves_back(chain):
+    state = SubscriptionState(chain.w3, chain.subscriptions, confirmations=0)
+    timestamp = chain.emit(chain.subscribed(USER, 30 * DAY))
+    chain.emit(chain.extended(USER, timestamp + DAY))
+    state.sync()
+    assert state.get_end_time(USER, now=timestamp) == timestamp + 30 * DAY
+
+
+def test_unknown_user_falls_back_to_the_contract(chain):
+    now = chain.w3.eth.get_block('latest')['timestamp']
+    reader = chain.deploy(_returner_code(encode(['uint256', 'uint256', 'bool', 'uint256'],
+                                                [now - DAY, now + 7 * DAY, True, 10])))
+    state = SubscriptionState(chain.w3, reader, max_rpc_calls=1, rpc_wait=0.01)
+    assert state.get_end_time(USER, now=now) == now + 7 * DAY
+
+    # A live entry is answered from memory, even with every RPC slot taken
+    state._rpc_slots.acquire()
+    assert state.get_end_time(USER, now=now) == now + 7 * DAY
+
+
+def test_inactive_subscription_is_cached_for_miss_ttl(chain):
+    now = chain.w3.eth.get_block('latest')['timestamp']
+    reader = chain.deploy(_returner_code(encode(['uint256', 'uint256', 'bool', 'uint256'],
+                                                [now - 30 * DAY, now - DAY, False, 10])))
+    state = SubscriptionState(chain.w3, reader, miss_ttl=30, max_rpc_calls=1, rpc_wait=0.01)
+    assert state.get_end_time(USER, now=now) == 0
+
+    state._rpc_slots.acquire()
+    assert state.get_end_time(USER, now=now + 10) == 0
+    with pytest.raises(SubscriptionLookupError):
+        state.get_end_time(USER, now=now + 31)
+
+
+def test_overloaded_lookup_raises(chain):
+    now = chain.w3.eth.get_block('latest')['timestamp']
+    reader = chain.deploy(_returner_code(encode(['uint256', 'uint256', 'bool', 'uint256'],
+                                                [now, now + DAY, True, 10])))
+    state = SubscriptionState(chain.w3, reader, max_rpc_calls=2, rpc_wait=0.05)
+    for _ in range(2):
+        state._rpc_slots.acquire()
+    with pytest.raises(SubscriptionLookupError, match='overloaded'):
+        state.get_end_time(USER, now=now)
+
+    # A freed slot lets the next lookup through
+    threading.Timer(0.01, state._rpc_slots.release).start()
+    state.rpc_wait = 1.0
+    assert state.get_end_time(USER, now=now) == now + DAY
+
+
+def test_failed_rpc_lookup_raises(chain):
+    # No code at the address: the call returns nothing and can't be decoded
+    state = SubscriptionState(chain.w3, '0x' + '44' * 20)
+    with pytest.raises(SubscriptionLookupError):
+        state.get_end_time(USER)
@@ -0,0 +1,6 @@
+"""
+Helpers shared by the root Flask backend and artist-platform.
+
+Installed from `common/` by both requirements files, so each module has a
+single copy: `from blockmusic_common import idempotency`.
+"""
@@ -0,0 +1,241 @@
+"""
+Idempotency-Key support for write endpoints.
+
+A client sends an `Idempotency-Key` header with a write; the first request
+claims the key and runs, and its response is stored. Keys are scoped per
+caller, so two users who happen to pick the same key never see each other's
+responses. A retry with the same
+key gets the stored response back without running the handler again. If the
+same key arrives with a different body, the request is rejected (422). If it
+arrives while the first request is still running, it gets 409.
+
+Completed responses are kept in an indexed `idempotency_keys` table until
+they expire, and the most recent ones are also held in an in-memory LRU, so
+most retries never reach the database.
+
+Works with both psycopg2 (`%s`) and sqlite3 (`?`) connections.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import jsonify, make_response, request
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyStore:
+    def __init__(self, connect, placeholder='%s', ttl=24 * 3600, hot_size=10000, lock_timeout=60):
+        """
+        `connect` returns a new DB-API connection. A claim that has not
+        completed within `lock_timeout` seconds (e.g. the worker died) may be
+        taken over by a retry.
+        """
+        self.connect = connect
+        self.placeholder = placeholder
+        self.ttl = ttl
+        self.hot_size = hot_size
+        self.lock_timeout = lock_timeout
+        self._hot = OrderedDict()   # (scope, key) -> (expires_at, request_hash, status, body)
+        self._lock = threading.Lock()
+        self._next_purge = 0.0
+
+    def _sql(self, query):
+        return query.replace('?', self.placeholder)
+
+    def create_tables(self):
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS idempotency_keys (
+                    scope TEXT NOT NULL,
+                    idempotency_key TEXT NOT NULL,
+                    request_hash TEXT NOT NULL,
+                    status_code INTEGER,
+                    response_body TEXT,
+                    created_at DOUBLE PRECISION NOT NULL,
+                    expires_at DOUBLE PRECISION NOT NULL,
+                    PRIMARY KEY (scope, idempotency_key)
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires
+                ON idempotency_keys (expires_at)
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _remember(self, scope, key, entry):
+        with self._lock:
+            self._hot[(scope, key)] = entry
+            self._hot.move_to_end((scope, key))
+            while len(self._hot) > self.hot_size:
+                self._hot.popitem(last=False)
+
+    def _hot_get(self, scope, key, now):
+        with self._lock:
+            entry = self._hot.get((scope, key))
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self._hot[(scope, key)]
+                return None
+            self._hot.move_to_end((scope, key))
+            return entry
+
+    def begin(self, scope, key, request_hash):
+        """
+        Claim `key` for a new request.
+
+        Returns ('new', None) if the caller should run the request,
+        ('replay', (status, body)) for a completed one, ('conflict', None)
+        for a body mismatch and ('in_progress', None) while another request
+        holds the key.
+        """
+        now = time.time()
+        entry = self._hot_get(scope, key, now)
+        if entry:
+            if entry[1] != request_hash:
+                return 'conflict', None
+            return 'replay', (entry[2], entry[3])
+
+        if now >= self._next_purge:
+            self.purge_expired(now)
+
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self._sql('''
+                INSERT INTO idempotency_keys (scope, idempotency_key, request_hash, created_at, expires_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (scope, idempotency_key) DO NOTHING
+            '''), (scope, key, request_hash, now, now + self.ttl))
+            if cursor.rowcount == 1:
+                conn.commit()
+                return 'new', None
+
+            cursor.execute(self._sql('''
+                SELECT request_hash, status_code, response_body, created_at, expires_at
+                FROM idempotency_keys WHERE scope = ? AND idempotency_key = ?
+            '''), (scope, key))
+            row = cursor.fetchone()
+            if row is None:
+                # Purged between the insert and the read; let the client retry
+                conn.rollback()
+                return 'in_progress', None
+            stored_hash, status, body, created_at, expires_at = row
+
+            if expires_at <= now or (status is None and created_at <= now - self.lock_timeout):
+                # Expired or abandoned: take the key over (compare-and-set on created_at)
+                cursor.execute(self._sql('''
+                    UPDATE idempotency_keys
+                    SET request_hash = ?, status_code = NULL, response_body = NULL,
+                        created_at = ?, expires_at = ?
+                    WHERE scope = ? AND idempotency_key = ? AND created_at = ?
+                '''), (request_hash, now, now + self.ttl, scope, key, created_at))
+                conn.commit()
+                return ('new', None) if cursor.rowcount == 1 else ('in_progress', None)
+
+            conn.rollback()
+            if stored_hash != request_hash:
+                return 'conflict', None
+            if status is None:
+                return 'in_progress', None
+            self._remember(scope, key, (expires_at, stored_hash, status, body))
+            return 'replay', (status, body)
+        finally:
+            conn.close()
+
+    def complete(self, scope, key, request_hash, status, body):
+        """Store the response for a claimed key."""
+        now = time.time()
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self._sql('''
+                UPDATE idempotency_keys
+                SET status_code = ?, response_body = ?, expires_at = ?
+                WHERE scope = ? AND idempotency_key = ? AND request_hash = ?
+            '''), (status, body, now + self.ttl, scope, key, request_hash))
+            conn.commit()
+        finally:
+            conn.close()
+        self._remember(scope, key, (now + self.ttl, request_hash, status, body))
+
+    def release(self, scope, key):
+        """Drop an unfinished claim so the request can be retried."""
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self._sql('''
+                DELETE FROM idempotency_keys
+                WHERE scope = ? AND idempotency_key = ? AND status_code IS NULL
+            '''), (scope, key))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def purge_expired(self, now=None):
+        now = now or time.time()
+        self._next_purge = now + min(self.ttl, 300)
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self._sql('DELETE FROM idempotency_keys WHERE expires_at <= ?'), (now,))
+            conn.commit()
+        finally:
+            conn.close()
+
+
+def idempotent(store, scope, principal):
+    """
+    Make a Flask view idempotent per `Idempotency-Key` header.
+
+    `principal()` returns the id of the caller (e.g. `current_user.id`);
+    keys are claimed under `f'{scope}:{principal()}'`, so it must run after
+    authentication. Requests without the header run as before. Server errors (5xx) and
+    exceptions release the key so the client can retry; any other response
+    is stored and replayed.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not key:
+                return f(*args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return jsonify({'error': 'Idempotency key too long'}), 400
+
+            request_hash = hashlib.sha256(
+                request.method.encode() + b' ' + request.path.encode() + b'\n' + request.get_data()
+            ).hexdigest()
+            caller_scope = f'{scope}:{principal()}'
+            state, stored = store.begin(caller_scope, key, request_hash)
+            if state == 'replay':
+                response = make_response(stored[1], stored[0])
+                response.mimetype = 'application/json'
+                response.headers[REPLAYED_HEADER] = 'true'
+                return response
+            if state == 'conflict':
+                return jsonify({'error': 'Idempotency key reused with a different request'}), 422
+            if state == 'in_progress':
+                return jsonify({'error': 'A request with this idempotency key is in progress'}), 409
+
+            try:
+                response = make_response(f(*args, **kwargs))
+            except Exception:
+                store.release(caller_scope, key)
+                raise
+            if response.status_code >= 500:
+                store.release(caller_scope, key)
+            else:
+                store.complete(caller_scope, key, request_hash, response.status_code, response.get_data(as_text=True))
+            return response
+        return decorated_function
+    return decorator
@@ -0,0 +1,175 @@
+"""
+Read/write routing between a primary database and read replicas.
+
+Reads are spread round-robin over the healthy replicas. A replica is
+health-checked on use at most every `check_interval` seconds: one that
+can't be reached, or whose replication lag exceeds `max_lag`, is skipped
+until its next check. With no healthy replica, reads go to the primary.
+
+Read-your-writes: `mark_write()`, called after a write commits, marks the
+current request context, and for `pin_seconds` afterwards that client's
+reads go to the primary. Opening a primary connection does not pin by
+itself, so reads that merely need the primary don't send later reads there. With
+`init_app`, the mark is carried in a cookie, so the pin holds across
+requests and across worker processes (e.g. a wallet read right after a
+deposit).
+
+Works with both psycopg2 and sqlite3 connections.
+"""
+import itertools
+import logging
+import threading
+import time
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+PIN_COOKIE = 'db_last_write'
+
+# Seconds the replica is behind; 0 when it has replayed everything it received
+POSTGRES_LAG_QUERY = '''
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+'''
+
+# Wall-clock time of this context's last write (0 = none)
+_last_write = ContextVar('db_last_write', default=0.0)
+
+
+class _Replica:
+    __slots__ = ('name', 'connect', 'healthy', 'next_check', 'lag', 'reads', 'errors')
+
+    def __init__(self, name, connect):
+        self.name = name
+        self.connect = connect
+        self.healthy = True
+        self.next_check = 0.0
+        self.lag = None
+        self.reads = 0
+        self.errors = 0
+
+
+class ReplicaRouter:
+    def __init__(self, connect_primary, replicas=(), pin_seconds=5.0, check_interval=10.0,
+                 lag_query=None, max_lag=None):
+        """
+        `connect_primary` and each of `replicas` (name -> connect callable)
+        return a new DB-API connection. `lag_query` returns the replica's lag
+        in seconds; without it the health check is `SELECT 1`.
+        """
+        self.connect_primary = connect_primary
+        self.pin_seconds = pin_seconds
+        self.check_interval = check_interval
+        self.lag_query = lag_query
+        self.max_lag = max_lag
+        self._replicas = [_Replica(name, connect) for name, connect in dict(replicas).items()]
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+        self.primary_reads = 0
+
+    @property
+    def enabled(self):
+        return bool(self._replicas)
+
+    def mark_write(self):
+        """Pin this context's reads to the primary for `pin_seconds`."""
+        _last_write.set(time.time())
+
+    def pinned(self):
+        return time.time() - _last_write.get() < self.pin_seconds
+
+    def primary_connection(self):
+        """A primary connection. Call `mark_write` once a write on it commits."""
+        return self.connect_primary()
+
+    def read_connection(self):
+        """A replica connection, or the primary when pinned or no replica is healthy."""
+        if self._replicas and not self.pinned():
+            with self._lock:
+                start = next(self._next)
+            for i in range(len(self._replicas)):
+                replica = self._replicas[(start + i) % len(self._replicas)]
+                now = time.monotonic()
+                if not replica.healthy and now < replica.next_check:
+                    continue
+                conn = self._open(replica, now)
+                if conn is not None:
+                    replica.reads += 1
+                    return conn
+        self.primary_reads += 1
+        return self.connect_primary()
+
+    def _open(self, replica, now):
+        try:
+            conn = replica.connect()
+        except Exception as e:
+            self._set_health(replica, False, now, f'connect failed: {e}')
+            return None
+        if now < replica.next_check:
+            return conn
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self.lag_query or 'SELECT 1')
+            value = cursor.fetchone()[0]
+        except Exception as e:
+            conn.close()
+            self._set_health(replica, False, now, f'health check failed: {e}')
+            return None
+        if self.lag_query:
+            replica.lag = float(value)
+            if self.max_lag is not None and replica.lag > self.max_lag:
+                conn.close()
+                self._set_health(replica, False, now, f'lag {replica.lag:.1f}s exceeds {self.max_lag}s')
+                return None
+        self._set_health(replica, True, now)
+        return conn
+
+    def _set_health(self, replica, healthy, now, reason=None):
+        if not healthy:
+            replica.errors += 1
+        if healthy != replica.healthy:
+            if healthy:
+                logger.info(f"Replica {replica.name} is back in rotation")
+            else:
+                logger.warning(f"Replica {replica.name} taken out of rotation: {reason}")
+        replica.healthy = healthy
+        replica.next_check = now + self.check_interval
+
+    def status(self):
+        return {
+            'primary_reads': self.primary_reads,
+            'replicas': [
+                {'name': r.name, 'healthy': r.healthy, 'lag': r.lag, 'reads': r.reads, 'errors': r.errors}
+                for r in self._replicas
+            ]
+        }
+
+    def init_app(self, app, cookie=PIN_COOKIE):
+        """Carry the read-your-writes pin between a client's requests in a cookie."""
+        from flask import g, request
+
+        @app.before_request
+        def _load_pin():
+            try:
+                last_write = float(request.cookies.get(cookie, 0))
+            except ValueError:
+                last_write = 0.0
+            g._db_last_write = last_write
+            _last_write.set(last_write)
+
+        @app.after_request
+        def _save_pin(response):
+            last_write = _last_write.get()
+            if last_write > getattr(g, '_db_last_write', 0.0):
+                response.set_cookie(cookie, repr(last_write), max_age=int(self.pin_seconds) + 1,
+                                    httponly=True, samesite='Lax')
+            return response
+
+
+def from_env(connect_primary, connect, urls, **kwargs):
+    """Router for comma-separated replica `urls`, each opened with `connect(url)`."""
+    urls = [url.strip() for url in (urls or '').split(',') if url.strip()]
+    replicas = {f'replica-{i}': (lambda url=url: connect(url)) for i, url in enumerate(urls)}
+    return ReplicaRouter(connect_primary, replicas, **kwargs)
@@ -0,0 +1,67 @@
+"""
+Per-endpoint request timing for the Flask backends.
+
+`instrument_flask(app)` times every request and serves the results in
+Prometheus text format at `/metrics`. The metric names and labels match the
+GenLayer API's (`http_request_duration_seconds`, `http_requests_total`), so
+one dashboard covers all three services. Requests are labelled by route
+rule (`/api/tracks/<int:track_id>`), not raw path, to keep label
+cardinality bounded.
+
+Under gunicorn each worker keeps its own counters. Set
+`PROMETHEUS_MULTIPROC_DIR` to a writable, empty directory to have `/metrics`
+aggregate all workers (prometheus_client's multiprocess mode).
+"""
+import os
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds',
+    'HTTP request latency by route',
+    ['method', 'route']
+)
+HTTP_REQUESTS_TOTAL = Counter(
+    'http_requests_total',
+    'HTTP requests by route and status code',
+    ['method', 'route', 'status']
+)
+
+
+def render_latest():
+    """Current metrics, aggregated over workers in multiprocess mode."""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
+
+
+def instrument_flask(app, metrics_path='/metrics'):
+    """Time every request by route and serve the metrics at `metrics_path`."""
+    from flask import Response, g, request
+
+    @app.before_request
+    def _start_request_timer():
+        g._request_start = time.perf_counter()
+
+    @app.teardown_request
+    def _record_request(exc):
+        start = g.pop('_request_start', None)
+        if start is None:
+            return
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        HTTP_REQUEST_SECONDS.labels(request.method, route).observe(time.perf_counter() - start)
+
+    @app.after_request
+    def _count_request(response):
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        HTTP_REQUESTS_TOTAL.labels(request.method, route, str(response.status_code)).inc()
+        return response
+
+    @app.route(metrics_path, methods=['GET'])
+    def metrics():
+        return Response(render_latest(), mimetype=CONTENT_TYPE_LATEST)
@@ -0,0 +1,281 @@
+"""
+SQL statement timing, slow-query log and per-request query counts.
+
+`wrap(conn)` returns a connection whose cursors time every `execute`,
+`executemany` and fetch. Statements are grouped by shape: the SQL with
+literals replaced by `?` and IN lists collapsed, so the same query with
+different values counts as one statement.
+
+- A statement whose execute plus fetch time reaches `slow_ms` is logged once
+  on the `sql.slow` logger with its shape. Parameter values are never
+  logged, only how many there were.
+- `instrument_flask(app)` counts queries and DB time per request and returns
+  them as `X-DB-Query-Count` and `X-DB-Time-Ms` response headers.
+- A request that runs one shape `n_plus_one` times or more is logged as a
+  likely N+1, with its route, and gets an `X-DB-N-Plus-One` header.
+
+Settings come from the environment and can be changed at runtime, with no
+restart: `configure(...)` applies to the current process. If
+`SQL_INSTRUMENTATION_CONFIG` names a JSON file (e.g.
+`{"enabled": true, "slow_ms": 100}`), it is re-read within a second of
+changing, in every worker process. While disabled, `wrap` returns the
+connection untouched.
+
+Works with both psycopg2 and sqlite3 connections.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger('sql.slow')
+
+RELOAD_INTERVAL = 1.0
+MAX_SHAPE_CHARS = 500
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_RE = re.compile(r'%s|\?')
+_IN_LIST_RE = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_SPACE_RE = re.compile(r'\s+')
+
+# Per-request counters; None outside an instrumented request
+_request_stats = ContextVar('sql_request_stats', default=None)
+
+
+def statement_shape(sql):
+    """SQL with whitespace collapsed, literals and placeholders as `?` and IN lists as `IN (...)`."""
+    shape = _STRING_RE.sub('?', sql)
+    shape = _NUMBER_RE.sub('?', shape)
+    shape = _PLACEHOLDER_RE.sub('?', shape)
+    shape = _IN_LIST_RE.sub('IN (...)', shape)
+    return _SPACE_RE.sub(' ', shape).strip()[:MAX_SHAPE_CHARS]
+
+
+def _param_count(params):
+    if params is None:
+        return 0
+    try:
+        return len(params)
+    except TypeError:
+        return 1
+
+
+class _RequestStats:
+    __slots__ = ('queries', 'seconds', 'shapes')
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+
+class QueryInstrumentation:
+    def __init__(self, enabled=False, slow_ms=200.0, n_plus_one=10, config_path=None):
+        self.enabled = enabled
+        self.slow_ms = slow_ms
+        self.n_plus_one = n_plus_one
+        self.config_path = config_path
+        self._config_mtime = None
+        self._next_reload = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            enabled=os.getenv('SQL_INSTRUMENTATION', '0').lower() in ('1', 'true', 'yes'),
+            slow_ms=float(os.getenv('SQL_SLOW_MS', '200')),
+            n_plus_one=int(os.getenv('SQL_N_PLUS_ONE_THRESHOLD', '10')),
+            config_path=os.getenv('SQL_INSTRUMENTATION_CONFIG')
+        )
+
+    def configure(self, enabled=None, slow_ms=None, n_plus_one=None):
+        if enabled is not None:
+            self.enabled = bool(enabled)
+        if slow_ms is not None:
+            self.slow_ms = float(slow_ms)
+        if n_plus_one is not None:
+            self.n_plus_one = int(n_plus_one)
+
+    def _maybe_reload(self):
+        if not self.config_path:
+            return
+        now = time.monotonic()
+        if now < self._next_reload:
+            return
+        with self._lock:
+            if now < self._next_reload:
+                return
+            self._next_reload = now + RELOAD_INTERVAL
+            try:
+                mtime = os.path.getmtime(self.config_path)
+            except OSError:
+                return
+            if mtime == self._config_mtime:
+                return
+            self._config_mtime = mtime
+            try:
+                with open(self.config_path) as f:
+                    settings = json.load(f)
+                self.configure(
+                    enabled=settings.get('enabled'),
+                    slow_ms=settings.get('slow_ms'),
+                    n_plus_one=settings.get('n_plus_one')
+                )
+            except (OSError, ValueError) as e:
+                logger.error(f"Ignoring SQL instrumentation config {self.config_path}: {str(e)}")
+                return
+        logger.info(f"SQL instrumentation {'enabled' if self.enabled else 'disabled'} "
+                    f"(slow_ms={self.slow_ms}, n_plus_one={self.n_plus_one})")
+
+    def active(self):
+        self._maybe_reload()
+        return self.enabled
+
+    def wrap(self, conn):
+        """Instrument a DB-API connection, or return it as is while disabled."""
+        if not self.active():
+            return conn
+        return _Connection(conn, self)
+
+    def record(self, shape, seconds, new_statement):
+        stats = _request_stats.get()
+        if stats is None:
+            return
+        stats.seconds += seconds
+        if new_statement:
+            stats.queries += 1
+            stats.shapes[shape] += 1
+
+    def log_slow(self, shape, seconds, param_count):
+        slow_logger.warning(f"Slow query {seconds * 1000:.1f} ms: {shape} [{param_count} params redacted]")
+
+
+class _Cursor:
+    def __init__(self, cursor, instrumentation):
+        self._cursor = cursor
+        self._instrumentation = instrumentation
+        self._shape = None
+        self._elapsed = 0.0
+        self._params = 0
+        self._logged = False
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def __enter__(self):
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._cursor.__exit__(*exc)
+
+    def _timed(self, new_statement, call, *args):
+        start = time.perf_counter()
+        try:
+            return call(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            if self._shape is not None:
+                self._elapsed += elapsed
+                self._instrumentation.record(self._shape, elapsed, new_statement)
+                if not self._logged and self._elapsed * 1000 >= self._instrumentation.slow_ms:
+                    self._logged = True
+                    self._instrumentation.log_slow(self._shape, self._elapsed, self._params)
+
+    def _start(self, sql, params):
+        self._shape = statement_shape(sql)
+        self._elapsed = 0.0
+        self._params = params
+        self._logged = False
+
+    def execute(self, sql, params=None):
+        self._start(sql, _param_count(params))
+        if params is None:
+            self._timed(True, self._cursor.execute, sql)
+        else:
+            self._timed(True, self._cursor.execute, sql, params)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        self._start(sql, sum(_param_count(params) for params in seq_of_params))
+        self._timed(True, self._cursor.executemany, sql, seq_of_params)
+        return self
+
+    def fetchone(self):
+        return self._timed(False, self._cursor.fetchone)
+
+    def fetchmany(self, *args):
+        return self._timed(False, self._cursor.fetchmany, *args)
+
+    def fetchall(self):
+        return self._timed(False, self._cursor.fetchall)
+
+
+class _Connection:
+    def __init__(self, conn, instrumentation):
+        self._conn = conn
+        self._instrumentation = instrumentation
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+    def cursor(self, *args, **kwargs):
+        return _Cursor(self._conn.cursor(*args, **kwargs), self._instrumentation)
+
+    def execute(self, sql, params=None):
+        """sqlite3's connection-level shortcut, routed through an instrumented cursor."""
+        cursor = self.cursor()
+        return cursor.execute(sql, params) if params is not None else cursor.execute(sql)
+
+
+INSTRUMENTATION = QueryInstrumentation.from_env()
+
+
+def wrap(conn):
+    return INSTRUMENTATION.wrap(conn)
+
+
+def configure(**settings):
+    INSTRUMENTATION.configure(**settings)
+
+
+def instrument_flask(app):
+    """Count queries and DB time per request; report them in headers and flag N+1 patterns."""
+    from flask import request
+
+    @app.before_request
+    def _start_sql_stats():
+        _request_stats.set(_RequestStats() if INSTRUMENTATION.active() else None)
+
+    @app.after_request
+    def _report_sql_stats(response):
+        stats = _request_stats.get()
+        if stats is None:
+            return response
+        _request_stats.set(None)
+        response.headers['X-DB-Query-Count'] = str(stats.queries)
+        response.headers['X-DB-Time-Ms'] = f'{stats.seconds * 1000:.1f}'
+        if stats.shapes:
+            shape, count = stats.shapes.most_common(1)[0]
+            if count >= INSTRUMENTATION.n_plus_one:
+                route = request.url_rule.rule if request.url_rule else request.path
+                logger.warning(f"Possible N+1 on {request.method} {route}: {count}x {shape}")
+                response.headers['X-DB-N-Plus-One'] = str(count)
+        return response
@@ -278,6 +278,19 @@ contract MusicNFT is
         emit PlayCountIncremented(tokenId, plays);
     }
     
+    /**
+     * @dev Increment play counts for many tokens in one transaction
+     * Used by the off-chain play aggregator to flush batched deltas
+     */
+    function batchIncrementPlayCount(uint256[] calldata tokenIds, uint256[] calldata plays) external onlyOwner {
+        require(tokenIds.length == plays.length, "Length mismatch");
+        for (uint256 i = 0; i < tokenIds.length; i++) {
+            require(_ownerOf(tokenIds[i]) != address(0), "Token does not exist");
+            musicMetadata[tokenIds[i]].playCount += plays[i];
+            emit PlayCountIncremented(tokenIds[i], plays[i]);
+        }
+    }
+    
     /**
      * @dev Get contract version
      */
@@ -1,6 +1,37 @@
 # { "Depends": "py-genlayer:1jb45aa8ynh2a9c9xn3b7qqh8sm5q93hwfp7jqmwsfhh8jpz09h6" }
 from genlayer import *
 
+import json
+
+VERIFICATION_VERDICTS = ("VERIFIED", "DENIED")
+# Validators must agree on the verdict only; reasons are free text
+VERDICT_PRINCIPLE = "The `verdict` fields must be identical. The `reason` fields may be worded differently."
+
+
+def parse_verdict(raw: str, verdicts: tuple, fallback: str) -> str:
+    """
+    Canonical '{"reason": ..., "verdict": ...}' JSON from model output.
+    Accepts a JSON object or legacy 'VERDICT:reason' text; anything else
+    maps to `fallback`.
+    """
+    text = raw.strip()
+    verdict, reason = "", ""
+    start, end = text.find("{"), text.rfind("}")
+    if start != -1 and end > start:
+        try:
+            data = json.loads(text[start:end + 1])
+            verdict = str(data.get("verdict", "")).strip().upper()
+            reason = str(data.get("reason", "")).strip()
+        except (ValueError, AttributeError):
+            pass
+    if not verdict:
+        head, _, tail = text.partition(":")
+        verdict, reason = head.strip().upper(), tail.strip()
+    if verdict not in verdicts:
+        verdict, reason = fallback, "Unrecognized model output"
+    return json.dumps({"verdict": verdict, "reason": reason[:280]}, sort_keys=True)
+
+
 # EVM Interface for the MusicNFT contract on Base
 @gl.evm.contract_interface
 class MusicNFT:
@@ -29,11 +60,14 @@ class ArtistVerifier(gl.Contract):
 
     owner: Address
     music_nft_address: Address
+    structured_verdicts: bool
     verification_results: TreeMap[Address, str]
+    verification_reasons: TreeMap[Address, str]
 
-    def __init__(self, music_nft: Address):
+    def __init__(self, music_nft: Address, structured_verdicts: bool = True):
         self.owner = gl.message.sender_address
         self.music_nft_address = music_nft
+        self.structured_verdicts = structured_verdicts
 
     @gl.public.write
     def verify_artist(
@@ -47,22 +81,35 @@ class ArtistVerifier(gl.Contract):
         AI analysis of artist identity using GenLayer's web access.
         """
         
-        prompt = (
+        task = (
             f"Verification Task: Verify if the following artist info is legitimate.\n"
             f"Name: {artist_name}\n"
             f"Social Links: {social_links}\n"
             f"Website: {official_website}\n"
             f"Criteria: Is the artist active? Do the social links match the name? Does the website look official?\n"
-            f"Respond with: VERIFIED or DENIED:<reason>"
         )
 
-        def run_verification():
-            # In a real scenario, this would use gl.exec_prompt 
-            # and potentially gl.get_web_data to fetch info
-            return gl.exec_prompt(prompt).strip().upper()
+        if self.structured_verdicts:
+            # Validators only have to agree on the enumerated verdict; the reason is stored separately
+            prompt = task + 'Respond with JSON only: {"verdict": "VERIFIED" or "DENIED", "reason": "<one sentence>"}'
 
-        result = gl.eq_principle.str_similarity(run_verification, threshold=0.8)
-        self.verification_results[artist_address] = result
+            def run_verification():
+                return parse_verdict(gl.exec_prompt(prompt), VERIFICATION_VERDICTS, "DENIED")
+
+            outcome = json.loads(gl.eq_principle.prompt_comparative(run_verification, VERDICT_PRINCIPLE))
+            result = outcome["verdict"]
+            self.verification_results[artist_address] = result
+            self.verification_reasons[artist_address] = outcome["reason"]
+        else:
+            prompt = task + "Respond with: VERIFIED or DENIED:<reason>"
+
+            def run_verification():
+                # In a real scenario, this would use gl.exec_prompt 
+                # and potentially gl.get_web_data to fetch info
+                return gl.exec_prompt(prompt).strip().upper()
+
+            result = gl.eq_principle.str_similarity(run_verification, threshold=0.8)
+            self.verification_results[artist_address] = result
 
         # Hybrid Flow: Update Base Sepolia state if verified
         is_verified = result == "VERIFIED"
@@ -70,7 +117,26 @@ class ArtistVerifier(gl.Contract):
         nft = MusicNFT(self.music_nft_address)
         nft.emit().setArtistVerification(artist_address, is_verified)
 
+    @gl.public.view
+    def get_verification_verdict(self, artist_address: Address) -> str:
+        """JSON {"verdict", "reason"}; the verdict is NOT_VERIFIED for unknown artists."""
+        if artist_address not in self.verification_results:
+            return json.dumps({"verdict": "NOT_VERIFIED", "reason": ""})
+        return json.dumps({
+            "verdict": self.verification_results[artist_address],
+            "reason": self.verification_reasons[artist_address] if artist_address in self.verification_reasons else ""
+        })
+
     @gl.public.view
     def is_verified(self, artist_address: Address) -> bool:
         result = self.verification_results[artist_address] if artist_address in self.verification_results else ""
         return result == "VERIFIED"
+
+    @gl.public.view
+    def are_verified(self, artist_addresses: list[Address]) -> list[bool]:
+        """Bulk variant of is_verified, in the order of `artist_addresses`."""
+        return [
+            artist_address in self.verification_results
+            and self.verification_results[artist_address] == "VERIFIED"
+            for artist_address in artist_addresses
+        ]
@@ -1,6 +1,36 @@
 # { "Depends": "py-genlayer:1jb45aa8ynh2a9c9xn3b7qqh8sm5q93hwfp7jqmwsfhh8jpz09h6" }
 from genlayer import *
 
+import json
+
+MODERATION_VERDICTS = ("APPROVED", "REJECTED")
+# Validators must agree on the verdict only; reasons are free text
+VERDICT_PRINCIPLE = "The `verdict` fields must be identical. The `reason` fields may be worded differently."
+
+
+def parse_verdict(raw: str, verdicts: tuple, fallback: str) -> str:
+    """
+    Canonical '{"reason": ..., "verdict": ...}' JSON from model output.
+    Accepts a JSON object or legacy 'VERDICT:reason' text; anything else
+    maps to `fallback`.
+    """
+    text = raw.strip()
+    verdict, reason = "", ""
+    start, end = text.find("{"), text.rfind("}")
+    if start != -1 and end > start:
+        try:
+            data = json.loads(text[start:end + 1])
+            verdict = str(data.get("verdict", "")).strip().upper()
+            reason = str(data.get("reason", "")).strip()
+        except (ValueError, AttributeError):
+            pass
+    if not verdict:
+        head, _, tail = text.partition(":")
+        verdict, reason = head.strip().upper(), tail.strip()
+    if verdict not in verdicts:
+        verdict, reason = fallback, "Unrecognized model output"
+    return json.dumps({"verdict": verdict, "reason": reason[:280]}, sort_keys=True)
+
 
 # EVM Interface for the MusicNFT contract on Base
 @gl.evm.contract_interface
@@ -26,11 +56,14 @@ class MusicContentModerator(gl.Contract):
 
     owner: Address
     music_nft_address: Address
+    structured_verdicts: bool
     moderation_results: TreeMap[str, str]
+    moderation_reasons: TreeMap[str, str]
 
-    def __init__(self, music_nft: Address):
+    def __init__(self, music_nft: Address, structured_verdicts: bool = True):
         self.owner = gl.message.sender_address
         self.music_nft_address = music_nft
+        self.structured_verdicts = structured_verdicts
 
     @gl.public.write
     def moderate_content(
@@ -48,17 +81,34 @@ class MusicContentModerator(gl.Contract):
         """
 
         metadata_text = f"Title: {track_title}, Artist: {artist_name}, Genre: {genre}, Description: {description}"
-        prompt = (
-            f"Moderation Task: Analyze if this music upload violates policy (no hate speech, no spam).\n"
-            f"Content: {metadata_text}\n"
-            f"Respond with: APPROVED or REJECTED:<reason>"
-        )
 
-        def run_moderation():
-            return gl.exec_prompt(prompt).strip().upper()
+        if self.structured_verdicts:
+            # Validators only have to agree on the enumerated verdict; the reason is stored separately
+            prompt = (
+                f"Moderation Task: Analyze if this music upload violates policy (no hate speech, no spam).\n"
+                f"Content: {metadata_text}\n"
+                f'Respond with JSON only: {{"verdict": "APPROVED" or "REJECTED", "reason": "<one sentence>"}}'
+            )
+
+            def run_moderation():
+                return parse_verdict(gl.exec_prompt(prompt), MODERATION_VERDICTS, "REJECTED")
 
-        final_result = gl.eq_principle.str_similarity(run_moderation, threshold=0.8)
-        self.moderation_results[track_id] = final_result
+            outcome = json.loads(gl.eq_principle.prompt_comparative(run_moderation, VERDICT_PRINCIPLE))
+            final_result = outcome["verdict"]
+            self.moderation_results[track_id] = final_result
+            self.moderation_reasons[track_id] = outcome["reason"]
+        else:
+            prompt = (
+                f"Moderation Task: Analyze if this music upload violates policy (no hate speech, no spam).\n"
+                f"Content: {metadata_text}\n"
+                f"Respond with: APPROVED or REJECTED:<reason>"
+            )
+
+            def run_moderation():
+                return gl.exec_prompt(prompt).strip().upper()
+
+            final_result = gl.eq_principle.str_similarity(run_moderation, threshold=0.8)
+            self.moderation_results[track_id] = final_result
 
         # Hybrid Flow: Update Base Sepolia state
         is_approved = final_result == "APPROVED"
@@ -70,6 +120,29 @@ class MusicContentModerator(gl.Contract):
         # This will be picked up by GenLayer validators and executed on Base Sepolia
         nft.emit().setModerationStatus(track_id, is_approved)
 
+    def _result(self, track_id: str) -> str:
+        """Stored verdict as 'VERDICT' or 'VERDICT:<reason>', the format clients parse."""
+        if track_id not in self.moderation_results:
+            return "NOT_MODERATED"
+        verdict = self.moderation_results[track_id]
+        reason = self.moderation_reasons[track_id] if track_id in self.moderation_reasons else ""
+        return f"{verdict}:{reason}" if reason and verdict != "APPROVED" else verdict
+
     @gl.public.view
     def get_moderation_result(self, track_id: str) -> str:
-        return self.moderation_results[track_id] if track_id in self.moderation_results else "NOT_MODERATED"
+        return self._result(track_id)
+
+    @gl.public.view
+    def get_moderation_verdict(self, track_id: str) -> str:
+        """JSON {"verdict", "reason"}; the verdict is NOT_MODERATED for unknown tracks."""
+        if track_id not in self.moderation_results:
+            return json.dumps({"verdict": "NOT_MODERATED", "reason": ""})
+        return json.dumps({
+            "verdict": self.moderation_results[track_id],
+            "reason": self.moderation_reasons[track_id] if track_id in self.moderation_reasons else ""
+        })
+
+    @gl.public.view
+    def get_moderation_results(self, track_ids: list[str]) -> list[str]:
+        """Bulk variant of get_moderation_result, in the order of `track_ids`."""
+        return [self._result(track_id) for track_id in track_ids]
@@ -4,16 +4,32 @@ from werkzeug.security import generate_password_hash, check_password_hash
 import os
 from typing import Any, Dict, List, Optional
 
+from blockmusic_common import replicas, sql_instrumentation
+
 class Database:
     def __init__(self):
         self.db_url = os.getenv('DATABASE_URL')
         if not self.db_url:
             raise ValueError("DATABASE_URL environment variable is required")
+        # Reads are served by DATABASE_REPLICA_URLS when set (replicas.py)
+        self.replicas = replicas.from_env(
+            lambda: psycopg2.connect(self.db_url),
+            psycopg2.connect,
+            os.getenv('DATABASE_REPLICA_URLS'),
+            pin_seconds=float(os.getenv('DB_PIN_SECONDS', '5')),
+            check_interval=float(os.getenv('DB_REPLICA_CHECK_INTERVAL', '10')),
+            lag_query=replicas.POSTGRES_LAG_QUERY,
+            max_lag=float(os.getenv('DB_REPLICA_MAX_LAG', '5'))
+        )
         self.conn = self.get_db_connection()
         self.initialize_db()
 
     def get_db_connection(self):
-        return psycopg2.connect(self.db_url)
+        """Primary connection. After committing a write, call `self.replicas.mark_write()`."""
+        return sql_instrumentation.wrap(self.replicas.primary_connection())
+
+    def get_read_connection(self):
+        return sql_instrumentation.wrap(self.replicas.read_connection())
 
     def initialize_db(self):
         self.create_tables()
@@ -47,8 +63,8 @@ class Database:
             conn.close()
 
     def execute_query(self, query: str, params: tuple = ()) -> List[Dict[str, Any]]:
-        """Execute a query and return results as list of dictionaries"""
-        conn = self.get_db_connection()
+        """Execute a read query (on a replica when available) and return results as list of dictionaries"""
+        conn = self.get_read_connection()
         try:
             cursor = conn.cursor()
             cursor.execute(query, params)
@@ -71,6 +87,7 @@ class Database:
             cursor.execute(query, params)
             row_id = cursor.fetchone()[0]
             conn.commit()
+            self.replicas.mark_write()
             return row_id
         finally:
             conn.close()
@@ -82,6 +99,7 @@ class Database:
             cursor = conn.cursor()
             cursor.execute(query, params)
             conn.commit()
+            self.replicas.mark_write()
         finally:
             conn.close()
 
@@ -2,22 +2,76 @@
 FastAPI wrapper for GenLayer intelligent contracts.
 Provides HTTP endpoints to interact with AI-powered contracts.
 """
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Response
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Any, Awaitable, Callable, Dict, Optional, List
 import os
 from dotenv import load_dotenv
 import structlog
 
+from catalog_sync import CatalogStore, CatalogTrack, split_csv
+from recommendation_store import ListeningProfile, RecommendationStore
+from rpc_client import RPCClientManager
+from status_cache import StatusCache
+from metrics import CONTENT_TYPE_LATEST, PrometheusMiddleware, record_cache, render_latest
+
 load_dotenv()
 
 logger = structlog.get_logger()
 
+catalog = CatalogStore(
+    snapshot_path=os.getenv("CATALOG_SNAPSHOT_PATH", "data/catalog.json.gz"),
+    snapshot_interval=float(os.getenv("CATALOG_SNAPSHOT_INTERVAL", "30")),
+)
+
+# Upper bound on candidates resolved from the local catalog per recommendation
+MAX_CANDIDATES = int(os.getenv("RECOMMEND_MAX_CANDIDATES", "200"))
+
+# Per-user recommendations, refreshed for dirty users by a scheduled pass
+recommendation_store = RecommendationStore(
+    snapshot_path=os.getenv("RECOMMENDATION_SNAPSHOT_PATH", "data/recommendations.json.gz"),
+    snapshot_interval=float(os.getenv("RECOMMENDATION_SNAPSHOT_INTERVAL", "30")),
+)
+MATERIALIZE_INTERVAL = float(os.getenv("RECOMMEND_MATERIALIZE_INTERVAL", "60"))
+MATERIALIZE_BATCH = int(os.getenv("RECOMMEND_MATERIALIZE_BATCH", "500"))
+# Matches MusicRecommender.MAX_PROFILE_BATCH
+MAX_PROFILE_BATCH = int(os.getenv("PROFILE_BATCH_MAX", "200"))
+
+# Short-TTL caches for contract status reads
+STATUS_CACHE_TTL = float(os.getenv("STATUS_CACHE_TTL", "15"))
+MAX_BATCH_IDS = int(os.getenv("STATUS_BATCH_MAX_IDS", "200"))
+moderation_cache = StatusCache(ttl=STATUS_CACHE_TTL)
+copyright_cache = StatusCache(ttl=STATUS_CACHE_TTL)
+verification_cache = StatusCache(ttl=STATUS_CACHE_TTL)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Load local state and open shared RPC clients on startup; clean up on shutdown."""
+    loaded = catalog.load_snapshot()
+    logger.info("Catalog loaded", tracks=loaded)
+    users = recommendation_store.load_snapshot()
+    logger.info("Recommendation store loaded", users=users)
+    app.state.rpc = RPCClientManager.from_env()
+    materializer = asyncio.create_task(materialize_recommendations())
+    catalog_flusher = asyncio.create_task(flush_catalog_snapshots())
+    try:
+        yield
+    finally:
+        materializer.cancel()
+        catalog_flusher.cancel()
+        await app.state.rpc.aclose()
+        catalog.save_snapshot(force=True)
+        recommendation_store.save_snapshot(force=True)
+
 app = FastAPI(
     title="BlockMusic GenLayer API",
     description="AI-powered intelligent contracts for music moderation, copyright verification, and recommendations",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
+app.add_middleware(PrometheusMiddleware)
 
 # Request models
 class ModerationRequest(BaseModel):
@@ -37,10 +91,38 @@ class CopyrightRequest(BaseModel):
     sample_sources: str
 
 class RecommendationRequest(BaseModel):
-    genres_listened: str
-    favorite_artists: str
-    recent_tracks: str
-    available_track_ids: str
+    # With a user_id, results are served from the materialized store when possible
+    user_id: Optional[str] = None
+    genres_listened: str = ""
+    favorite_artists: str = ""
+    recent_tracks: str = ""
+    # Optional: resolved from the local catalog when omitted
+    available_track_ids: Optional[str] = None
+
+class ListenEvent(BaseModel):
+    user_id: str
+    track_id: str
+
+class ListenBatchRequest(BaseModel):
+    events: List[ListenEvent]
+
+class UserProfileUpdate(BaseModel):
+    user_address: str
+    genres_listened: str = ""
+    favorite_artists: str = ""
+    recent_tracks: str = ""
+    listening_mood: str = ""
+
+class UserProfileBatchRequest(BaseModel):
+    profiles: List[UserProfileUpdate]
+
+class CatalogTrackRequest(BaseModel):
+    track_id: str
+    title: str
+    artist: str
+    genre: str
+    mood: str = ""
+    tags: str = ""
 
 class RecommendationResponse(BaseModel):
     recommendations: List[str]
@@ -57,6 +139,65 @@ class CopyrightResponse(BaseModel):
     status: str
     result: str
 
+class CatalogSyncResponse(BaseModel):
+    track_id: str
+    status: str
+    catalog_version: int
+
+class TrackStatusBatchRequest(BaseModel):
+    track_ids: List[str]
+
+class ArtistVerificationBatchRequest(BaseModel):
+    artist_addresses: List[str]
+
+class StatusBatchResponse(BaseModel):
+    statuses: Dict[str, str]
+
+class VerificationBatchResponse(BaseModel):
+    verified: Dict[str, bool]
+
+# Bulk status views. Reading a GenLayer view needs the SDK's calldata encoding,
+# which isn't available yet (see requirements.txt), so these read nothing and
+# every id gets its "not checked" default. Defaults are never cached; only
+# statuses actually read from a contract are.
+
+async def fetch_moderation_statuses(track_ids: List[str]) -> Dict[str, str]:
+    """Read statuses with one MusicContentModerator.get_moderation_results call"""
+    # TODO: Call the view through app.state.rpc.genlayer once the SDK is added
+    return {}
+
+async def fetch_copyright_statuses(track_ids: List[str]) -> Dict[str, str]:
+    """Read statuses with one CopyrightVerifier.get_copyright_statuses call"""
+    # TODO: Call the view through app.state.rpc.genlayer once the SDK is added
+    return {}
+
+async def fetch_artist_verifications(addresses: List[str]) -> Dict[str, bool]:
+    """Read verification flags with one ArtistVerifier.are_verified call"""
+    # TODO: Call the view through app.state.rpc.genlayer once the SDK is added
+    return {}
+
+async def read_statuses(
+    ids: List[str],
+    cache: StatusCache,
+    fetch: Callable[[List[str]], Awaitable[Dict]],
+    cache_name: str,
+    default: Any
+) -> Dict:
+    """
+    Serve ids from the cache and fetch all misses in a single bulk read.
+    Ids the read returns nothing for get `default`, which is not cached.
+    """
+    if len(ids) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_IDS} ids per request")
+    ids = list(dict.fromkeys(ids))
+    found, missing = cache.get_many(ids)
+    record_cache(cache_name, len(found), len(missing))
+    if missing:
+        fetched = await fetch(missing)
+        cache.set_many(fetched)
+        found.update(fetched)
+    return {key: found.get(key, default) for key in ids}
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -75,6 +216,11 @@ async def health():
         "music_nft_contract": os.getenv("MUSIC_NFT_CONTRACT")
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics in text exposition format"""
+    return Response(content=render_latest(), media_type=CONTENT_TYPE_LATEST)
+
 @app.post("/moderate", response_model=ModerationResponse)
 async def moderate_content(request: ModerationRequest, background_tasks: BackgroundTasks):
     """
@@ -127,6 +273,48 @@ async def verify_copyright(request: CopyrightRequest, background_tasks: Backgrou
         logger.error("Copyright verification failed", error=str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
+def compute_recommendations(profile: ListeningProfile, available_track_ids: Optional[str] = None) -> List[str]:
+    """Live recommendation for a listening profile."""
+    if available_track_ids is not None:
+        candidates = split_csv(available_track_ids)
+    else:
+        candidates = catalog.candidates(
+            genres=split_csv(profile.genres_listened),
+            artists=split_csv(profile.favorite_artists),
+            exclude=split_csv(profile.recent_tracks),
+            limit=MAX_CANDIDATES
+        )
+
+    # TODO: Integrate with actual GenLayer contract
+    # For now, return mock recommendations
+    return candidates[:5]
+
+async def flush_catalog_snapshots() -> None:
+    """Trailing flush: save catalog changes that arrived while snapshot writes were throttled."""
+    while True:
+        await asyncio.sleep(catalog.snapshot_interval)
+        try:
+            await asyncio.to_thread(catalog.save_snapshot)
+        except Exception as e:
+            logger.error("Catalog snapshot failed", error=str(e))
+
+async def materialize_recommendations() -> None:
+    """Scheduled pass: recompute recommendations for users whose listening changed."""
+    while True:
+        await asyncio.sleep(MATERIALIZE_INTERVAL)
+        try:
+            while True:
+                refreshed = await asyncio.to_thread(
+                    recommendation_store.materialize, compute_recommendations, MATERIALIZE_BATCH
+                )
+                if refreshed:
+                    logger.info("Recommendations materialized", users=refreshed)
+                if refreshed < MATERIALIZE_BATCH:
+                    break
+            recommendation_store.save_snapshot()
+        except Exception as e:
+            logger.error("Recommendation materialization failed", error=str(e))
+
 @app.post("/recommend", response_model=RecommendationResponse)
 async def get_recommendations(request: RecommendationRequest):
     """
@@ -134,32 +322,137 @@ async def get_recommendations(request: RecommendationRequest):
     
     This endpoint generates personalized recommendations
     using the GenLayer MusicRecommender contract.
+    
+    With a `user_id` the store already knows (from /listens or
+    /profiles:batch) and no explicit candidate list, results come from the
+    materialized store; a miss, or a profile that differs from the one
+    stored, is computed live and stored. Other requests are computed live
+    and not stored, so arbitrary user ids can't grow the store.
     """
     try:
         logger.info("Recommendation request")
         
-        # TODO: Integrate with actual GenLayer contract
-        # For now, return mock recommendations
+        profile = ListeningProfile(request.genres_listened, request.favorite_artists, request.recent_tracks)
+        if (request.user_id is None or request.available_track_ids is not None
+                or not recommendation_store.knows(request.user_id)):
+            recommendations = compute_recommendations(profile, request.available_track_ids)
+            status = "success"
+        else:
+            changed = profile != ListeningProfile("", "", "") and recommendation_store.set_profile(request.user_id, profile)
+            stored = None if changed else recommendation_store.get(request.user_id)
+            if stored is not None:
+                recommendations, status = stored, "materialized"
+            else:
+                generation = recommendation_store.generation(request.user_id)
+                recommendations = compute_recommendations(recommendation_store.profile(request.user_id))
+                recommendation_store.put(request.user_id, recommendations, generation)
+                status = "success"
+        
         result = {
-            "recommendations": request.available_track_ids.split(",")[:5],
-            "status": "success"
+            "recommendations": recommendations,
+            "status": status
         }
         
-        logger.info("Recommendations generated", count=len(result["recommendations"]))
+        logger.info("Recommendations generated", count=len(result["recommendations"]), status=status)
         return result
         
     except Exception as e:
         logger.error("Recommendation failed", error=str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/listens")
+async def record_listens(request: ListenBatchRequest):
+    """
+    Ingest listening events. Each listener's profile is updated and the
+    user is marked for the next materialization pass.
+    """
+    marked = recommendation_store.record_listens(
+        ((event.user_id, event.track_id) for event in request.events), catalog
+    )
+    return {"events": len(request.events), "users_marked": marked}
+
+@app.post("/profiles:batch")
+async def update_user_profiles(request: UserProfileBatchRequest):
+    """
+    Store many listening profiles and mark those users for re-materialization.
+
+    Only the local recommendation store is updated: the on-chain
+    MusicRecommender.update_user_profiles write is owner-only and needs a
+    signed transaction, which waits for the GenLayer SDK.
+    """
+    if len(request.profiles) > MAX_PROFILE_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_PROFILE_BATCH} profiles per batch")
+    try:
+        # TODO: Write the batch with MusicRecommender.update_user_profiles once the SDK is added
+        changed = sum(
+            recommendation_store.set_profile(
+                profile.user_address,
+                ListeningProfile(profile.genres_listened, profile.favorite_artists, profile.recent_tracks)
+            )
+            for profile in request.profiles
+        )
+        logger.info("Profiles stored", count=len(request.profiles), changed=changed)
+        return {"submitted": len(request.profiles), "changed": changed, "on_chain": False, "status": "success"}
+    except Exception as e:
+        logger.error("Profile push failed", error=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/recommendations/stats")
+async def get_recommendation_stats():
+    """Materialized users and dirty-set size"""
+    return recommendation_store.stats()
+
+@app.post("/catalog/tracks", response_model=CatalogSyncResponse)
+async def sync_catalog_track(request: CatalogTrackRequest, background_tasks: BackgroundTasks):
+    """
+    Mirror a MusicRecommender.register_track event into the local catalog.
+    
+    Re-sending an unchanged track is a no-op, so sync jobs can replay events safely.
+    """
+    try:
+        status = catalog.upsert(CatalogTrack(**request.model_dump()))
+        if status != "unchanged":
+            background_tasks.add_task(catalog.save_snapshot)
+        logger.info("Catalog track synced", track_id=request.track_id, result=status)
+        return {
+            "track_id": request.track_id,
+            "status": status,
+            "catalog_version": catalog.version
+        }
+    except Exception as e:
+        logger.error("Catalog sync failed", error=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/catalog/tracks/{track_id}")
+async def get_catalog_track(track_id: str):
+    """Get track metadata from the local catalog"""
+    track = catalog.get(track_id)
+    if track is None:
+        raise HTTPException(status_code=404, detail="Track not in catalog")
+    return track.to_dict()
+
+@app.delete("/catalog/tracks/{track_id}")
+async def remove_catalog_track(track_id: str, background_tasks: BackgroundTasks):
+    """Remove a track from the local catalog"""
+    if not catalog.remove(track_id):
+        raise HTTPException(status_code=404, detail="Track not in catalog")
+    background_tasks.add_task(catalog.save_snapshot)
+    return {"track_id": track_id, "status": "removed", "catalog_version": catalog.version}
+
+@app.get("/catalog")
+async def get_catalog_stats():
+    """Local catalog size and sync version"""
+    return catalog.stats()
+
 @app.get("/moderation/{track_id}")
 async def get_moderation_status(track_id: str):
     """Get moderation status for a specific track"""
     try:
-        # TODO: Query GenLayer contract for actual status
+        statuses = await read_statuses([track_id], moderation_cache, fetch_moderation_statuses, "moderation",
+                                       "NOT_MODERATED")
         return {
             "track_id": track_id,
-            "status": "NOT_MODERATED"
+            "status": statuses[track_id]
         }
     except Exception as e:
         logger.error("Failed to get moderation status", error=str(e))
@@ -169,15 +462,56 @@ async def get_moderation_status(track_id: str):
 async def get_copyright_status(track_id: str):
     """Get copyright status for a specific track"""
     try:
-        # TODO: Query GenLayer contract for actual status
+        statuses = await read_statuses([track_id], copyright_cache, fetch_copyright_statuses, "copyright",
+                                       "NOT_VERIFIED")
         return {
             "track_id": track_id,
-            "status": "NOT_VERIFIED"
+            "status": statuses[track_id]
         }
     except Exception as e:
         logger.error("Failed to get copyright status", error=str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/moderation/status:batch", response_model=StatusBatchResponse)
+async def get_moderation_statuses(request: TrackStatusBatchRequest):
+    """Get moderation statuses for many tracks in one request"""
+    try:
+        statuses = await read_statuses(request.track_ids, moderation_cache, fetch_moderation_statuses, "moderation",
+                                       "NOT_MODERATED")
+        return {"statuses": statuses}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Failed to get moderation statuses", error=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/copyright/status:batch", response_model=StatusBatchResponse)
+async def get_copyright_statuses(request: TrackStatusBatchRequest):
+    """Get copyright statuses for many tracks in one request"""
+    try:
+        statuses = await read_statuses(request.track_ids, copyright_cache, fetch_copyright_statuses, "copyright",
+                                       "NOT_VERIFIED")
+        return {"statuses": statuses}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Failed to get copyright statuses", error=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/artists/verification:batch", response_model=VerificationBatchResponse)
+async def get_artist_verifications(request: ArtistVerificationBatchRequest):
+    """Get verification flags for many artist addresses in one request"""
+    try:
+        addresses = [address.lower() for address in request.artist_addresses]
+        verified = await read_statuses(addresses, verification_cache, fetch_artist_verifications,
+                                       "verification", False)
+        return {"verified": verified}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Failed to get artist verifications", error=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
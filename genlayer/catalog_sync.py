@@ -0,0 +1,264 @@
+"""
+Local mirror of the MusicRecommender track catalog.
+
+Keeps an indexed, in-memory copy of every track registered through
+`MusicRecommender.register_track` so the API can resolve candidate tracks
+itself instead of receiving the whole catalog with every request.
+The store is updated incrementally by track id and persisted as a compact
+gzip snapshot for fast restarts.
+"""
+import gzip
+import heapq
+import json
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, astuple, fields
+from itertools import count, islice
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+import structlog
+
+logger = structlog.get_logger()
+
+SNAPSHOT_FORMAT = 1
+
+
+@dataclass(frozen=True)
+class CatalogTrack:
+    """A single catalog entry, same fields as `register_track`."""
+    track_id: str
+    title: str
+    artist: str
+    genre: str
+    mood: str = ""
+    tags: str = ""
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.track_id,
+            "title": self.title,
+            "artist": self.artist,
+            "genre": self.genre,
+            "mood": self.mood,
+            "tags": self.tags,
+        }
+
+
+_TRACK_FIELDS = [f.name for f in fields(CatalogTrack)]
+
+
+def _key(value: str) -> str:
+    """Normalize a genre/artist name for index lookups."""
+    return value.strip().lower()
+
+
+def split_csv(value: Optional[str]) -> List[str]:
+    """Split a comma-separated contract argument into clean items."""
+    if not value:
+        return []
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+class CatalogStore:
+    """
+    Indexed track catalog with incremental upserts and gzip snapshots.
+
+    Tracks are kept in registration order. Secondary indexes map a
+    normalized genre or artist name to its track ids, also in registration
+    order (dicts used as ordered sets), so candidate lookups walk only the
+    matching buckets.
+    """
+
+    def __init__(self, snapshot_path: Optional[str] = None, snapshot_interval: float = 30.0):
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.version = 0
+        self._tracks: Dict[str, CatalogTrack] = {}
+        self._seq: Dict[str, int] = {}       # track_id -> registration sequence
+        self._next_seq = count()
+        self._by_genre: Dict[str, Dict[str, None]] = {}
+        self._by_artist: Dict[str, Dict[str, None]] = {}
+        self._lock = threading.RLock()
+        self._saved_version = 0
+        self._last_save = 0.0
+
+    def __len__(self) -> int:
+        return len(self._tracks)
+
+    def __contains__(self, track_id: str) -> bool:
+        return track_id in self._tracks
+
+    def _index(self, track: CatalogTrack) -> None:
+        if track.track_id not in self._seq:
+            self._seq[track.track_id] = next(self._next_seq)
+        seq = self._seq[track.track_id]
+        for index, value in ((self._by_genre, track.genre), (self._by_artist, track.artist)):
+            ids = index.setdefault(_key(value), {})
+            if ids and self._seq[next(reversed(ids))] > seq:
+                # An older track moved into this bucket; keep it sorted by registration
+                ids[track.track_id] = None
+                index[_key(value)] = dict.fromkeys(sorted(ids, key=self._seq.__getitem__))
+            else:
+                ids[track.track_id] = None
+
+    def _unindex(self, track: CatalogTrack) -> None:
+        for index, value in ((self._by_genre, track.genre), (self._by_artist, track.artist)):
+            ids = index.get(_key(value))
+            if ids is not None:
+                ids.pop(track.track_id, None)
+                if not ids:
+                    del index[_key(value)]
+
+    def upsert(self, track: CatalogTrack) -> str:
+        """
+        Apply a `register_track` event.
+
+        Returns "created", "updated" or "unchanged".
+        """
+        with self._lock:
+            existing = self._tracks.get(track.track_id)
+            if existing == track:
+                return "unchanged"
+            if existing is not None:
+                self._unindex(existing)
+            self._tracks[track.track_id] = track
+            self._index(track)
+            self.version += 1
+            return "updated" if existing is not None else "created"
+
+    def remove(self, track_id: str) -> bool:
+        with self._lock:
+            track = self._tracks.pop(track_id, None)
+            if track is None:
+                return False
+            self._unindex(track)
+            del self._seq[track_id]
+            self.version += 1
+            return True
+
+    def get(self, track_id: str) -> Optional[CatalogTrack]:
+        return self._tracks.get(track_id)
+
+    def track_ids(self) -> List[str]:
+        return list(self._tracks)
+
+    def by_genre(self, genre: str) -> Set[str]:
+        return set(self._by_genre.get(_key(genre), ()))
+
+    def by_artist(self, artist: str) -> Set[str]:
+        return set(self._by_artist.get(_key(artist), ()))
+
+    def candidates(
+        self,
+        genres: Iterable[str] = (),
+        artists: Iterable[str] = (),
+        exclude: Iterable[str] = (),
+        limit: Optional[int] = None,
+    ) -> List[str]:
+        """
+        Resolve candidate track ids for a listening profile.
+
+        Tracks by favourite artists come first, then tracks in the listened
+        genres, then the rest of the catalog, each group in registration
+        order. Ids in `exclude` (e.g. recently played) are skipped.
+        """
+        with self._lock:
+            skip = set(exclude)
+            artist_keys = {_key(artist) for artist in artists}
+            genre_keys = {_key(genre) for genre in genres}
+
+            def by_artist() -> Iterator[str]:
+                return self._merged(self._by_artist, artist_keys)
+
+            def by_genre() -> Iterator[str]:
+                return (tid for tid in self._merged(self._by_genre, genre_keys)
+                        if _key(self._tracks[tid].artist) not in artist_keys)
+
+            def rest() -> Iterator[str]:
+                # Only reached when the matching buckets can't fill `limit`
+                return (tid for tid, track in self._tracks.items()
+                        if _key(track.artist) not in artist_keys and _key(track.genre) not in genre_keys)
+
+            ranked = (tid for group in (by_artist, by_genre, rest) for tid in group() if tid not in skip)
+            return list(islice(ranked, limit))
+
+    def _merged(self, index: Dict[str, Dict[str, None]], keys: Set[str]) -> Iterator[str]:
+        """Track ids from the buckets for `keys`, in registration order."""
+        buckets = [index[key] for key in keys if key in index]
+        if len(buckets) == 1:
+            return iter(buckets[0])
+        return heapq.merge(*buckets, key=self._seq.__getitem__)
+
+    def stats(self) -> dict:
+        return {
+            "tracks": len(self._tracks),
+            "genres": len(self._by_genre),
+            "artists": len(self._by_artist),
+            "version": self.version,
+            "snapshot_version": self._saved_version,
+        }
+
+    def load_snapshot(self) -> int:
+        """Load the on-disk snapshot, if any. Returns the number of tracks loaded."""
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return 0
+        with gzip.open(self.snapshot_path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("format") != SNAPSHOT_FORMAT or data.get("fields") != _TRACK_FIELDS:
+            logger.warning("Ignoring incompatible catalog snapshot", path=self.snapshot_path)
+            return 0
+        with self._lock:
+            self._tracks.clear()
+            self._seq.clear()
+            self._next_seq = count()
+            self._by_genre.clear()
+            self._by_artist.clear()
+            for row in data["rows"]:
+                track = CatalogTrack(*row)
+                self._tracks[track.track_id] = track
+                self._index(track)
+            self.version = data.get("version", len(self._tracks))
+            self._saved_version = self.version
+            self._last_save = time.monotonic()
+        return len(self._tracks)
+
+    def save_snapshot(self, force: bool = False) -> bool:
+        """
+        Write the catalog to disk if it changed since the last save.
+
+        Unless `force` is set, writes are throttled to one per
+        `snapshot_interval` seconds. The file is replaced atomically.
+        """
+        if not self.snapshot_path:
+            return False
+        with self._lock:
+            if self.version == self._saved_version:
+                return False
+            if not force and time.monotonic() - self._last_save < self.snapshot_interval:
+                return False
+            data = {
+                "format": SNAPSHOT_FORMAT,
+                "version": self.version,
+                "fields": _TRACK_FIELDS,
+                "rows": [astuple(track) for track in self._tracks.values()],
+            }
+            version = self.version
+
+        directory = os.path.dirname(os.path.abspath(self.snapshot_path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.open(raw, "wt", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp_path, self.snapshot_path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+        with self._lock:
+            self._saved_version = version
+            self._last_save = time.monotonic()
+        logger.info("Catalog snapshot saved", tracks=len(data["rows"]), version=version)
+        return True
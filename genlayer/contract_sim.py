@@ -0,0 +1,598 @@
+"""
+Deterministic local simulator for the GenLayer contracts.
+
+Loads the contract sources unchanged, with `from genlayer import *` bound
+to in-process fakes:
+
+- `TreeMap`, `DynArray`, `u256`, `Address` and `@allow_storage` are plain
+  Python containers that count the bytes each write stores.
+- `gl.exec_prompt` returns canned responses from a seeded responder and
+  counts prompt and response tokens.
+- `gl.eq_principle.*` runs the leader plus N validators and repeats rounds
+  until a majority agrees, counting the rounds.
+- `gl.evm.contract_interface` records emitted cross-chain calls instead of
+  sending them.
+
+Replaying synthetic workloads yields per-method counts: calls, prompts,
+prompt tokens, consensus rounds, storage bytes written and EVM calls.
+
+Usage:
+    python contract_sim.py --tracks 100000 --users 1000 --recommendations 1000
+"""
+import argparse
+import dataclasses
+import difflib
+import hashlib
+import importlib.util
+import json
+import os
+import re
+import sys
+import time
+import types
+from collections import defaultdict
+from contextlib import contextmanager
+
+DEFAULT_CONTRACTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'contracts', 'genlayer')
+
+# Fixed-width scalar sizes in storage (bytes)
+U256_BYTES = 32
+ADDRESS_BYTES = 20
+# Length prefix for strings and arrays
+LENGTH_BYTES = 4
+
+
+def count_tokens(text):
+    """Approximate LLM tokens (about 4 characters per token)."""
+    return (len(text) + 3) // 4
+
+
+# --- storage fakes ----------------------------------------------------------
+
+class u256(int):
+    pass
+
+
+class Address:
+    __slots__ = ('hex',)
+
+    def __init__(self, value):
+        if isinstance(value, Address):
+            value = value.hex
+        if isinstance(value, bytes):
+            value = '0x' + value.hex()
+        self.hex = value.lower()
+
+    def __eq__(self, other):
+        return isinstance(other, Address) and other.hex == self.hex
+
+    def __lt__(self, other):
+        return self.hex < other.hex
+
+    def __hash__(self):
+        return hash(self.hex)
+
+    def __repr__(self):
+        return f'Address({self.hex})'
+
+    def __str__(self):
+        return self.hex
+
+
+def storage_size(value):
+    """Bytes `value` occupies in contract storage."""
+    if isinstance(value, bool):
+        return 1
+    if isinstance(value, int):
+        return U256_BYTES
+    if isinstance(value, Address):
+        return ADDRESS_BYTES
+    if isinstance(value, str):
+        return LENGTH_BYTES + len(value.encode('utf-8'))
+    if isinstance(value, dict):
+        return LENGTH_BYTES + sum(storage_size(k) + storage_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return LENGTH_BYTES + sum(storage_size(v) for v in value)
+    if dataclasses.is_dataclass(value):
+        return sum(storage_size(getattr(value, f.name)) for f in dataclasses.fields(value))
+    if value is None:
+        return 0
+    raise TypeError(f'Unsupported storage type {type(value).__name__}')
+
+
+class _StorageTyped:
+    """Adds `Cls[K, V]` subscription that remembers the element types."""
+    _types = ()
+
+    def __class_getitem__(cls, params):
+        params = params if isinstance(params, tuple) else (params,)
+        return type(cls.__name__, (cls,), {'_types': params})
+
+
+def _default_for(annotation):
+    if isinstance(annotation, type) and issubclass(annotation, (TreeMap, DynArray)):
+        return annotation()
+    if annotation in (u256, int):
+        return u256(0)
+    if annotation is str:
+        return ''
+    if annotation is bool:
+        return False
+    return None
+
+
+class TreeMap(_StorageTyped, dict):
+    def __setitem__(self, key, value):
+        _runtime.account_write(storage_size(key) + storage_size(value))
+        super().__setitem__(key, value)
+
+    def get_or_insert_default(self, key):
+        if key not in self:
+            value_type = self._types[1] if len(self._types) > 1 else None
+            self[key] = _default_for(value_type)
+        return dict.__getitem__(self, key)
+
+
+class DynArray(_StorageTyped, list):
+    def append(self, value):
+        _runtime.account_write(storage_size(value))
+        super().append(value)
+
+    def __setitem__(self, index, value):
+        _runtime.account_write(storage_size(value))
+        super().__setitem__(index, value)
+
+
+def allow_storage(cls):
+    return cls
+
+
+# --- gl namespace -----------------------------------------------------------
+
+class Contract:
+    def __new__(cls, *args, **kwargs):
+        instance = super().__new__(cls)
+        for klass in reversed(cls.__mro__):
+            for name, annotation in getattr(klass, '__annotations__', {}).items():
+                object.__setattr__(instance, name, _default_for(annotation))
+        return instance
+
+    def __setattr__(self, name, value):
+        _runtime.account_write(storage_size(value))
+        object.__setattr__(self, name, value)
+
+
+def _public(kind):
+    def decorator(fn):
+        fn.__gl_public__ = kind
+        return fn
+    return decorator
+
+
+class _EvmInterface:
+    """Stand-in for a `@gl.evm.contract_interface` class bound to an address."""
+
+    def __init__(self, name, address):
+        self._name = name
+        self._address = address
+
+    def emit(self, **_):
+        return _EvmCalls(self, 'write')
+
+    def view(self):
+        return _EvmCalls(self, 'view')
+
+
+class _EvmCalls:
+    def __init__(self, target, kind):
+        self._target = target
+        self._kind = kind
+
+    def __getattr__(self, method):
+        def call(*args):
+            if self._kind == 'write':
+                _runtime.record_evm(self._target._name, method, args)
+                return None
+            return _runtime.evm_views.get((self._target._name, method))
+        return call
+
+
+def _contract_interface(cls):
+    name = cls.__name__
+    return lambda address: _EvmInterface(name, address)
+
+
+def _similar(a, b, threshold):
+    return a == b or difflib.SequenceMatcher(None, a, b).ratio() >= threshold
+
+
+def _consensus(fn, agrees):
+    """Leader plus validators; repeat with the next leader until a majority agrees."""
+    runtime = _runtime
+    for round_number in range(runtime.max_rounds):
+        runtime.round = round_number
+        runtime.validator = 0
+        leader = fn()
+        votes = 1
+        for validator in range(1, runtime.validators):
+            runtime.validator = validator
+            if agrees(leader, fn()):
+                votes += 1
+        if votes * 2 > runtime.validators:
+            runtime.record_rounds(round_number + 1)
+            return leader
+    runtime.record_rounds(runtime.max_rounds, undetermined=True)
+    return leader
+
+
+class _EqPrinciple:
+    @staticmethod
+    def str_similarity(fn, threshold=0.8):
+        return _consensus(fn, lambda leader, own: _similar(leader, own, threshold))
+
+    @staticmethod
+    def strict_eq(fn):
+        return _consensus(fn, lambda leader, own: leader == own)
+
+    @staticmethod
+    def prompt_comparative(fn, principle):
+        """
+        Each validator asks its LLM whether its output and the leader's are
+        equivalent under `principle`. The simulator can't read the principle,
+        so it compares the `verdict` fields of JSON outputs (or whole outputs
+        otherwise) and charges one comparison prompt per validator.
+        """
+        def agrees(leader, own):
+            _runtime.account_prompt(f'{principle}\nLeader: {leader}\nValidator: {own}', 'YES')
+            return _verdict_of(leader) == _verdict_of(own)
+        return _consensus(fn, agrees)
+
+
+def _verdict_of(output):
+    try:
+        data = json.loads(output)
+    except (TypeError, ValueError):
+        return output
+    return data.get('verdict', output) if isinstance(data, dict) else output
+
+
+def _exec_prompt(prompt=None, **kwargs):
+    return _runtime.exec_prompt(prompt if prompt is not None else kwargs.get('prompt', ''))
+
+
+def build_genlayer_module():
+    module = types.ModuleType('genlayer')
+    gl = types.SimpleNamespace(
+        Contract=Contract,
+        public=types.SimpleNamespace(view=_public('view'), write=_public('write')),
+        message=types.SimpleNamespace(sender_address=None),
+        exec_prompt=_exec_prompt,
+        eq_principle=_EqPrinciple,
+        evm=types.SimpleNamespace(contract_interface=_contract_interface),
+        get_tx_sender=lambda: gl.message.sender_address,
+    )
+    module.gl = gl
+    for name, value in (('u256', u256), ('Address', Address), ('TreeMap', TreeMap),
+                        ('DynArray', DynArray), ('allow_storage', allow_storage)):
+        setattr(module, name, value)
+    module.__all__ = ['gl', 'u256', 'Address', 'TreeMap', 'DynArray', 'allow_storage']
+    return module
+
+
+# --- responders -------------------------------------------------------------
+
+def _digest(*parts):
+    return int.from_bytes(hashlib.sha256('\x00'.join(map(str, parts)).encode()).digest()[:8], 'big')
+
+
+class CannedResponder:
+    """
+    Deterministic LLM stand-in.
+
+    The verdict depends only on the prompt, so validators agree on it; a
+    `reject_rate` share of prompts get a negative verdict. Free-text reasons
+    differ per validator (as real model output does), which is what makes
+    similarity-based consensus take extra rounds. Prompts that ask for a JSON
+    verdict get `{"verdict", "reason"}` objects, with a reason every time.
+    """
+
+    VERDICTS = [('APPROVED', 'REJECTED'), ('CLEAR', 'INFRINGING'), ('VERIFIED', 'DENIED')]
+
+    REASONS = [
+        'contains spam links', 'promotional spam content', 'spam and misleading metadata',
+        'possible hate speech', 'metadata looks like spam', 'violates platform policy'
+    ]
+    POSITIVE_REASONS = ['no issues found', 'metadata looks legitimate', 'nothing violates policy']
+
+    def __init__(self, seed=0, reject_rate=0.0):
+        self.seed = seed
+        self.reject_rate = reject_rate
+
+    def _reason(self, round_number, validator):
+        return self.REASONS[_digest(self.seed, round_number, validator) % len(self.REASONS)]
+
+    def __call__(self, prompt, round_number, validator):
+        negative = (_digest(self.seed, prompt) % 10000) < self.reject_rate * 10000
+        reason = self._reason(round_number, validator)
+        if 'Respond with ONLY a comma-separated list of track IDs' in prompt:
+            match = re.search(r'Available tracks on the platform: (.*)', prompt)
+            ids = [t.strip() for t in (match.group(1) if match else '').split(',') if t.strip()]
+            ids.sort(key=lambda t: _digest(self.seed, prompt, t))
+            return ','.join(ids[:5])
+        for positive, negative_verdict in self.VERDICTS:
+            if positive not in prompt or negative_verdict not in prompt:
+                continue
+            if '"verdict"' in prompt:
+                verdict = negative_verdict if negative else positive
+                reason = reason if negative else self.POSITIVE_REASONS[_digest(self.seed, round_number, validator) % 3]
+                return json.dumps({'verdict': verdict, 'reason': reason})
+            return f'{negative_verdict}:{reason}' if negative else positive
+        return 'OK'
+
+
+# --- runtime and accounting -------------------------------------------------
+
+@dataclasses.dataclass
+class MethodStats:
+    calls: int = 0
+    prompts: int = 0
+    prompt_tokens: int = 0
+    max_prompt_tokens: int = 0
+    response_tokens: int = 0
+    consensus_calls: int = 0
+    rounds: int = 0
+    max_rounds: int = 0
+    undetermined: int = 0
+    rounds_histogram: dict = dataclasses.field(default_factory=dict)
+    storage_bytes_written: int = 0
+    evm_calls: int = 0
+    seconds: float = 0.0
+
+    def as_dict(self):
+        data = dataclasses.asdict(self)
+        data['seconds'] = round(self.seconds, 4)
+        data['avg_prompt_tokens'] = round(self.prompt_tokens / self.prompts, 1) if self.prompts else 0
+        data['avg_rounds'] = round(self.rounds / self.consensus_calls, 3) if self.consensus_calls else 0
+        data['single_round_pct'] = (
+            round(100.0 * self.rounds_histogram.get(1, 0) / self.consensus_calls, 1) if self.consensus_calls else 0
+        )
+        return data
+
+
+class Runtime:
+    def __init__(self, responder=None, validators=5, max_rounds=5):
+        self.responder = responder or CannedResponder()
+        self.validators = validators
+        self.max_rounds = max_rounds
+        self.evm_views = {}
+        self.stats = defaultdict(MethodStats)
+        self.evm_log = []
+        self.method = None
+        self.round = 0
+        self.validator = 0
+
+    def _current(self):
+        return self.stats[self.method] if self.method else None
+
+    def account_write(self, size):
+        stats = self._current()
+        if stats is not None:
+            stats.storage_bytes_written += size
+
+    def exec_prompt(self, prompt):
+        response = self.responder(prompt, self.round, self.validator)
+        self.account_prompt(prompt, response)
+        return response
+
+    def account_prompt(self, prompt, response):
+        stats = self._current()
+        if stats is not None:
+            tokens = count_tokens(prompt)
+            stats.prompts += 1
+            stats.prompt_tokens += tokens
+            stats.max_prompt_tokens = max(stats.max_prompt_tokens, tokens)
+            stats.response_tokens += count_tokens(response)
+
+    def record_rounds(self, rounds, undetermined=False):
+        stats = self._current()
+        if stats is not None:
+            stats.consensus_calls += 1
+            stats.rounds += rounds
+            stats.max_rounds = max(stats.max_rounds, rounds)
+            stats.undetermined += int(undetermined)
+            stats.rounds_histogram[rounds] = stats.rounds_histogram.get(rounds, 0) + 1
+
+    def record_evm(self, contract, method, args):
+        self.evm_log.append((self.method, contract, method, args))
+        stats = self._current()
+        if stats is not None:
+            stats.evm_calls += 1
+
+    @contextmanager
+    def calling(self, label):
+        previous, self.method = self.method, label
+        self.round = self.validator = 0
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stats[label].seconds += time.perf_counter() - started
+            self.method = previous
+
+
+_runtime = Runtime()
+
+
+class Simulator:
+    """Deploy and call contracts against the fakes, collecting per-method stats."""
+
+    def __init__(self, responder=None, validators=5, max_rounds=5, contracts_dir=DEFAULT_CONTRACTS_DIR):
+        global _runtime
+        _runtime = self.runtime = Runtime(responder, validators, max_rounds)
+        self.contracts_dir = contracts_dir
+        self.module = build_genlayer_module()
+        sys.modules['genlayer'] = self.module
+        self._classes = {}
+
+    def load(self, filename):
+        """Load a contract source file and return its gl.Contract subclass."""
+        if filename not in self._classes:
+            path = os.path.join(self.contracts_dir, filename)
+            spec = importlib.util.spec_from_file_location(f'gl_contract_{len(self._classes)}', path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            contracts = [v for v in vars(module).values()
+                         if isinstance(v, type) and issubclass(v, Contract) and v is not Contract]
+            self._classes[filename] = contracts[0]
+        return self._classes[filename]
+
+    def deploy(self, filename, *args, sender='0x' + '00' * 19 + '01'):
+        cls = self.load(filename)
+        self.module.gl.message.sender_address = Address(sender)
+        label = f'{cls.__name__}.__init__'
+        with self.runtime.calling(label):
+            self.runtime.stats[label].calls += 1
+            return cls(*args)
+
+    def call(self, contract, method, *args, sender='0x' + '00' * 19 + '01'):
+        fn = getattr(contract, method)
+        if getattr(fn, '__gl_public__', None) is None:
+            raise AttributeError(f'{method} is not a public contract method')
+        self.module.gl.message.sender_address = Address(sender)
+        label = f'{type(contract).__name__}.{method}'
+        with self.runtime.calling(label):
+            self.runtime.stats[label].calls += 1
+            return fn(*args)
+
+    @staticmethod
+    def storage_report(contract):
+        """Bytes held by each storage field of a deployed contract."""
+        fields = {}
+        for klass in type(contract).__mro__:
+            for name in getattr(klass, '__annotations__', {}):
+                fields[name] = storage_size(getattr(contract, name))
+        return fields
+
+    def report(self):
+        return {label: stats.as_dict() for label, stats in sorted(self.runtime.stats.items())}
+
+
+# --- workloads --------------------------------------------------------------
+
+GENRES = ['rock', 'pop', 'jazz', 'hip hop', 'electronic', 'classical', 'folk', 'metal', 'r&b', 'country']
+MOODS = ['happy', 'sad', 'energetic', 'calm', 'dark', 'romantic']
+
+
+def _address(n):
+    return '0x' + f'{n:040x}'
+
+
+def run_workload(sim, tracks=1000, users=100, recommendations=100, candidates=200,
+                 moderations=100, copyright_checks=100, verifications=100, seed=0, structured_verdicts=True,
+                 profile_batch=0):
+    """Replay a synthetic platform workload. Returns {contract: storage report}."""
+    nft = _address(0xBEEF)
+    recommender = sim.deploy('music_recommender.py')
+    moderator = sim.deploy('music_content_moderator.py', Address(nft), structured_verdicts)
+    verifier = sim.deploy('copyright_verifier.py', Address(nft), structured_verdicts)
+    artists = sim.deploy('artist_verifier.py', Address(nft), structured_verdicts)
+
+    track_ids = [f'track_{i}' for i in range(tracks)]
+    for i, track_id in enumerate(track_ids):
+        d = _digest(seed, track_id)
+        sim.call(recommender, 'register_track', track_id, f'Song {i}', f'Artist {d % max(1, tracks // 10)}',
+                 GENRES[d % len(GENRES)], MOODS[d % len(MOODS)], 'indie,live')
+
+    profiles = []
+    for u in range(users):
+        d = _digest(seed, 'user', u)
+        history = ','.join(track_ids[(d + k * 7919) % tracks] for k in range(20)) if tracks else ''
+        profiles.append({
+            'user': _address(u + 1),
+            'genres': ', '.join(GENRES[(d + k) % len(GENRES)] for k in range(3)),
+            'favorite_artists': f'Artist {d % 50}, Artist {(d >> 8) % 50}',
+            'recent_tracks': history,
+            'mood': MOODS[d % len(MOODS)],
+        })
+    if profile_batch > 1:
+        for i in range(0, len(profiles), profile_batch):
+            sim.call(recommender, 'update_user_profiles', json.dumps(profiles[i:i + profile_batch]))
+    else:
+        for p in profiles:
+            sim.call(recommender, 'update_user_profile', p['genres'], p['favorite_artists'],
+                     p['recent_tracks'], p['mood'], sender=p['user'])
+
+    for r in range(recommendations):
+        u = r % max(1, users)
+        d = _digest(seed, 'rec', r)
+        offered = ','.join(track_ids[(d + k * 104729) % tracks] for k in range(min(candidates, tracks)))
+        history = ','.join(track_ids[(d + k * 7919) % tracks] for k in range(20)) if tracks else ''
+        sim.call(recommender, 'get_recommendations', ', '.join(GENRES[(d + k) % len(GENRES)] for k in range(3)),
+                 f'Artist {d % 50}', history, offered, sender=_address(u + 1))
+
+    for m in range(moderations):
+        sim.call(moderator, 'moderate_content', f'track_{m}', f'Song {m}', f'Artist {m % 50}', 'Album',
+                 GENRES[m % len(GENRES)], f'Upload number {m}', m % 7 == 0)
+
+    for c in range(copyright_checks):
+        sim.call(verifier, 'verify_copyright', f'track_{c}', f'Song {c}', f'Artist {c % 50}', c % 3 != 0, 'none')
+
+    for v in range(verifications):
+        sim.call(artists, 'verify_artist', Address(_address(v + 1)), f'Artist {v}',
+                 f'https://social.example/artist{v}', f'https://artist{v}.example')
+
+    return {type(c).__name__: Simulator.storage_report(c) for c in (recommender, moderator, verifier, artists)}
+
+
+def format_report(report, storage):
+    columns = ['calls', 'avg_prompt_tokens', 'max_prompt_tokens', 'avg_rounds', 'max_rounds', 'single_round_pct',
+               'storage_bytes_written', 'evm_calls', 'seconds']
+    widths = [len(c) + 2 for c in columns]
+    lines = ['method'.ljust(44) + ''.join(c.rjust(w) for c, w in zip(columns, widths))]
+    for label, stats in report.items():
+        lines.append(label.ljust(44) + ''.join(str(stats[c]).rjust(w) for c, w in zip(columns, widths)))
+    lines.append('')
+    lines.append('storage (bytes)')
+    for contract, fields in storage.items():
+        lines.append(f'  {contract}: {sum(fields.values())}')
+        for name, size in fields.items():
+            lines.append(f'    {name}: {size}')
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay synthetic workloads against the GenLayer contracts')
+    parser.add_argument('--contracts-dir', default=DEFAULT_CONTRACTS_DIR)
+    parser.add_argument('--tracks', type=int, default=1000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--recommendations', type=int, default=100)
+    parser.add_argument('--candidates', type=int, default=200, help='Track ids offered per recommendation call')
+    parser.add_argument('--moderations', type=int, default=100)
+    parser.add_argument('--copyright-checks', type=int, default=100)
+    parser.add_argument('--verifications', type=int, default=100)
+    parser.add_argument('--validators', type=int, default=5)
+    parser.add_argument('--reject-rate', type=float, default=0.1, help='Share of negative verdicts')
+    parser.add_argument('--profile-batch', type=int, default=0,
+                        help='Push profiles with update_user_profiles in batches of this size')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--legacy-verdicts', action='store_true',
+                        help='Deploy the verdict contracts with free-text verdicts and str_similarity')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+
+    sim = Simulator(CannedResponder(args.seed, args.reject_rate), validators=args.validators,
+                    contracts_dir=args.contracts_dir)
+    storage = run_workload(
+        sim, tracks=args.tracks, users=args.users, recommendations=args.recommendations,
+        candidates=args.candidates, moderations=args.moderations, copyright_checks=args.copyright_checks,
+        verifications=args.verifications, seed=args.seed, structured_verdicts=not args.legacy_verdicts,
+        profile_batch=args.profile_batch
+    )
+    if args.json:
+        print(json.dumps({'methods': sim.report(), 'storage': storage}, indent=2))
+    else:
+        print(format_report(sim.report(), storage))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,37 @@
 # { "Depends": "py-genlayer:1jb45aa8ynh2a9c9xn3b7qqh8sm5q93hwfp7jqmwsfhh8jpz09h6" }
 from genlayer import *
 
+import json
+
+COPYRIGHT_VERDICTS = ("CLEAR", "COVER", "INFRINGING")
+# Validators must agree on the verdict only; reasons are free text
+VERDICT_PRINCIPLE = "The `verdict` fields must be identical. The `reason` fields may be worded differently."
+
+
+def parse_verdict(raw: str, verdicts: tuple, fallback: str) -> str:
+    """
+    Canonical '{"reason": ..., "verdict": ...}' JSON from model output.
+    Accepts a JSON object or legacy 'VERDICT:reason' text; anything else
+    maps to `fallback`.
+    """
+    text = raw.strip()
+    verdict, reason = "", ""
+    start, end = text.find("{"), text.rfind("}")
+    if start != -1 and end > start:
+        try:
+            data = json.loads(text[start:end + 1])
+            verdict = str(data.get("verdict", "")).strip().upper()
+            reason = str(data.get("reason", "")).strip()
+        except (ValueError, AttributeError):
+            pass
+    if not verdict:
+        head, _, tail = text.partition(":")
+        verdict, reason = head.strip().upper(), tail.strip()
+    if verdict not in verdicts:
+        verdict, reason = fallback, "Unrecognized model output"
+    return json.dumps({"verdict": verdict, "reason": reason[:280]}, sort_keys=True)
+
+
 # EVM Interface for the MusicNFT contract on Base
 @gl.evm.contract_interface
 class MusicNFT:
@@ -30,11 +61,14 @@ class CopyrightVerifier(gl.Contract):
 
     owner: Address
     music_nft_address: Address
+    structured_verdicts: bool
     copyright_status: TreeMap[str, str]
+    copyright_reasons: TreeMap[str, str]
 
-    def __init__(self, music_nft: Address):
+    def __init__(self, music_nft: Address, structured_verdicts: bool = True):
         self.owner = gl.message.sender_address
         self.music_nft_address = music_nft
+        self.structured_verdicts = structured_verdicts
 
     @gl.public.write
     def verify_copyright(
@@ -49,20 +83,34 @@ class CopyrightVerifier(gl.Contract):
         Check if track infringes on existing works using GenLayer's web capability.
         """
         
-        prompt = (
+        task = (
             f"Copyright Task: Investigate if the track '{track_title}' by '{artist_name}' infringes on existing copyright.\n"
             f"Claimed Original: {claimed_original}\n"
             f"Samples Used: {sample_sources}\n"
-            f"Respond with: CLEAR, COVER, or INFRINGING:<reason>"
         )
 
-        def run_copyright_check():
-            # In production, this would use gl.get_web_data to search for the title/artist
-            # For now, we simulate the LLM reasoning over the metadata
-            return gl.exec_prompt(prompt).strip().upper()
+        if self.structured_verdicts:
+            # Validators only have to agree on the enumerated verdict; the reason is stored separately
+            prompt = task + 'Respond with JSON only: {"verdict": one of "CLEAR", "COVER", "INFRINGING", "reason": "<one sentence>"}'
+
+            def run_copyright_check():
+                # In production, this would use gl.get_web_data to search for the title/artist
+                return parse_verdict(gl.exec_prompt(prompt), COPYRIGHT_VERDICTS, "INFRINGING")
 
-        result = gl.eq_principle.str_similarity(run_copyright_check, threshold=0.8)
-        self.copyright_status[track_id] = result
+            outcome = json.loads(gl.eq_principle.prompt_comparative(run_copyright_check, VERDICT_PRINCIPLE))
+            result = outcome["verdict"]
+            self.copyright_status[track_id] = result
+            self.copyright_reasons[track_id] = outcome["reason"]
+        else:
+            prompt = task + "Respond with: CLEAR, COVER, or INFRINGING:<reason>"
+
+            def run_copyright_check():
+                # In production, this would use gl.get_web_data to search for the title/artist
+                # For now, we simulate the LLM reasoning over the metadata
+                return gl.exec_prompt(prompt).strip().upper()
+
+            result = gl.eq_principle.str_similarity(run_copyright_check, threshold=0.8)
+            self.copyright_status[track_id] = result
 
         # Hybrid Flow: Inform Base contract if track is INFRINGING
         # If it's infringing, we explicitly set status to false on Base to block minting
@@ -70,6 +118,29 @@ class CopyrightVerifier(gl.Contract):
             nft = MusicNFT(self.music_nft_address)
             nft.emit().setModerationStatus(track_id, False)
 
+    def _status(self, track_id: str) -> str:
+        """Stored verdict as 'VERDICT' or 'VERDICT:<reason>', the format clients parse."""
+        if track_id not in self.copyright_status:
+            return "NOT_VERIFIED"
+        verdict = self.copyright_status[track_id]
+        reason = self.copyright_reasons[track_id] if track_id in self.copyright_reasons else ""
+        return f"{verdict}:{reason}" if reason and verdict == "INFRINGING" else verdict
+
     @gl.public.view
     def get_copyright_status(self, track_id: str) -> str:
-        return self.copyright_status[track_id] if track_id in self.copyright_status else "NOT_VERIFIED"
+        return self._status(track_id)
+
+    @gl.public.view
+    def get_copyright_verdict(self, track_id: str) -> str:
+        """JSON {"verdict", "reason"}; the verdict is NOT_VERIFIED for unknown tracks."""
+        if track_id not in self.copyright_status:
+            return json.dumps({"verdict": "NOT_VERIFIED", "reason": ""})
+        return json.dumps({
+            "verdict": self.copyright_status[track_id],
+            "reason": self.copyright_reasons[track_id] if track_id in self.copyright_reasons else ""
+        })
+
+    @gl.public.view
+    def get_copyright_statuses(self, track_ids: list[str]) -> list[str]:
+        """Bulk variant of get_copyright_status, in the order of `track_ids`."""
+        return [self._status(track_id) for track_id in track_ids]
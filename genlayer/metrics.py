@@ -0,0 +1,148 @@
+"""
+Request timing and Prometheus metrics.
+
+Defines the GenLayer API's metric families and `PrometheusMiddleware`,
+which times requests for FastAPI/Starlette apps. Requests are labelled by
+route template (not raw path) to keep label cardinality bounded. The Flask
+backends serve the same HTTP metric names from
+`blockmusic_common.request_metrics`.
+
+Contract call phases and verdicts are recorded only around real contract
+calls; the mocked endpoints record nothing.
+"""
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route",
+    ["method", "route"]
+)
+HTTP_REQUESTS_TOTAL = Counter(
+    "http_requests_total",
+    "HTTP requests by route and status code",
+    ["method", "route", "status"]
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "HTTP requests currently being served",
+    ["method"]
+)
+
+# Contract call phases: "queue" (submitting a transaction), "consensus"
+# (until validators accept it) and "read" (view calls)
+CONTRACT_CALL_SECONDS = Histogram(
+    "contract_call_duration_seconds",
+    "GenLayer contract call latency by phase",
+    ["contract", "method", "phase"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+)
+CONTRACT_VERDICTS_TOTAL = Counter(
+    "contract_verdicts_total",
+    "Verdicts returned by moderation/copyright/verification contracts",
+    ["contract", "verdict"]
+)
+
+CACHE_REQUESTS_TOTAL = Counter(
+    "cache_requests_total",
+    "Cache lookups by cache name and result",
+    ["cache", "result"]
+)
+
+RPC_REQUEST_SECONDS = Histogram(
+    "rpc_request_duration_seconds",
+    "JSON-RPC HTTP round-trip latency",
+    ["client"]
+)
+RPC_QUEUE_SECONDS = Histogram(
+    "rpc_queue_duration_seconds",
+    "Time a JSON-RPC call waits for its batch to be sent",
+    ["client"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+)
+RPC_BATCH_SIZE = Histogram(
+    "rpc_batch_size",
+    "Calls per JSON-RPC batch request",
+    ["client"],
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250)
+)
+RPC_ERRORS_TOTAL = Counter(
+    "rpc_errors_total",
+    "Failed JSON-RPC HTTP requests",
+    ["client"]
+)
+RPC_PENDING_CALLS = Gauge(
+    "rpc_pending_calls",
+    "JSON-RPC calls queued or in flight",
+    ["client"]
+)
+
+
+@contextmanager
+def contract_phase(contract: str, method: str, phase: str) -> Iterator[None]:
+    """Time one phase of a contract call."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        CONTRACT_CALL_SECONDS.labels(contract, method, phase).observe(time.perf_counter() - start)
+
+
+def record_verdict(contract: str, verdict: str) -> None:
+    """Count a verdict by its keyword (e.g. REJECTED:<reason> -> REJECTED)."""
+    CONTRACT_VERDICTS_TOTAL.labels(contract, verdict.split(":", 1)[0].strip().upper()).inc()
+
+
+def record_cache(cache: str, hits: int, misses: int) -> None:
+    if hits:
+        CACHE_REQUESTS_TOTAL.labels(cache, "hit").inc(hits)
+    if misses:
+        CACHE_REQUESTS_TOTAL.labels(cache, "miss").inc(misses)
+
+
+def render_latest() -> bytes:
+    """Current metrics in Prometheus text exposition format."""
+    return generate_latest()
+
+
+class PrometheusMiddleware:
+    """ASGI middleware timing every request by route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def _route_for(self, scope) -> str:
+        from starlette.routing import Match
+
+        router = scope["app"].router if "app" in scope else None
+        for route in getattr(router, "routes", ()):
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = self._route_for(scope)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_PROGRESS.labels(method).inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUEST_SECONDS.labels(method, route).observe(time.perf_counter() - start)
+            HTTP_REQUESTS_TOTAL.labels(method, route, str(status["code"])).inc()
+            HTTP_REQUESTS_IN_PROGRESS.labels(method).dec()
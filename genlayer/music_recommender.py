@@ -1,6 +1,84 @@
 # { "Depends": "py-genlayer:1jb45aa8ynh2a9c9xn3b7qqh8sm5q93hwfp7jqmwsfhh8jpz09h6" }
 from genlayer import *
 
+import json
+from dataclasses import dataclass
+
+
+@allow_storage
+@dataclass
+class TrackRecord:
+    title: str
+    artist: str
+    genre: str
+    mood: str
+    tags: str
+
+
+@allow_storage
+@dataclass
+class UserProfile:
+    genres: str
+    favorite_artists: str
+    recent_tracks: str
+    mood: str
+
+
+def _index_key(value: str) -> str:
+    return value.strip().lower()
+
+
+# Prompt budget for get_recommendations. Everything is derived from the
+# transaction arguments and storage, so every validator builds the same prompt.
+PROMPT_TOKEN_BUDGET = 1500
+MAX_PROMPT_GENRES = 5
+MAX_PROMPT_ARTISTS = 5
+MAX_PROMPT_RECENT_TRACKS = 10
+MAX_PROMPT_CANDIDATES = 150
+MAX_PROMPT_ITEM_CHARS = 64
+MAX_RECOMMENDATIONS = 5
+# Profiles per update_user_profiles transaction
+MAX_PROFILE_BATCH = 200
+
+
+def count_tokens(text: str) -> int:
+    """Approximate LLM tokens (about 4 characters per token)."""
+    return (len(text) + 3) // 4
+
+
+def _split_csv(value: str) -> list[str]:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def _clip(values: list[str]) -> list[str]:
+    """Cut free text (genres, artist names) for the prompt. Track ids are never cut."""
+    return [value[:MAX_PROMPT_ITEM_CHARS] for value in values]
+
+
+def _dedupe(values: list[str]) -> list[str]:
+    """Case-insensitive dedupe keeping the first spelling and order."""
+    seen = set()
+    result = []
+    for value in values:
+        key = _index_key(value)
+        if key not in seen:
+            seen.add(key)
+            result.append(value)
+    return result
+
+
+def _top_by_frequency(values: list[str], n: int) -> list[str]:
+    """The `n` most frequent values (case-insensitive), ties in first-seen order."""
+    counts = {}
+    first = {}
+    for i, value in enumerate(values):
+        key = _index_key(value)
+        counts[key] = counts.get(key, 0) + 1
+        if key not in first:
+            first[key] = (i, value)
+    ranked = sorted(counts, key=lambda key: (-counts[key], first[key][0]))
+    return [first[key][1] for key in ranked[:n]]
+
 
 class MusicRecommender(gl.Contract):
     """
@@ -17,15 +95,24 @@ class MusicRecommender(gl.Contract):
     """
 
     owner: Address
-    # Store user listening profiles as JSON strings
-    user_profiles: TreeMap[Address, str]
-    # Store track catalog as JSON strings  
-    track_catalog: TreeMap[str, str]  # track_id -> metadata JSON
+    user_profiles: TreeMap[Address, UserProfile]
+    track_catalog: TreeMap[str, TrackRecord]
+    # Secondary indexes: normalized genre/artist -> track ids
+    tracks_by_genre: TreeMap[str, DynArray[str]]
+    tracks_by_artist: TreeMap[str, DynArray[str]]
+    # Latest recommendations per user, comma-separated track ids
+    recommendations: TreeMap[Address, str]
     track_count: u256
+    # Prompt size of each user's latest get_recommendations call (JSON), and totals
+    prompt_stats: TreeMap[Address, str]
+    prompt_calls: u256
+    prompt_tokens_total: u256
 
     def __init__(self):
         self.owner = gl.message.sender_address
         self.track_count = u256(0)
+        self.prompt_calls = u256(0)
+        self.prompt_tokens_total = u256(0)
 
     @gl.public.write
     def register_track(
@@ -37,14 +124,30 @@ class MusicRecommender(gl.Contract):
         mood: str,
         tags: str,
     ) -> None:
-        """Register a track in the recommendation catalog."""
-        metadata = (
-            f'{{"id": "{track_id}", "title": "{title}", '
-            f'"artist": "{artist}", "genre": "{genre}", '
-            f'"mood": "{mood}", "tags": "{tags}"}}'
+        """Register (or re-register) a track in the recommendation catalog."""
+        if track_id in self.track_catalog:
+            previous = self.track_catalog[track_id]
+            self._unindex(self.tracks_by_genre, previous.genre, track_id)
+            self._unindex(self.tracks_by_artist, previous.artist, track_id)
+        else:
+            self.track_count = u256(int(self.track_count) + 1)
+
+        self.track_catalog[track_id] = TrackRecord(
+            title=title, artist=artist, genre=genre, mood=mood, tags=tags
         )
-        self.track_catalog[track_id] = metadata
-        self.track_count = u256(int(self.track_count) + 1)
+        self.tracks_by_genre.get_or_insert_default(_index_key(genre)).append(track_id)
+        self.tracks_by_artist.get_or_insert_default(_index_key(artist)).append(track_id)
+
+    def _unindex(self, index: TreeMap[str, DynArray[str]], value: str, track_id: str) -> None:
+        key = _index_key(value)
+        if key not in index:
+            return
+        ids = index[key]
+        for i in range(len(ids)):
+            if ids[i] == track_id:
+                ids[i] = ids[len(ids) - 1]
+                ids.pop()
+                break
 
     @gl.public.write
     def update_user_profile(
@@ -55,13 +158,33 @@ class MusicRecommender(gl.Contract):
         listening_mood: str,
     ) -> None:
         """Update a user's listening profile for better recommendations."""
-        profile = (
-            f'{{"genres": "{genres_listened}", '
-            f'"favorite_artists": "{favorite_artists}", '
-            f'"recent_tracks": "{recent_tracks}", '
-            f'"mood": "{listening_mood}"}}'
+        self.user_profiles[gl.message.sender_address] = UserProfile(
+            genres=genres_listened,
+            favorite_artists=favorite_artists,
+            recent_tracks=recent_tracks,
+            mood=listening_mood,
         )
-        self.user_profiles[gl.message.sender_address] = profile
+
+    @gl.public.write
+    def update_user_profiles(self, profiles: str) -> None:
+        """
+        Bulk update_user_profile for the platform backend (owner only).
+
+        `profiles` is a JSON array of objects with "user" (address),
+        "genres", "favorite_artists", "recent_tracks" and "mood".
+        """
+        if gl.message.sender_address != self.owner:
+            raise Exception("Only the owner can update profiles in bulk")
+        entries = json.loads(profiles)
+        if len(entries) > MAX_PROFILE_BATCH:
+            raise Exception(f"At most {MAX_PROFILE_BATCH} profiles per call")
+        for entry in entries:
+            self.user_profiles[Address(entry["user"])] = UserProfile(
+                genres=entry.get("genres", ""),
+                favorite_artists=entry.get("favorite_artists", ""),
+                recent_tracks=entry.get("recent_tracks", ""),
+                mood=entry.get("mood", ""),
+            )
 
     @gl.public.write
     def get_recommendations(
@@ -79,23 +202,14 @@ class MusicRecommender(gl.Contract):
         Read the stored result after transaction is finalized.
         """
 
-        prompt = (
-            f"You are a music recommendation AI for a decentralized music platform.\n\n"
-            f"User's listening profile:\n"
-            f"- Genres they enjoy: {genres_listened}\n"
-            f"- Favorite artists: {favorite_artists}\n"
-            f"- Recently listened to: {recent_tracks}\n\n"
-            f"Available tracks on the platform: {available_track_ids}\n\n"
-            f"Based on this profile, recommend up to 5 track IDs from the available "
-            f"tracks that this user would enjoy. Consider genre affinity, artist "
-            f"similarity, and mood matching.\n\n"
-            f"Respond with ONLY a comma-separated list of track IDs, nothing else.\n"
-            f"Example: track_1,track_3,track_7\n"
-        )
+        prompt, stats = self._build_prompt(genres_listened, favorite_artists, recent_tracks, available_track_ids)
+        offered = set(stats.pop("offered"))
 
         def generate_recommendations():
             result = gl.exec_prompt(prompt)
-            return result.strip()
+            # Keep only ids that were offered, so a hallucinated id never gets stored
+            ids = [tid for tid in _dedupe(_split_csv(result)) if tid in offered]
+            return ",".join(ids[:MAX_RECOMMENDATIONS])
 
         recommendations = gl.eq_principle.str_similarity(
             generate_recommendations,
@@ -104,26 +218,162 @@ class MusicRecommender(gl.Contract):
 
         # Store recommendations for the user
         sender = gl.message.sender_address
-        self.user_profiles[sender] = (
-            f'{{"genres": "{genres_listened}", '
-            f'"favorite_artists": "{favorite_artists}", '
-            f'"recent_tracks": "{recent_tracks}", '
-            f'"recommendations": "{recommendations}"}}'
+        mood = self.user_profiles[sender].mood if sender in self.user_profiles else ""
+        self.user_profiles[sender] = UserProfile(
+            genres=genres_listened,
+            favorite_artists=favorite_artists,
+            recent_tracks=recent_tracks,
+            mood=mood,
+        )
+        self.recommendations[sender] = recommendations
+        self.prompt_stats[sender] = json.dumps(stats, sort_keys=True)
+        self.prompt_calls = u256(int(self.prompt_calls) + 1)
+        self.prompt_tokens_total = u256(int(self.prompt_tokens_total) + stats["prompt_tokens"])
+
+    def _build_prompt(
+        self,
+        genres_listened: str,
+        favorite_artists: str,
+        recent_tracks: str,
+        available_track_ids: str,
+    ) -> tuple[str, dict]:
+        """
+        Compact the listening profile and candidate list into a prompt of at
+        most PROMPT_TOKEN_BUDGET tokens. Returns (prompt, stats).
+
+        History is summarized rather than inlined: the top genres by
+        frequency, including the genres of recently played tracks,
+        deduplicated artists, and the latest distinct recent tracks.
+        Candidates the user just played are dropped. Candidates matching the
+        top genres or artists are ranked first, and the list is cut to
+        whatever budget is left. With no candidates given, they are drawn
+        from the genre and artist indexes.
+        """
+        recent = _dedupe(_split_csv(recent_tracks))
+        history_genres = _split_csv(genres_listened) + [
+            self.track_catalog[tid].genre for tid in recent if tid in self.track_catalog
+        ]
+        genres = _top_by_frequency(_clip(history_genres), MAX_PROMPT_GENRES)
+        artists = _top_by_frequency(_clip(_split_csv(favorite_artists)), MAX_PROMPT_ARTISTS)
+        # An overlong id is left out of the prompt rather than cut into a different id
+        recent = [tid for tid in recent if len(tid) <= MAX_PROMPT_ITEM_CHARS][:MAX_PROMPT_RECENT_TRACKS]
+
+        requested = _dedupe(_split_csv(available_track_ids))
+        if not requested:
+            for key, index in [(_index_key(g), self.tracks_by_genre) for g in genres] + \
+                    [(_index_key(a), self.tracks_by_artist) for a in artists]:
+                if key in index:
+                    ids = index[key]
+                    for i in range(min(len(ids), MAX_PROMPT_CANDIDATES)):
+                        requested.append(ids[i])
+            requested = _dedupe(requested)
+
+        played = {_index_key(tid) for tid in _split_csv(recent_tracks)}
+        genre_keys = {_index_key(g) for g in genres}
+        artist_keys = {_index_key(a) for a in artists}
+
+        def affinity(tid: str) -> int:
+            if tid not in self.track_catalog:
+                return 0
+            track = self.track_catalog[tid]
+            return 2 * (_index_key(track.genre) in genre_keys) + (_index_key(track.artist) in artist_keys)
+
+        candidates = [tid for tid in requested if _index_key(tid) not in played]
+        # sorted() is stable, so equal scores keep the caller's order
+        candidates = sorted(candidates, key=lambda tid: -affinity(tid))
+
+        template = (
+            "You are a music recommendation AI for a decentralized music platform.\n\n"
+            "User's listening profile:\n"
+            "- Top genres: {genres}\n"
+            "- Favorite artists: {artists}\n"
+            "- Recently listened to: {recent}\n\n"
+            "Available tracks on the platform: {candidates}\n\n"
+            f"Based on this profile, recommend up to {MAX_RECOMMENDATIONS} track IDs from the available "
+            "tracks that this user would enjoy. Consider genre affinity, artist "
+            "similarity, and mood matching.\n\n"
+            "Respond with ONLY a comma-separated list of track IDs, nothing else.\n"
+            "Example: track_1,track_3,track_7\n"
         )
+        profile = {"genres": ", ".join(genres), "artists": ", ".join(artists), "recent": ",".join(recent)}
+        remaining_chars = (PROMPT_TOKEN_BUDGET - count_tokens(template.format(candidates="", **profile))) * 4
+        selected = []
+        for tid in candidates[:MAX_PROMPT_CANDIDATES]:
+            cost = len(tid) + (1 if selected else 0)
+            if cost > remaining_chars:
+                continue   # a shorter id further down may still fit
+            selected.append(tid)
+            remaining_chars -= cost
+
+        prompt = template.format(candidates=",".join(selected), **profile)
+        return prompt, {
+            "prompt_tokens": count_tokens(prompt),
+            "genres": len(genres),
+            "artists": len(artists),
+            "recent_tracks": len(recent),
+            "candidates_requested": len(requested),
+            "candidates_sent": len(selected),
+            "offered": selected,
+        }
 
     @gl.public.view
     def get_user_profile(self, user: Address) -> str:
         """Get a user's profile including recommendations."""
-        if user in self.user_profiles:
-            return self.user_profiles[user]
-        return "{}"
+        if user not in self.user_profiles:
+            return "{}"
+        profile = self.user_profiles[user]
+        return json.dumps({
+            "genres": profile.genres,
+            "favorite_artists": profile.favorite_artists,
+            "recent_tracks": profile.recent_tracks,
+            "mood": profile.mood,
+            "recommendations": self.recommendations[user] if user in self.recommendations else "",
+        })
+
+    @gl.public.view
+    def get_prompt_stats(self, user: Address) -> str:
+        """Prompt size of the user's latest recommendation call, plus contract-wide totals."""
+        calls = int(self.prompt_calls)
+        return json.dumps({
+            "last_call": json.loads(self.prompt_stats[user]) if user in self.prompt_stats else None,
+            "calls": calls,
+            "avg_prompt_tokens": int(self.prompt_tokens_total) // calls if calls else 0,
+            "token_budget": PROMPT_TOKEN_BUDGET,
+        })
+
+    @gl.public.view
+    def get_recommendations_for(self, user: Address) -> list[str]:
+        """Get the latest stored recommendations for a user."""
+        if user not in self.recommendations:
+            return []
+        return [tid.strip() for tid in self.recommendations[user].split(",") if tid.strip()]
 
     @gl.public.view
     def get_track_info(self, track_id: str) -> str:
         """Get track metadata from the catalog."""
-        if track_id in self.track_catalog:
-            return self.track_catalog[track_id]
-        return "{}"
+        if track_id not in self.track_catalog:
+            return "{}"
+        track = self.track_catalog[track_id]
+        return json.dumps({
+            "id": track_id,
+            "title": track.title,
+            "artist": track.artist,
+            "genre": track.genre,
+            "mood": track.mood,
+            "tags": track.tags,
+        })
+
+    @gl.public.view
+    def get_tracks_by_genre(self, genre: str) -> list[str]:
+        """Get track ids in a genre (case-insensitive)."""
+        key = _index_key(genre)
+        return list(self.tracks_by_genre[key]) if key in self.tracks_by_genre else []
+
+    @gl.public.view
+    def get_tracks_by_artist(self, artist: str) -> list[str]:
+        """Get track ids by an artist (case-insensitive)."""
+        key = _index_key(artist)
+        return list(self.tracks_by_artist[key]) if key in self.tracks_by_artist else []
 
     @gl.public.view
     def get_catalog_size(self) -> u256:
@@ -0,0 +1,244 @@
+"""
+Materialized per-user recommendations.
+
+Listening events mark a user dirty and update a compact listening profile
+(recent tracks, genre and artist counts resolved from the local catalog).
+A scheduled job recomputes recommendations only for dirty users, so
+`/recommend` for a known user is a dict lookup instead of a fresh
+contract round. Results, profiles and the dirty set are persisted as a
+gzip snapshot, like the catalog.
+
+Users are keyed by `user_key` (trimmed, lowercased), so a wallet address
+sent as a checksummed `user_id` and as a lowercase `user_address` is one user.
+"""
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from dataclasses import astuple, dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import structlog
+
+from catalog_sync import CatalogStore
+
+logger = structlog.get_logger()
+
+SNAPSHOT_FORMAT = 1
+MAX_RECENT_TRACKS = 50
+PROFILE_TOP_N = 5
+
+
+@dataclass(frozen=True)
+class ListeningProfile:
+    """Arguments for `MusicRecommender.get_recommendations`, as comma-separated strings."""
+    genres_listened: str
+    favorite_artists: str
+    recent_tracks: str
+
+
+def user_key(user_id: str) -> str:
+    return user_id.strip().lower()
+
+
+class _UserState:
+    __slots__ = ("recent", "genres", "artists", "explicit")
+
+    def __init__(self):
+        self.recent: List[str] = []          # Distinct track ids, most recent first
+        self.genres: Counter = Counter()
+        self.artists: Counter = Counter()
+        self.explicit: Optional[ListeningProfile] = None
+
+    def profile(self) -> ListeningProfile:
+        if self.explicit is not None:
+            return self.explicit
+        return ListeningProfile(
+            genres_listened=", ".join(g for g, _ in self.genres.most_common(PROFILE_TOP_N)),
+            favorite_artists=", ".join(a for a, _ in self.artists.most_common(PROFILE_TOP_N)),
+            recent_tracks=",".join(self.recent),
+        )
+
+
+class RecommendationStore:
+    """
+    Per-user recommendation results with a dirty set.
+
+    A user is dirty from the moment their listening changes until a
+    materialization pass stores fresh results for them. Each mark carries a
+    generation number so a result computed from an older profile never
+    clears a newer mark.
+    """
+
+    def __init__(self, snapshot_path: Optional[str] = None, snapshot_interval: float = 30.0):
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.version = 0
+        self._users: Dict[str, _UserState] = {}
+        self._results: Dict[str, List[str]] = {}
+        self._dirty: Dict[str, int] = {}     # user_id -> generation of the latest mark
+        self._generation = 0
+        self._lock = threading.RLock()
+        self._saved_version = 0
+        self._last_save = 0.0
+
+    def _mark(self, user_id: str) -> None:
+        self._generation += 1
+        self._dirty[user_id] = self._generation
+        self.version += 1
+
+    def record_listens(self, events: Iterable[Tuple[str, str]], catalog: CatalogStore) -> int:
+        """Fold (user_id, track_id) listens into the profiles. Returns users marked dirty."""
+        marked = set()
+        with self._lock:
+            for user_id, track_id in events:
+                user_id = user_key(user_id)
+                state = self._users.setdefault(user_id, _UserState())
+                # Listening history supersedes a caller-supplied profile
+                state.explicit = None
+                if track_id in state.recent:
+                    state.recent.remove(track_id)
+                state.recent.insert(0, track_id)
+                del state.recent[MAX_RECENT_TRACKS:]
+                track = catalog.get(track_id)
+                if track is not None:
+                    state.genres[track.genre] += 1
+                    state.artists[track.artist] += 1
+                self._mark(user_id)
+                marked.add(user_id)
+        return len(marked)
+
+    def set_profile(self, user_id: str, profile: ListeningProfile) -> bool:
+        """Use a caller-supplied profile for a user. Returns True (and marks dirty) if it changed."""
+        user_id = user_key(user_id)
+        with self._lock:
+            state = self._users.setdefault(user_id, _UserState())
+            if state.explicit == profile:
+                return False
+            state.explicit = profile
+            self._mark(user_id)
+            return True
+
+    def knows(self, user_id: str) -> bool:
+        """True for users added by `record_listens` or `set_profile`."""
+        return user_key(user_id) in self._users
+
+    def profile(self, user_id: str) -> ListeningProfile:
+        with self._lock:
+            state = self._users.get(user_key(user_id))
+            return state.profile() if state is not None else ListeningProfile("", "", "")
+
+    def get(self, user_id: str) -> Optional[List[str]]:
+        """Materialized recommendations, or None on a miss."""
+        return self._results.get(user_key(user_id))
+
+    def generation(self, user_id: str) -> int:
+        """Current dirty mark for a user (0 when clean); pass it to `put`."""
+        return self._dirty.get(user_key(user_id), 0)
+
+    def put(self, user_id: str, recommendations: List[str], generation: int) -> None:
+        """Store results computed from the profile at `generation`."""
+        user_id = user_key(user_id)
+        with self._lock:
+            self._results[user_id] = list(recommendations)
+            if self._dirty.get(user_id) == generation:
+                del self._dirty[user_id]
+            self.version += 1
+
+    def dirty(self, limit: Optional[int] = None) -> List[Tuple[str, int, ListeningProfile]]:
+        """(user_id, generation, profile) for dirty users, oldest marks first."""
+        with self._lock:
+            users = sorted(self._dirty.items(), key=lambda item: item[1])[:limit]
+            return [(user_id, generation, self._users[user_id].profile()) for user_id, generation in users]
+
+    def materialize(self, compute: Callable[[ListeningProfile], List[str]], limit: Optional[int] = None) -> int:
+        """Recompute up to `limit` dirty users with `compute`. Returns users refreshed."""
+        refreshed = 0
+        for user_id, generation, profile in self.dirty(limit):
+            try:
+                recommendations = compute(profile)
+            except Exception as e:
+                logger.error("Materialization failed", user_id=user_id, error=str(e))
+                continue
+            self.put(user_id, recommendations, generation)
+            refreshed += 1
+        return refreshed
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._users),
+            "materialized": len(self._results),
+            "dirty": len(self._dirty),
+            "version": self.version,
+        }
+
+    def load_snapshot(self) -> int:
+        """Load the on-disk snapshot, if any. Returns the number of users loaded."""
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return 0
+        with gzip.open(self.snapshot_path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("format") != SNAPSHOT_FORMAT:
+            logger.warning("Ignoring incompatible recommendation snapshot", path=self.snapshot_path)
+            return 0
+        with self._lock:
+            self._users.clear()
+            for user_id, saved in data["users"].items():
+                state = _UserState()
+                state.recent = saved["recent"]
+                state.genres = Counter(saved["genres"])
+                state.artists = Counter(saved["artists"])
+                state.explicit = ListeningProfile(*saved["explicit"]) if saved["explicit"] else None
+                self._users[user_key(user_id)] = state
+            self._results = {user_key(user_id): results for user_id, results in data["results"].items()}
+            self._dirty = {user_key(user_id): generation for user_id, generation in data["dirty"].items()}
+            self._generation = max(self._dirty.values(), default=0)
+            self.version = self._saved_version = data.get("version", 0)
+            self._last_save = time.monotonic()
+        return len(self._users)
+
+    def save_snapshot(self, force: bool = False) -> bool:
+        """Write state to disk if it changed, at most once per `snapshot_interval` unless forced."""
+        if not self.snapshot_path:
+            return False
+        with self._lock:
+            if self.version == self._saved_version:
+                return False
+            if not force and time.monotonic() - self._last_save < self.snapshot_interval:
+                return False
+            data = {
+                "format": SNAPSHOT_FORMAT,
+                "version": self.version,
+                "users": {
+                    user_id: {
+                        "recent": state.recent,
+                        "genres": dict(state.genres),
+                        "artists": dict(state.artists),
+                        "explicit": list(astuple(state.explicit)) if state.explicit else None,
+                    }
+                    for user_id, state in self._users.items()
+                },
+                "results": dict(self._results),
+                "dirty": dict(self._dirty),
+            }
+            version = self.version
+
+        directory = os.path.dirname(os.path.abspath(self.snapshot_path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.open(raw, "wt", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp_path, self.snapshot_path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+        with self._lock:
+            self._saved_version = version
+            self._last_save = time.monotonic()
+        logger.info("Recommendation snapshot saved", users=len(data["users"]), version=version)
+        return True
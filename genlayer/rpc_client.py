@@ -0,0 +1,229 @@
+"""
+Process-wide async JSON-RPC clients for the GenLayer and Base RPC endpoints.
+
+One `RPCClientManager` is created in the FastAPI lifespan and shared by all
+requests. Each endpoint gets a keep-alive `httpx.AsyncClient` (HTTP/2 when the
+`h2` package is installed), a per-host concurrency limit and a micro-batcher
+that coalesces concurrent `call()`s into a single JSON-RPC batch request.
+"""
+import asyncio
+import itertools
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+import structlog
+
+from metrics import RPC_BATCH_SIZE, RPC_ERRORS_TOTAL, RPC_PENDING_CALLS, RPC_QUEUE_SECONDS, RPC_REQUEST_SECONDS
+
+logger = structlog.get_logger()
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class RPCError(Exception):
+    """A JSON-RPC error object returned by the node."""
+
+    def __init__(self, code: int, message: str, data: Any = None):
+        super().__init__(f"RPC error {code}: {message}")
+        self.code = code
+        self.message = message
+        self.data = data
+
+
+class JsonRpcClient:
+    """
+    JSON-RPC client for a single endpoint.
+
+    Calls made within `batch_window` seconds of each other are sent as one
+    batch request (up to `max_batch_size` calls). HTTP requests are sent
+    under `semaphore`, which `RPCClientManager` shares between all clients
+    on the same host; without one, the client gets its own limit of
+    `max_concurrency`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        url: str,
+        http: httpx.AsyncClient,
+        max_concurrency: int = 16,
+        batch_window: float = 0.005,
+        max_batch_size: int = 100,
+        semaphore: Optional[asyncio.Semaphore] = None,
+    ):
+        self.name = name
+        self.url = url
+        self.http = http
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self._semaphore = semaphore or asyncio.Semaphore(max_concurrency)
+        self._ids = itertools.count(1)
+        self._pending: List[Tuple[int, str, list, asyncio.Future, float]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._inflight: set = set()
+
+    async def call(self, method: str, params: Optional[list] = None) -> Any:
+        """Queue a call for the next batch and wait for its result."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((next(self._ids), method, params or [], future, time.perf_counter()))
+        RPC_PENDING_CALLS.labels(self.name).inc()
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_window, self._flush)
+        return await future
+
+    async def batch(self, calls: Sequence[Tuple[str, list]], return_exceptions: bool = False) -> List[Any]:
+        """
+        Send several calls and return their results in order.
+
+        With `return_exceptions`, failed calls yield their `RPCError`
+        instead of raising.
+        """
+        return await asyncio.gather(
+            *(self.call(method, params) for method, params in calls),
+            return_exceptions=return_exceptions
+        )
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        while self._pending:
+            chunk = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            task = asyncio.ensure_future(self._send(chunk))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _send(self, chunk: List[Tuple[int, str, list, asyncio.Future, float]]) -> None:
+        payload = [
+            {"jsonrpc": "2.0", "id": call_id, "method": method, "params": params}
+            for call_id, method, params, _, _ in chunk
+        ]
+        RPC_BATCH_SIZE.labels(self.name).observe(len(chunk))
+        try:
+            async with self._semaphore:
+                sent = time.perf_counter()
+                for *_, queued in chunk:
+                    RPC_QUEUE_SECONDS.labels(self.name).observe(sent - queued)
+                response = await self.http.post(self.url, json=payload[0] if len(payload) == 1 else payload)
+                RPC_REQUEST_SECONDS.labels(self.name).observe(time.perf_counter() - sent)
+            response.raise_for_status()
+            body = response.json()
+        except Exception as e:
+            RPC_ERRORS_TOTAL.labels(self.name).inc()
+            logger.error("RPC request failed", client=self.name, calls=len(chunk), error=str(e))
+            for _, _, _, future, _ in chunk:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            RPC_PENDING_CALLS.labels(self.name).dec(len(chunk))
+
+        replies = {reply.get("id"): reply for reply in (body if isinstance(body, list) else [body])}
+        for call_id, method, _, future, _ in chunk:
+            if future.done():
+                continue
+            reply = replies.get(call_id)
+            if reply is None:
+                future.set_exception(RPCError(-32603, f"No response for {method}"))
+            elif reply.get("error"):
+                error = reply["error"]
+                future.set_exception(RPCError(error.get("code", -32603), error.get("message", ""), error.get("data")))
+            else:
+                future.set_result(reply.get("result"))
+
+    async def aclose(self) -> None:
+        self._flush()
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+
+
+class RPCClientManager:
+    """
+    Owns the shared HTTP connection pools and JSON-RPC clients.
+
+    Endpoints on the same host share one `httpx.AsyncClient`, so keep-alive
+    connections are reused across clients and requests, and one concurrency
+    limit of `max_concurrency` in-flight requests.
+    """
+
+    def __init__(
+        self,
+        endpoints: Dict[str, str],
+        timeout: float = 10.0,
+        connect_timeout: float = 3.0,
+        max_connections: int = 50,
+        max_keepalive: int = 20,
+        keepalive_expiry: float = 30.0,
+        max_concurrency: int = 16,
+        batch_window: float = 0.005,
+        max_batch_size: int = 100,
+    ):
+        self._http: Dict[str, httpx.AsyncClient] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.clients: Dict[str, JsonRpcClient] = {}
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry
+        )
+        for name, url in endpoints.items():
+            if not url:
+                continue
+            host = urlsplit(url).netloc
+            if host not in self._http:
+                self._http[host] = httpx.AsyncClient(
+                    http2=HTTP2_AVAILABLE,
+                    limits=limits,
+                    timeout=httpx.Timeout(timeout, connect=connect_timeout),
+                    headers={"Content-Type": "application/json"}
+                )
+                self._semaphores[host] = asyncio.Semaphore(max_concurrency)
+            self.clients[name] = JsonRpcClient(
+                name,
+                url,
+                self._http[host],
+                batch_window=batch_window,
+                max_batch_size=max_batch_size,
+                semaphore=self._semaphores[host]
+            )
+        logger.info("RPC clients ready", clients=list(self.clients), http2=HTTP2_AVAILABLE)
+
+    @classmethod
+    def from_env(cls) -> "RPCClientManager":
+        return cls(
+            endpoints={
+                "genlayer": os.getenv("GENLAYER_RPC_URL", "http://localhost:8545"),
+                "base": os.getenv("WEB3_PROVIDER_URL", "https://sepolia.base.org"),
+            },
+            timeout=float(os.getenv("RPC_TIMEOUT", "10")),
+            max_connections=int(os.getenv("RPC_MAX_CONNECTIONS", "50")),
+            max_keepalive=int(os.getenv("RPC_MAX_KEEPALIVE", "20")),
+            max_concurrency=int(os.getenv("RPC_MAX_CONCURRENCY", "16")),
+            batch_window=float(os.getenv("RPC_BATCH_WINDOW_MS", "5")) / 1000,
+            max_batch_size=int(os.getenv("RPC_MAX_BATCH_SIZE", "100")),
+        )
+
+    @property
+    def genlayer(self) -> JsonRpcClient:
+        return self.clients["genlayer"]
+
+    @property
+    def base(self) -> JsonRpcClient:
+        return self.clients["base"]
+
+    async def aclose(self) -> None:
+        for client in self.clients.values():
+            await client.aclose()
+        for http in self._http.values():
+            await http.aclose()
@@ -0,0 +1,233 @@
+"""
+Double-entry ledger for wallet balances.
+
+Every balance change is an append-only set of entries that sum to zero,
+posted in one database transaction together with the materialized
+balance of each affected account. Amounts are exact integers in micro-units
+(6 decimals, the same precision as USDC), so there is no float drift.
+
+- Balance reads are a single primary-key lookup on `ledger_accounts`.
+- Statements page through `ledger_entries` with a keyset cursor on the
+  (account_id, created_at, id) index, so history stays fast at millions of
+  entries.
+"""
+from decimal import Decimal, ROUND_HALF_EVEN
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+UNITS_PER_DOLLAR = 10 ** 6
+
+# System accounts that balance the wallet side of each transaction
+DEPOSITS_ACCOUNT = 'external:deposits'
+OPENING_BALANCE_ACCOUNT = 'equity:opening_balances'
+
+
+class InsufficientFunds(Exception):
+    pass
+
+
+def to_units(amount) -> int:
+    """Convert a dollar amount (float, str or Decimal) to integer micro-units."""
+    return int((Decimal(str(amount)) * UNITS_PER_DOLLAR).to_integral_value(rounding=ROUND_HALF_EVEN))
+
+
+def from_units(units: int) -> float:
+    return units / UNITS_PER_DOLLAR
+
+
+class Ledger:
+    def __init__(self, db):
+        self.db = db
+
+    def create_tables(self):
+        """Create ledger tables if they don't exist"""
+        conn = self.db.get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS ledger_accounts (
+                    id SERIAL PRIMARY KEY,
+                    name TEXT UNIQUE NOT NULL,
+                    wallet_id INTEGER UNIQUE REFERENCES wallets (id),
+                    balance BIGINT NOT NULL DEFAULT 0,
+                    allow_negative BOOLEAN NOT NULL DEFAULT FALSE,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS ledger_transactions (
+                    id BIGSERIAL PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    reference TEXT,
+                    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS ledger_entries (
+                    id BIGSERIAL PRIMARY KEY,
+                    transaction_id BIGINT NOT NULL REFERENCES ledger_transactions (id),
+                    account_id INTEGER NOT NULL REFERENCES ledger_accounts (id),
+                    amount BIGINT NOT NULL,
+                    balance_after BIGINT NOT NULL,
+                    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_ledger_entries_account_created
+                ON ledger_entries (account_id, created_at, id)
+            ''')
+            for name in (DEPOSITS_ACCOUNT, OPENING_BALANCE_ACCOUNT):
+                cursor.execute('''
+                    INSERT INTO ledger_accounts (name, allow_negative) VALUES (%s, TRUE)
+                    ON CONFLICT (name) DO NOTHING
+                ''', (name,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _system_account_id(self, cursor, name: str) -> int:
+        cursor.execute('SELECT id FROM ledger_accounts WHERE name = %s', (name,))
+        return cursor.fetchone()[0]
+
+    def _wallet_account_id(self, cursor, wallet_id: int) -> Optional[int]:
+        """
+        Get (or open) the ledger account for a wallet.
+
+        A new account is seeded with the wallet's legacy REAL balance as an
+        opening-balance transaction, so history starts from the migrated value.
+        """
+        cursor.execute('SELECT id FROM ledger_accounts WHERE wallet_id = %s', (wallet_id,))
+        row = cursor.fetchone()
+        if row:
+            return row[0]
+
+        cursor.execute('SELECT balance FROM wallets WHERE id = %s', (wallet_id,))
+        wallet = cursor.fetchone()
+        if wallet is None:
+            return None
+        cursor.execute('''
+            INSERT INTO ledger_accounts (name, wallet_id) VALUES (%s, %s)
+            ON CONFLICT (wallet_id) DO NOTHING
+            RETURNING id
+        ''', (f'wallet:{wallet_id}', wallet_id))
+        row = cursor.fetchone()
+        if row is None:
+            # Opened concurrently by another request
+            cursor.execute('SELECT id FROM ledger_accounts WHERE wallet_id = %s', (wallet_id,))
+            return cursor.fetchone()[0]
+
+        opening = to_units(wallet[0] or 0)
+        if opening:
+            self._post(cursor, 'opening_balance', [
+                (row[0], opening),
+                (self._system_account_id(cursor, OPENING_BALANCE_ACCOUNT), -opening)
+            ], reference=f'wallet:{wallet_id}')
+        return row[0]
+
+    def _post(self, cursor, kind: str, postings: Sequence[Tuple[int, int]], reference: str = None) -> int:
+        if sum(amount for _, amount in postings) != 0:
+            raise ValueError('Ledger postings must sum to zero')
+        cursor.execute(
+            'INSERT INTO ledger_transactions (kind, reference) VALUES (%s, %s) RETURNING id, created_at',
+            (kind, reference)
+        )
+        transaction_id, created_at = cursor.fetchone()
+        # Lock accounts in id order so concurrent transfers can't deadlock
+        for account_id, amount in sorted(postings):
+            cursor.execute('''
+                UPDATE ledger_accounts
+                SET balance = balance + %s, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+                RETURNING balance, allow_negative
+            ''', (amount, account_id))
+            balance, allow_negative = cursor.fetchone()
+            if balance < 0 and not allow_negative:
+                raise InsufficientFunds(f'Insufficient funds in account {account_id}')
+            cursor.execute('''
+                INSERT INTO ledger_entries (transaction_id, account_id, amount, balance_after, created_at)
+                VALUES (%s, %s, %s, %s, %s)
+            ''', (transaction_id, account_id, amount, balance, created_at))
+        return transaction_id
+
+    def _apply(self, kind: str, wallet_id: int, units: int, counter_account: str, reference: str = None):
+        conn = self.db.get_db_connection()
+        try:
+            cursor = conn.cursor()
+            account_id = self._wallet_account_id(cursor, wallet_id)
+            if account_id is None:
+                conn.rollback()
+                return None
+            transaction_id = self._post(cursor, kind, [
+                (account_id, units),
+                (self._system_account_id(cursor, counter_account), -units)
+            ], reference=reference)
+            cursor.execute('SELECT balance FROM ledger_accounts WHERE id = %s', (account_id,))
+            balance = cursor.fetchone()[0]
+            conn.commit()
+            self.db.replicas.mark_write()
+            return {'transaction_id': transaction_id, 'balance_units': balance}
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def deposit(self, wallet_id: int, amount, reference: str = None) -> Optional[Dict[str, Any]]:
+        """Credit a wallet. Returns the transaction id and new balance, or None if the wallet doesn't exist."""
+        return self._apply('deposit', wallet_id, to_units(amount), DEPOSITS_ACCOUNT, reference)
+
+    def withdraw(self, wallet_id: int, amount, reference: str = None) -> Optional[Dict[str, Any]]:
+        """Debit a wallet; raises InsufficientFunds if it would go negative."""
+        return self._apply('withdrawal', wallet_id, -to_units(amount), DEPOSITS_ACCOUNT, reference)
+
+    def transfer(self, from_wallet_id: int, to_wallet_id: int, amount, reference: str = None) -> Optional[int]:
+        units = to_units(amount)
+        conn = self.db.get_db_connection()
+        try:
+            cursor = conn.cursor()
+            source = self._wallet_account_id(cursor, from_wallet_id)
+            target = self._wallet_account_id(cursor, to_wallet_id)
+            if source is None or target is None:
+                conn.rollback()
+                return None
+            transaction_id = self._post(cursor, 'transfer', [(source, -units), (target, units)], reference)
+            conn.commit()
+            self.db.replicas.mark_write()
+            return transaction_id
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def get_balance_units(self, wallet_id: int) -> Optional[int]:
+        """O(1) balance read from the materialized account row."""
+        results = self.db.execute_query(
+            'SELECT balance FROM ledger_accounts WHERE wallet_id = %s', (wallet_id,)
+        )
+        if results:
+            return results[0]['balance']
+        # No ledger activity yet: fall back to the legacy column
+        wallet = self.db.execute_query('SELECT balance FROM wallets WHERE id = %s', (wallet_id,))
+        return to_units(wallet[0]['balance'] or 0) if wallet else None
+
+    def get_statement(self, wallet_id: int, limit: int = 50, before: Tuple[Any, int] = None) -> List[Dict[str, Any]]:
+        """
+        Newest-first page of a wallet's entries.
+
+        Pass the (created_at, id) of the last entry of a page as `before` to
+        fetch the next one.
+        """
+        query = '''
+            SELECT e.id, e.transaction_id, t.kind, t.reference, e.amount, e.balance_after, e.created_at
+            FROM ledger_entries e
+            JOIN ledger_accounts a ON a.id = e.account_id
+            JOIN ledger_transactions t ON t.id = e.transaction_id
+            WHERE a.wallet_id = %s
+        '''
+        params: tuple = (wallet_id,)
+        if before is not None:
+            query += ' AND (e.created_at, e.id) < (%s, %s)'
+            params += tuple(before)
+        query += ' ORDER BY e.created_at DESC, e.id DESC LIMIT %s'
+        params += (limit,)
+        return self.db.execute_query(query, params)
@@ -1,6 +1,8 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from database import Database
+from ledger import Ledger, from_units
+from blockmusic_common import request_metrics, sql_instrumentation
 import os
 import sqlite3
 
@@ -8,6 +10,11 @@ app = Flask(__name__)
 CORS(app)
 
 db = Database()
+db.replicas.init_app(app)
+sql_instrumentation.instrument_flask(app)
+request_metrics.instrument_flask(app)
+ledger = Ledger(db)
+ledger.create_tables()
 
 @app.route('/api/register', methods=['POST'])
 def register():
@@ -47,6 +54,7 @@ def get_wallet():
     
     wallet = db.get_user_wallet(int(user_id))
     if wallet:
+        wallet['balance'] = from_units(ledger.get_balance_units(wallet['id']))
         return jsonify(wallet)
     return jsonify({'error': 'Wallet not found'}), 404
 
@@ -64,10 +72,9 @@ def deposit():
         if amount <= 0:
             return jsonify({'error': 'Amount must be positive'}), 400
             
-        wallet = db.get_user_wallet(wallet_id)
-        if wallet:
-            new_balance = wallet['balance'] + amount
-            db.update_wallet_balance(wallet_id, new_balance)
+        result = ledger.deposit(int(wallet_id), amount)
+        if result:
+            new_balance = from_units(result['balance_units'])
             return jsonify({'message': 'Deposit successful', 'new_balance': new_balance})
         return jsonify({'error': 'Wallet not found'}), 404
     except ValueError:
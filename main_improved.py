@@ -1,6 +1,9 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from database import Database
+from ledger import Ledger, from_units
+from blockmusic_common.idempotency import IdempotencyStore, idempotent
+from blockmusic_common import request_metrics, sql_instrumentation
 import os
 import sqlite3
 import re
@@ -19,6 +22,16 @@ app = Flask(__name__)
 CORS(app, origins=os.getenv('ALLOWED_ORIGINS', '*').split(','))
 
 db = Database()
+db.replicas.init_app(app)
+sql_instrumentation.instrument_flask(app)
+request_metrics.instrument_flask(app)
+ledger = Ledger(db)
+ledger.create_tables()
+idempotency_store = IdempotencyStore(
+    db.get_db_connection,
+    ttl=int(os.getenv('IDEMPOTENCY_TTL', 24 * 3600))
+)
+idempotency_store.create_tables()
 
 # Input validation helpers
 def validate_email(email):
@@ -92,7 +105,8 @@ def health_check():
     return jsonify({
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
-        'version': '1.0.0'
+        'version': '1.0.0',
+        'database': db.replicas.status()
     }), 200
 
 @app.route('/api/register', methods=['POST'])
@@ -202,6 +216,8 @@ def get_wallet():
         wallet = db.get_user_wallet(user_id)
         
         if wallet:
+            # The ledger is the source of truth; wallets.balance is only the opening value
+            wallet['balance'] = from_units(ledger.get_balance_units(wallet['id']))
             return jsonify(wallet), 200
         
         return jsonify({'error': 'Wallet not found'}), 404
@@ -212,6 +228,8 @@ def get_wallet():
 
 @app.route('/api/wallet/deposit', methods=['POST'])
 @rate_limit(max_requests=20, window_seconds=60)
+# No user sessions on this backend: the wallet being credited is the caller
+@idempotent(idempotency_store, 'wallet_deposit', lambda: (request.get_json(silent=True) or {}).get('wallet_id'))
 def deposit():
     """Deposit funds to wallet"""
     try:
@@ -238,18 +256,18 @@ def deposit():
         if amount > 1000000:  # Sanity check
             return jsonify({'error': 'Amount too large'}), 400
         
-        wallet = db.get_user_wallet(wallet_id)
+        result = ledger.deposit(wallet_id, amount)
         
-        if wallet:
-            new_balance = wallet['balance'] + amount
-            db.update_wallet_balance(wallet_id, new_balance)
+        if result:
+            new_balance = from_units(result['balance_units'])
             
-            logger.info(f"Deposit successful: Wallet {wallet_id}, Amount {amount}")
+            logger.info(f"Deposit successful: Wallet {wallet_id}, Amount {amount}, Transaction {result['transaction_id']}")
             
             return jsonify({
                 'message': 'Deposit successful',
                 'new_balance': new_balance,
-                'amount_deposited': amount
+                'amount_deposited': amount,
+                'transaction_id': result['transaction_id']
             }), 200
         
         return jsonify({'error': 'Wallet not found'}), 404
@@ -258,6 +276,53 @@ def deposit():
         logger.error(f"Deposit error: {str(e)}", exc_info=True)
         return jsonify({'error': 'Deposit failed. Please try again later.'}), 500
 
+@app.route('/api/wallet/statement', methods=['GET'])
+def get_statement():
+    """Get a page of ledger entries for a wallet, newest first"""
+    try:
+        wallet_id = request.args.get('wallet_id')
+        
+        if not wallet_id:
+            return jsonify({'error': 'Wallet ID required'}), 400
+        
+        try:
+            wallet_id = int(wallet_id)
+            limit = max(1, min(int(request.args.get('limit', 50)), 200))
+            before = None
+            cursor = request.args.get('cursor')
+            if cursor:
+                created_at, entry_id = cursor.rsplit('|', 1)
+                before = (datetime.fromisoformat(created_at), int(entry_id))
+        except ValueError:
+            return jsonify({'error': 'Invalid wallet ID, limit or cursor'}), 400
+        
+        entries = ledger.get_statement(wallet_id, limit=limit, before=before)
+        next_cursor = None
+        if len(entries) == limit:
+            last = entries[-1]
+            next_cursor = f"{last['created_at'].isoformat()}|{last['id']}"
+        
+        return jsonify({
+            'wallet_id': wallet_id,
+            'entries': [
+                {
+                    'id': e['id'],
+                    'transaction_id': e['transaction_id'],
+                    'kind': e['kind'],
+                    'reference': e['reference'],
+                    'amount': from_units(e['amount']),
+                    'balance_after': from_units(e['balance_after']),
+                    'created_at': e['created_at'].isoformat()
+                }
+                for e in entries
+            ],
+            'next_cursor': next_cursor
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"Statement error: {str(e)}", exc_info=True)
+        return jsonify({'error': 'Failed to retrieve statement'}), 500
+
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
     """Get platform statistics"""